@@ -3,10 +3,10 @@ import pprint
 
 import clex
 import ply.yacc as yacc
+import ply.cache as cache
 
 import preprocess
-from preprocess import remove_blank
-from preprocess import remove_comment
+from preprocess import input_stripped
 
 pp = pprint.PrettyPrinter(indent=4, width=120)
 
@@ -22,7 +22,8 @@ def p_program_1(t):
 
 def p_program_2(t):
     'program : program external_declaration'
-    t[0] = t[1] + [t[2]]
+    t[1].append(t[2])
+    t[0] = t[1]
     return t[0]
 
 # external-declaration:
@@ -77,7 +78,8 @@ def p_declaration_list_1(t):
 
 def p_declaration_list_2(t):
     'declaration_list : declaration_list declaration '
-    t[0] = t[1] + [t[2]]
+    t[1].append(t[2])
+    t[0] = t[1]
 
 
 # type-specifier:
@@ -97,7 +99,8 @@ def p_declarator_list_1(t):
 
 def p_declarator_list_2(t):
     'declarator_list : declarator_list COMMA declarator'
-    t[0] = t[1] + [t[3]]
+    t[1].append(t[3])
+    t[0] = t[1]
 
 # init-declarator
 
@@ -133,7 +136,8 @@ def p_parameter_list_1(t):
 
 def p_parameter_list_2(t):
     'parameter_list : parameter_list COMMA parameter_declaration'
-    t[0] = t[1] + [t[3]]
+    t[1].append(t[3])
+    t[0] = t[1]
 
 # parameter-declaration:
 def p_parameter_declaration(t):
@@ -183,7 +187,8 @@ def p_instruction_list_1(t):
 
 def p_instruction_list_2(t):
     'instruction_list : instruction_list instruction'
-    t[0] = t[1] + [t[2]]
+    t[1].append(t[2])
+    t[0] = t[1]
 
 # selection-instruction
 
@@ -363,7 +368,8 @@ def p_argument_expression_list_1(t):
 
 def p_argument_expression_list_2(t):
     '''argument_expression_list : argument_expression_list COMMA expression'''
-    t[0] = t[1] + [t[3]]
+    t[1].append(t[3])
+    t[0] = t[1]
 
 # constant:
 def p_constant(t): 
@@ -390,9 +396,22 @@ def p_error(t):
 
 
 
-parser = yacc.yacc(method='LALR')
+_parser = None
+
+def get_parser():
+    """
+    Return the parser, reading its tables from the cache on the first call.
+    """
+    global _parser
+    if _parser is None:
+        clex.get_lexer()        # The default lexer of parser.parse()
+        _parser = yacc.yacc(method='LALR', parsermodule='parsegen', cachedir=cache.CACHE_DIR)
+    return _parser
+
+parser = cache.Lazy(get_parser)
 
 if __name__ == '__main__':
     s = sys.stdin.read()
-    s = remove_blank(remove_comment(s))
-    pp.pprint(parser.parse(s))
+    lexer = clex.lexer.clone()
+    s = input_stripped(lexer, s)
+    pp.pprint(parser.parse(lexer=lexer))
@@ -2,8 +2,11 @@ import sys
 import pprint
 
 import ply.yacc as yacc
+import clex
 import cparse
 
+from preprocess import parse_includes
+
 from uuid import uuid4
 
 pp = pprint.PrettyPrinter(indent=4, width=120)
@@ -11,21 +14,22 @@ pp = pprint.PrettyPrinter(indent=4, width=120)
 parser = cparse.parser
 
 def insert_sym(syms, st, s, val):
-    if s not in syms:
-        syms[s] = {}
+    # syms is keyed on the identifier id that clex assigned to s
+    if s.id not in syms:
+        syms[s.id] = {}
 
     key = '$'.join(map(str, st)) if st else 'global'
 
-    if key in syms[s]:
-        raise ValueError('symbols conflit. %s %s' %(key, str(syms[s][key])))
+    if key in syms[s.id]:
+        raise ValueError('symbols conflit. %s %s' %(key, str(syms[s.id][key])))
 
-    syms[s][key] = val
+    syms[s.id][key] = val
 
     return syms
 
 def print_syms(syms):
-    for s, d in syms.items():
-        print s,
+    for i, d in syms.items():
+        print clex.names[i],
         for scope, val in d.items():
             print '\t%-20s %-20s' %(str(val), scope)
 
@@ -103,7 +107,7 @@ def parse_statement(root, st, syms):
         pass
     
 if __name__ == '__main__':
-    ast = parser.parse(sys.stdin.read())
+    ast = parse_includes(sys.stdin.read(), parser)
 
     st = []
     syms = {}
@@ -0,0 +1,475 @@
+# -----------------------------------------------------------------------------
+# ply: dfa.py
+#
+# A table-driven backend for lexers built by lex.lex().
+#
+# The regular expression rules of a lexer are compiled ahead of time into a
+# single deterministic finite automaton.  Tokens are then recognized by a tight
+# loop over integer tables instead of trying each master regular expression in
+# turn with re.match().  Matching follows the usual longest-match ("maximal
+# munch") rule; when two rules match the same text, the rule that comes first
+# in the master regular expression wins, as it does in Lexer.token().
+#
+# Non-greedy repetitions such as the body of a /* ... */ comment end at the
+# first point where their rule matches, which is how Python's re module treats
+# them for the patterns used by lexers.
+#
+# Only the regular subset of the re syntax is supported (literals, character
+# classes, '.', groups, alternation and repetition).  All non-ASCII characters
+# fall into a single input class that is matched only by '.' and by negated
+# character classes.
+# -----------------------------------------------------------------------------
+
+import copy
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+from .lex import Lexer, LexToken, LexError
+
+# Input symbols are 7-bit character codes plus one class for everything else
+NONASCII = 128
+ALPHABET = frozenset(range(NONASCII + 1))
+
+# Number of bytes of a buffer input classified at a time
+_CHUNKSIZE = 1 << 16
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: frozenset(range(ord('0'), ord('9') + 1)),
+    sre_constants.CATEGORY_SPACE: frozenset(map(ord, ' \t\n\r\f\v')),
+    sre_constants.CATEGORY_WORD:  frozenset(list(range(ord('a'), ord('z') + 1)) +
+                                            list(range(ord('A'), ord('Z') + 1)) +
+                                            list(range(ord('0'), ord('9') + 1)) + [ord('_')]),
+}
+_CATEGORIES[sre_constants.CATEGORY_NOT_DIGIT] = ALPHABET - _CATEGORIES[sre_constants.CATEGORY_DIGIT]
+_CATEGORIES[sre_constants.CATEGORY_NOT_SPACE] = ALPHABET - _CATEGORIES[sre_constants.CATEGORY_SPACE]
+_CATEGORIES[sre_constants.CATEGORY_NOT_WORD] = ALPHABET - _CATEGORIES[sre_constants.CATEGORY_WORD]
+
+def _symbol(code):
+    return code if code < NONASCII else NONASCII
+
+# -----------------------------------------------------------------------------
+# _NFA
+#
+# Thompson construction of a nondeterministic automaton from the parse trees
+# produced by sre_parse.  Each state records the rule it belongs to so that
+# the subset construction can cut off non-greedy rules once they match.
+# -----------------------------------------------------------------------------
+class _NFA(object):
+    def __init__(self):
+        self.eps = []          # Epsilon transitions of each state
+        self.edges = []        # List of (symbol set, target) for each state
+        self.owner = []        # Rule index owning each state
+        self.accept = {}       # Accepting state -> rule index
+        self.lazy = set()      # Rules containing non-greedy repetitions
+        self.start = self.new(-1)
+
+    def new(self, rule):
+        self.eps.append([])
+        self.edges.append([])
+        self.owner.append(rule)
+        return len(self.owner) - 1
+
+    def add_rule(self, rule, tree):
+        s, e = self.sequence(tree, rule)
+        self.eps[self.start].append(s)
+        self.accept[e] = rule
+
+    def sequence(self, items, rule):
+        start = cur = self.new(rule)
+        for op, av in items:
+            s, e = self.node(op, av, rule)
+            self.eps[cur].append(s)
+            cur = e
+        return start, cur
+
+    def charset(self, symbols, rule):
+        s = self.new(rule)
+        e = self.new(rule)
+        self.edges[s].append((frozenset(symbols), e))
+        return s, e
+
+    def node(self, op, av, rule):
+        if op is sre_constants.LITERAL:
+            return self.charset([_symbol(av)], rule)
+        elif op is sre_constants.NOT_LITERAL:
+            return self.charset(ALPHABET - set([_symbol(av)]), rule)
+        elif op is sre_constants.ANY:
+            return self.charset(ALPHABET - set([ord('\n')]), rule)
+        elif op is sre_constants.IN:
+            return self.charset(self.members(av), rule)
+        elif op is sre_constants.BRANCH:
+            s = self.new(rule)
+            e = self.new(rule)
+            for alt in av[1]:
+                a, b = self.sequence(alt, rule)
+                self.eps[s].append(a)
+                self.eps[b].append(e)
+            return s, e
+        elif op is sre_constants.SUBPATTERN:
+            return self.sequence(av[-1], rule)
+        elif op is sre_constants.MAX_REPEAT or op is sre_constants.MIN_REPEAT:
+            if op is sre_constants.MIN_REPEAT:
+                self.lazy.add(rule)
+            lo, hi, item = av
+            s = cur = self.new(rule)
+            for i in range(lo):
+                a, b = self.sequence(item, rule)
+                self.eps[cur].append(a)
+                cur = b
+            e = self.new(rule)
+            if hi == sre_constants.MAXREPEAT:
+                a, b = self.sequence(item, rule)
+                self.eps[cur].extend([a, e])
+                self.eps[b].extend([a, e])
+            else:
+                for i in range(hi - lo):
+                    a, b = self.sequence(item, rule)
+                    self.eps[cur].extend([a, e])
+                    cur = b
+                self.eps[cur].append(e)
+            return s, e
+        raise ValueError('Unsupported regular expression construct %r' % (op,))
+
+    def members(self, items):
+        result = set()
+        negate = False
+        for op, av in items:
+            if op is sre_constants.NEGATE:
+                negate = True
+            elif op is sre_constants.LITERAL:
+                result.add(_symbol(av))
+            elif op is sre_constants.RANGE:
+                lo, hi = av
+                result.update(_symbol(c) for c in range(lo, min(hi, NONASCII) + 1))
+                if hi >= NONASCII:
+                    result.add(NONASCII)
+            elif op is sre_constants.CATEGORY and av in _CATEGORIES:
+                result.update(_CATEGORIES[av])
+            else:
+                raise ValueError('Unsupported character class item %r' % (op,))
+        if negate:
+            return ALPHABET - result
+        return result
+
+    def closure(self, states):
+        result = set(states)
+        stack = list(states)
+        while stack:
+            for t in self.eps[stack.pop()]:
+                if t not in result:
+                    result.add(t)
+                    stack.append(t)
+        # A non-greedy rule stops as soon as it reaches its accepting state
+        for s in list(result):
+            rule = self.accept.get(s)
+            if rule in self.lazy:
+                result = set(t for t in result if self.owner[t] != rule or t == s)
+        return frozenset(result)
+
+# -----------------------------------------------------------------------------
+# DFATables
+#
+# The compiled automaton for all lexer states.  Input characters are mapped to
+# a small number of equivalence classes once per input string; the automaton
+# for each lexer state is then a list of rows indexed by class.  State 0 is the
+# dead state and state 1 is the start state.
+# -----------------------------------------------------------------------------
+class DFATables(object):
+    def __init__(self, lexer):
+        nfas = {}
+        for state, lre in lexer.lexstatere.items():
+            nfas[state] = self.build_nfa(lre)
+
+        # Partition the alphabet into classes of characters that no rule tells apart
+        sets = set()
+        for nfa, actions in nfas.values():
+            for edges in nfa.edges:
+                for symbols, target in edges:
+                    sets.add(symbols)
+        sets = list(sets)
+        signatures = {}
+        self.classmap = []
+        for c in range(NONASCII + 1):
+            sig = tuple(c in s for s in sets)
+            self.classmap.append(signatures.setdefault(sig, len(signatures)))
+        self.nclasses = len(signatures)
+        if self.nclasses > 256:
+            raise ValueError('Too many character classes for the DFA lexer')
+
+        self.states = {}
+        for state, (nfa, actions) in nfas.items():
+            trans, accept = self.build_dfa(nfa)
+            self.states[state] = (trans, accept, actions)
+
+        self._bytemap = bytes(bytearray([self.classmap[min(b, NONASCII)] for b in range(256)]))
+        self._charmap = _ClassMap(self.classmap)
+
+    def build_nfa(self, lre):
+        nfa = _NFA()
+        actions = []
+        for cre, findex in lre:
+            tree = sre_parse.parse(cre.pattern, cre.flags)
+            items = list(tree)
+            if len(items) == 1 and items[0][0] is sre_constants.BRANCH:
+                alternatives = items[0][1][1]
+            else:
+                alternatives = [items]
+            for alt in alternatives:
+                alt = list(alt)
+                if len(alt) != 1 or alt[0][0] is not sre_constants.SUBPATTERN:
+                    raise ValueError('Malformed master regular expression')
+                group = alt[0][1][0]
+                if not findex[group]:
+                    continue
+                nfa.add_rule(len(actions), alt[0][1][-1])
+                actions.append(findex[group])
+        return nfa, actions
+
+    def build_dfa(self, nfa):
+        classes = []
+        for edges in nfa.edges:
+            classes.append([(frozenset(self.classmap[c] for c in symbols), target)
+                            for symbols, target in edges])
+
+        dead = frozenset()
+        start = nfa.closure([nfa.start])
+        index = {dead: 0, start: 1}
+        pending = [start]
+        trans = [[0] * self.nclasses]
+        accept = [-1]
+        while pending:
+            current = pending.pop(0)
+            row = [0] * self.nclasses
+            rules = [nfa.accept[s] for s in current if s in nfa.accept]
+            accept.append(min(rules) if rules else -1)
+            for cls in range(self.nclasses):
+                moved = [t for s in current for symbols, t in classes[s] if cls in symbols]
+                if not moved:
+                    continue
+                target = nfa.closure(moved)
+                if target not in index:
+                    index[target] = len(index)
+                    pending.append(target)
+                row[cls] = index[target]
+            trans.append(row)
+        return trans, accept
+
+    # Map an input string to a bytearray of character classes
+    def classify(self, s):
+        if isinstance(s, bytes):
+            return bytearray(s.translate(self._bytemap))
+        if not hasattr(s, 'translate'):
+            # A buffer such as an mmap.  Translate it a slice at a time so that
+            # the whole input is never copied into a single string.
+            codes = bytearray()
+            for i in range(0, len(s), _CHUNKSIZE):
+                codes.extend(s[i:i+_CHUNKSIZE].translate(self._bytemap))
+            return codes
+        return bytearray(s.translate(self._charmap), 'latin-1')
+
+class _ClassMap(dict):
+    def __init__(self, classmap):
+        dict.__init__(self, enumerate(classmap))
+        self.other = classmap[NONASCII]
+
+    def __missing__(self, key):
+        return self.other
+
+# -----------------------------------------------------------------------------
+# DFALexer
+#
+# A Lexer whose token() method runs the compiled automaton.  Rule functions,
+# ignored characters, literals, t_error() and t_eof() behave exactly as they do
+# for Lexer, except that lexer.lexmatch is not available inside rule functions.
+#
+# Since the automaton can tell when a token might continue past the end of the
+# input, a DFALexer can also lex a stream of text chunks (see stream()).
+# -----------------------------------------------------------------------------
+class DFALexer(Lexer):
+    def __init__(self):
+        Lexer.__init__(self)
+        self.lexdfatables = None      # Compiled automata for every lexer state
+        self.lexdfa = None            # (transitions, accepting rules, actions) of current state
+        self.lexcodes = None          # Character classes of the input string
+        self.lexmore = False          # More input follows the current string
+
+    def input(self, s):
+        Lexer.input(self, s)
+        self.lexcodes = self.lexdfatables.classify(s)
+
+    def begin(self, state):
+        Lexer.begin(self, state)
+        self.lexdfa = self.lexdfatables.states[state]
+
+    def token(self):
+        # Make local copies of frequently referenced attributes
+        lexpos    = self.lexpos
+        lexlen    = self.lexlen
+        lexignore = self.lexignore
+        lexdata   = self.lexdata
+        codes     = self.lexcodes
+        trans, accept, actions = self.lexdfa
+
+        while lexpos < lexlen:
+            if lexdata[lexpos] in lexignore:
+                lexpos += 1
+                continue
+
+            # Run the automaton, remembering the last accepting position
+            state = 1
+            pos = lexpos
+            rule = -1
+            end = lexpos
+            while pos < lexlen:
+                state = trans[state][codes[pos]]
+                if not state:
+                    break
+                pos += 1
+                if accept[state] >= 0:
+                    rule = accept[state]
+                    end = pos
+
+            # The token may go on in the next chunk of a stream
+            if pos == lexlen and state and self.lexmore:
+                self.lexpos = lexpos
+                return None
+
+            if rule >= 0:
+                func, toktype = actions[rule]
+                tok = LexToken()
+                tok.value = lexdata[lexpos:end]
+                tok.lineno = self.lineno
+                tok.lexpos = lexpos
+                tok.type = toktype
+
+                if not func:
+                    if toktype:
+                        self.lexpos = end
+                        return tok
+                    lexpos = end
+                    continue
+
+                lexpos = end
+                tok.lexer = self
+                self.lexmatch = None
+                self.lexpos = lexpos
+
+                newtok = func(tok)
+
+                if not newtok:
+                    lexpos    = self.lexpos
+                    lexignore = self.lexignore
+                    trans, accept, actions = self.lexdfa
+                    continue
+
+                if not self.lexoptimize:
+                    if newtok.type not in self.lextokens_all:
+                        raise LexError("%s:%d: Rule '%s' returned an unknown token type '%s'" % (
+                            func.__code__.co_filename, func.__code__.co_firstlineno,
+                            func.__name__, newtok.type), lexdata[lexpos:])
+
+                return newtok
+
+            # No match, see if in literals
+            if lexdata[lexpos] in self.lexliterals:
+                tok = LexToken()
+                tok.value = lexdata[lexpos]
+                tok.lineno = self.lineno
+                tok.type = tok.value
+                tok.lexpos = lexpos
+                self.lexpos = lexpos + 1
+                return tok
+
+            # No match. Call t_error() if defined.
+            if self.lexerrorf:
+                tok = LexToken()
+                tok.value = self.lexdata[lexpos:]
+                tok.lineno = self.lineno
+                tok.type = 'error'
+                tok.lexer = self
+                tok.lexpos = lexpos
+                self.lexpos = lexpos
+                newtok = self.lexerrorf(tok)
+                if lexpos == self.lexpos:
+                    raise LexError("Scanning error. Illegal character '%s'" % (lexdata[lexpos]), lexdata[lexpos:])
+                lexpos = self.lexpos
+                trans, accept, actions = self.lexdfa
+                if not newtok:
+                    continue
+                return newtok
+
+            self.lexpos = lexpos
+            raise LexError("Illegal character '%s' at index %d" % (lexdata[lexpos], lexpos), lexdata[lexpos:])
+
+        if self.lexeoff and not self.lexmore:
+            tok = LexToken()
+            tok.type = 'eof'
+            tok.value = ''
+            tok.lineno = self.lineno
+            tok.lexpos = lexpos
+            tok.lexer = self
+            self.lexpos = lexpos
+            newtok = self.lexeoff(tok)
+            return newtok
+
+        self.lexpos = lexpos + 1
+        if self.lexdata is None:
+            raise RuntimeError('No input string given with input()')
+        return None
+
+    # ------------------------------------------------------------
+    # stream() - Generate the tokens of an iterable of text chunks
+    #
+    # Tokens may span chunk boundaries.  Only the text of the token in
+    # progress is carried over from one chunk to the next, so memory stays
+    # bounded by the chunk size plus the longest token.  The lexpos of the
+    # generated tokens counts from the start of the stream; inside rule
+    # functions, lexpos and lexdata refer to the current chunk.
+    # ------------------------------------------------------------
+    def stream(self, chunks):
+        base = 0
+        pending = ''
+        self.lexmore = True
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                self.input(pending + chunk if pending else chunk)
+                for tok in self._drain(base):
+                    yield tok
+                consumed = min(self.lexpos, self.lexlen)
+                pending = self.lexdata[consumed:]
+                base += consumed
+        finally:
+            self.lexmore = False
+        self.input(pending)
+        for tok in self._drain(base):
+            yield tok
+
+    def _drain(self, base):
+        token = self.token
+        while True:
+            tok = token()
+            if not tok:
+                return
+            tok.lexpos += base
+            yield tok
+
+# -----------------------------------------------------------------------------
+# build(lexer)
+#
+# Compile the rules of an existing lexer and return a DFALexer that shares its
+# rule functions, ignore sets and error handlers.
+# -----------------------------------------------------------------------------
+def build(lexer):
+    dfalexer = DFALexer()
+    dfalexer.__dict__.update(copy.copy(lexer.__dict__))
+    dfalexer.lexdfatables = DFATables(lexer)
+    dfalexer.lexcodes = None
+    dfalexer.begin(lexer.lexstate)
+    return dfalexer
@@ -62,10 +62,14 @@
 import re
 import types
 import sys
+import time
 import os.path
-import inspect
 import base64
 import warnings
+from array import array
+
+from .lex import LexToken, TokenArrays
+from . import cache
 
 __version__    = '3.7'
 __tabversion__ = '3.5'
@@ -213,8 +217,13 @@ def call_errorfunc(errorfunc, token, parser):
 #        .endlineno  = Ending line number (optional, set automatically)
 #        .lexpos     = Starting lex position
 #        .endlexpos  = Ending lex position (optional, set automatically)
+#
+# One is created for every reduction, so it uses __slots__ instead of an
+# instance dict.
+
+class YaccSymbol(object):
+    __slots__ = ('type', 'value', 'lineno', 'endlineno', 'lexpos', 'endlexpos')
 
-class YaccSymbol:
     def __str__(self):
         return self.type
 
@@ -230,7 +239,9 @@ class YaccSymbol:
 # for a symbol.  The lexspan() method returns a tuple (lexpos,endlexpos)
 # representing the range of positional information for a symbol.
 
-class YaccProduction:
+class YaccProduction(object):
+    __slots__ = ('slice', 'stack', 'lexer', 'parser')
+
     def __init__(self, s, stack=None):
         self.slice = s
         self.stack = stack
@@ -273,9 +284,196 @@ class YaccProduction:
         endpos = getattr(self.slice[n], 'endlexpos', startpos)
         return startpos, endpos
 
+    # Line and column of symbol n, computed from its lexpos with the line
+    # index of the lexer.  Nonterminals only have a lexpos when tracking;
+    # for them and for symbols without one it raises ValueError.
+    def position(self, n):
+        lexpos = self._lexpos(n)
+        if lexpos is None:
+            raise ValueError('Symbol %d of the rule has no position' % n)
+        return self.lexer.lineindex().position(lexpos)
+
+    def _lexpos(self, n):
+        return getattr(self.slice[n], 'lexpos', None)
+
     def error(self):
         raise SyntaxError
 
+# This class is passed to grammar rules when parsing from TokenArrays or with
+# a generated parser module.  The parser keeps plain values on its stack
+# rather than YaccSymbol objects, so the slice and stack hold values
+# directly.  The lexpos of each terminal is kept on a stack of its own,
+# positions, in which the symbols of the rule are still on top while its
+# function runs.  Nonterminals have no position there (None) and terminals
+# no line number.
+
+class YaccValueProduction(YaccProduction):
+    __slots__ = ('positions',)
+
+    def __getitem__(self, n):
+        if isinstance(n, slice) or n >= 0:
+            return self.slice[n]
+        else:
+            return self.stack[n]
+
+    def __setitem__(self, n, v):
+        self.slice[n] = v
+
+    def __getslice__(self, i, j):
+        return self.slice[i:j]
+
+    def lineno(self, n):
+        return 0
+
+    def set_lineno(self, n, lineno):
+        pass
+
+    def linespan(self, n):
+        return 0, 0
+
+    def _lexpos(self, n):
+        if n > 0:
+            return self.positions[n - len(self.slice)]
+        elif n < 0:
+            return self.positions[n]
+        return None
+
+    def lexpos(self, n):
+        return self._lexpos(n) or 0
+
+    def lexspan(self, n):
+        lexpos = self._lexpos(n) or 0
+        return lexpos, lexpos
+
+# -----------------------------------------------------------------------------
+#                               == PackedTables ==
+#
+# The action and goto tables in integer arrays.  Terminals and nonterminals
+# are numbered and each state's row is stored in a shared table at a
+# displacement from the start (row displacement, or comb vector, packing).
+# The rows are placed first-fit, the densest first, so that the entries of a
+# row fill the gaps between those of the rows placed before it.  An entry
+# for state s and symbol number n is at table[base[s] + n] if check at that
+# index is s; otherwise the state has no entry for the symbol.
+# -----------------------------------------------------------------------------
+
+def pack_rows(rows, nstates, width):
+    base = array('i', [0] * nstates)
+    table = array('i')
+    check = array('i')
+    free = 0                    # Every index below free is taken
+    for state in sorted(rows, key=lambda s: (-len(rows[s]), s)):
+        row = rows[state]
+        if not row:
+            continue
+        cols = sorted(row)
+        while free < len(check) and check[free] >= 0:
+            free += 1
+        b = max(0, free - cols[0])
+        size = len(check)
+        while True:
+            for c in cols:
+                if b + c < size and check[b + c] >= 0:
+                    break
+            else:
+                break
+            b += 1
+        if b + width > len(check):
+            grow = b + width - len(check)
+            table.extend([0] * grow)
+            check.extend([-1] * grow)
+        for c in cols:
+            table[b + c] = row[c]
+            check[b + c] = state
+        base[state] = b
+    if not check:
+        table.extend([0] * width)
+        check.extend([-1] * width)
+    return base, table, check
+
+# The arrays that pack_rows() builds, which can be saved and passed back to
+# PackedTables instead of packing the rows again
+PACKED_ARRAYS = ('action_base', 'action_table', 'action_check', 'goto_base', 'goto_table', 'goto_check')
+
+class PackedTables(object):
+    def __init__(self, action, goto, productions, defaulted_states, arrays=None):
+        nstates = max(action) + 1 if action else 0
+        self.terminals = sorted(set(sym for row in action.values() for sym in row))
+        self.termids = dict((sym, n) for n, sym in enumerate(self.terminals))
+        self.nonterminals = sorted(set(sym for row in goto.values() for sym in row))
+        self.nontermids = dict((sym, n) for n, sym in enumerate(self.nonterminals))
+
+        # The column after the last terminal has no entries, for token types
+        # that are not in the grammar.
+        self.unknown = len(self.terminals)
+        if arrays:
+            for name in PACKED_ARRAYS:
+                setattr(self, name, array('i', arrays[name]))
+        else:
+            rows = dict((s, dict((self.termids[sym], v) for sym, v in row.items())) for s, row in action.items())
+            self.action_base, self.action_table, self.action_check = pack_rows(rows, nstates, self.unknown + 1)
+            rows = dict((s, dict((self.nontermids[sym], v) for sym, v in row.items())) for s, row in goto.items())
+            self.goto_base, self.goto_table, self.goto_check = pack_rows(rows, nstates, len(self.nonterminals))
+
+        # Per production, the number of its left-hand side
+        self.lhs = array('i', [self.nontermids.get(p.name, -1) for p in productions])
+        # Per state, the reduction it makes without a lookahead, or 0
+        self.defaults = array('i', [defaulted_states.get(s, 0) for s in range(nstates)])
+
+    def action(self, state, sym):
+        i = self.action_base[state] + self.termids.get(sym, self.unknown)
+        if self.action_check[i] == state:
+            return self.action_table[i]
+        return None
+
+    def goto(self, state, sym):
+        i = self.goto_base[state] + self.nontermids[sym]
+        if self.goto_check[i] == state:
+            return self.goto_table[i]
+        return None
+
+# -----------------------------------------------------------------------------
+#                               == ParseProfile ==
+#
+# Counts gathered by LRParser.parse(profile=...): per production, the number
+# of reductions by it and the time spent in its grammar function, and per
+# state, the number of actions taken in it.  A profile adds up the parses it
+# is passed to, which must be made by the parser it was created for.
+# -----------------------------------------------------------------------------
+
+class ParseProfile(object):
+    def __init__(self, parser, timer=time.time):
+        self.productions = parser.productions
+        self.timer = timer
+        self.reductions = [0] * len(self.productions)
+        self.times = [0.0] * len(self.productions)
+        self.states = [0] * (max(parser.action) + 1)
+        self.parses = 0
+        self.tokens = 0
+        self.time = 0.0
+
+    def report(self):
+        """
+        Return the counts as a dict of lists and numbers, with the
+        productions by decreasing time and the states by decreasing count.
+        """
+        productions = [{'rule': str(p), 'function': p.func, 'reductions': self.reductions[n],
+                        'time': self.times[n]}
+                       for n, p in enumerate(self.productions) if self.reductions[n]]
+        productions.sort(key=lambda p: (-p['time'], p['rule']))
+        states = [{'state': s, 'actions': n} for s, n in enumerate(self.states) if n]
+        states.sort(key=lambda s: (-s['actions'], s['state']))
+        return {'parses': self.parses, 'tokens': self.tokens, 'time': self.time,
+                'reductions': sum(self.reductions), 'action_time': sum(self.times),
+                'productions': productions, 'states': states}
+
+    def dump(self, f):
+        """
+        Write report() to the file f as JSON.
+        """
+        import json
+        json.dump(self.report(), f, indent=1, separators=(',', ': '), sort_keys=True)
+
 # -----------------------------------------------------------------------------
 #                               == LRParser ==
 #
@@ -290,6 +488,9 @@ class LRParser:
         self.errorfunc = errorf
         self.set_defaulted_states()
         self.errorok = True
+        self.packed = None
+        self.generated = None                    # Module written by write_parser_module()
+        self.entry_symbols = None                # Symbol shifted into each state
 
     def errok(self):
         self.errorok = True
@@ -316,17 +517,38 @@ class LRParser:
             rules = list(actions.values())
             if len(rules) == 1 and rules[0] < 0:
                 self.defaulted_states[state] = rules[0]
+        self.packed = None
 
     def disable_defaulted_states(self):
         self.defaulted_states = {}
-
-    def parse(self, input=None, lexer=None, debug=False, tracking=False, tokenfunc=None):
-        if debug or yaccdevel:
+        self.packed = None
+
+    # The tables as PackedTables, built on first use or taken from the
+    # generated parser module
+    def packed_tables(self):
+        if self.packed is None:
+            self.packed = PackedTables(self.action, self.goto, self.productions, self.defaulted_states,
+                                       getattr(self.generated, '_packed', None))
+        return self.packed
+
+    def parse(self, input=None, lexer=None, debug=False, tracking=False, tokenfunc=None, profile=None):
+        if isinstance(input, TokenArrays):
+            if not (debug or yaccdevel or tracking or profile):
+                return self.parsearrays(input, lexer)
+            lexer = lexer or input.lexer
+            tokenfunc = input.feed()
+            input = None
+
+        if profile:
+            return self.parseprofile(profile, input, lexer, tokenfunc)
+        elif debug or yaccdevel:
             if isinstance(debug, int):
                 debug = PlyLogger(sys.stderr)
             return self.parsedebug(input, lexer, debug, tracking, tokenfunc)
         elif tracking:
             return self.parseopt(input, lexer, debug, tracking, tokenfunc)
+        elif self.generated:
+            return self.parsegenerated(input, lexer, tokenfunc)
         else:
             return self.parseopt_notrack(input, lexer, debug, tracking, tokenfunc)
 
@@ -986,7 +1208,7 @@ class LRParser:
     # by the ply/ygen.py script. Make changes to the parsedebug() method instead.
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
-    def parseopt_notrack(self, input=None, lexer=None, debug=False, tracking=False, tokenfunc=None):
+    def parseopt_notrack(self, input=None, lexer=None, debug=False, tracking=False, tokenfunc=None, resume=None):
         #--! parseopt-notrack-start
         lookahead = None                         # Current lookahead symbol
         lookaheadstack = []                      # Stack of lookahead symbols
@@ -996,6 +1218,7 @@ class LRParser:
         defaulted_states = self.defaulted_states # Local reference to defaulted states
         pslice  = YaccProduction(None)           # Production object passed to grammar rules
         errorcount = 0                           # Used during error recovery
+        symfree = []                             # Reduced YaccSymbols available for reuse
 
 
         # If no lexer was given, we will try to use the lex module
@@ -1030,13 +1253,20 @@ class LRParser:
         pslice.stack = symstack         # Put in the production
         errtoken   = None               # Err token
 
-        # The start state is assumed to be (0,$end)
+        # The start state is assumed to be (0,$end), unless the stacks and
+        # lookahead of a parse stopped at a syntax error are given (see
+        # LRParser.resume())
 
-        statestack.append(0)
-        sym = YaccSymbol()
-        sym.type = '$end'
-        symstack.append(sym)
-        state = 0
+        if resume is None:
+            statestack.append(0)
+            sym = YaccSymbol()
+            sym.type = '$end'
+            symstack.append(sym)
+        else:
+            states, symbols, lookahead = resume
+            statestack.extend(states)
+            symstack.extend(symbols)
+        state = statestack[-1]
         while True:
             # Get the next symbol on the input.  If a lookahead symbol
             # is already set, we just use that. Otherwise, we'll pull
@@ -1081,8 +1311,12 @@ class LRParser:
                     pname = p.name
                     plen  = p.len
 
-                    # Get production function
-                    sym = YaccSymbol()
+                    # Get production function.  Nonterminal symbols popped by
+                    # earlier reductions are reused instead of allocating new ones.
+                    if symfree:
+                        sym = symfree.pop()
+                    else:
+                        sym = YaccSymbol()
                     sym.type = pname       # Production name
                     sym.value = None
 
@@ -1107,6 +1341,12 @@ class LRParser:
                             symstack.append(sym)
                             state = goto[statestack[-1]][pname]
                             statestack.append(state)
+                            # Error symbols keep the position of their token
+                            # and are not reused
+                            for child in targ[1:]:
+                                if child.__class__ is YaccSymbol and child.type != 'error':
+                                    child.value = None
+                                    symfree.append(child)
                         except SyntaxError:
                             # If an error was set. Enter error recovery state
                             lookaheadstack.append(lookahead)
@@ -1254,6 +1494,503 @@ class LRParser:
 
         #--! parseopt-notrack-end
 
+    # -------------------------------------------------------------------------
+    # parsearrays().
+    #
+    # Parse tokens stored in a TokenArrays object without creating a token or
+    # symbol object per token.  The value stack holds plain values and token
+    # values are sliced out of the input only when they are shifted.  Token
+    # types are numbered once per input and looked up in the PackedTables.
+    #
+    # This fast path does not implement error recovery.  On the first syntax
+    # error, the parse goes on in parseopt_notrack() from the stacks it has
+    # built (see resume()), with tokens materialized from the arrays, so
+    # p_error() and error rules behave as usual.
+    # -------------------------------------------------------------------------
+
+    def parsearrays(self, tokens, lexer=None):
+        # Indexing a list is faster than indexing an array, which creates an
+        # int object for each item read, so the loop works on list copies.
+        packed  = self.packed_tables()
+        abase   = packed.action_base.tolist()
+        atable  = packed.action_table.tolist()
+        acheck  = packed.action_check.tolist()
+        gbase   = packed.goto_base.tolist()
+        gtable  = packed.goto_table.tolist()
+        lhs     = packed.lhs.tolist()
+        defaults = packed.defaults.tolist()
+        prod    = self.productions
+        pslice  = YaccValueProduction(None)
+
+        if not lexer:
+            lexer = tokens.lexer
+        pslice.lexer = lexer
+        pslice.parser = self
+
+        types   = tokens.types
+        typeids = tokens.typeids
+        starts  = tokens.starts
+        lengths = tokens.lengths
+        values  = tokens.values
+        lexdata = tokens.lexdata
+        ntokens = len(typeids)
+
+        # Terminal number of each token type of the arrays
+        symids  = [packed.termids.get(t, packed.unknown) for t in types]
+        endid   = packed.termids['$end']
+
+        statestack = [0]
+        valstack   = [None]
+        posstack   = [None]
+        pslice.stack = valstack
+        pslice.positions = posstack
+        state = 0
+        index = 0
+        sym = -1
+
+        while True:
+            t = defaults[state]
+            if not t:
+                if sym < 0:
+                    if index < ntokens:
+                        sym = symids[typeids[index]]
+                    else:
+                        sym = endid
+                i = abase[state] + sym
+                if acheck[i] != state:
+                    break
+                t = atable[i]
+
+            if t > 0:
+                # shift the current token
+                statestack.append(t)
+                state = t
+                start = starts[index]
+                posstack.append(start)
+                if values and index in values:
+                    valstack.append(values[index])
+                else:
+                    valstack.append(lexdata[start:start + lengths[index]])
+                index += 1
+                sym = -1
+                continue
+
+            if t < 0:
+                # reduce by production -t
+                p = prod[-t]
+                plen = p.len
+                if plen:
+                    targ = valstack[-plen-1:]
+                    targ[0] = None
+                    del valstack[-plen:]
+                else:
+                    targ = [None]
+                pslice.slice = targ
+                try:
+                    p.callable(pslice)
+                except SyntaxError:
+                    valstack.extend(targ[1:])
+                    break
+                if plen:
+                    del statestack[-plen:]
+                if plen > 1:
+                    del posstack[1 - plen:]
+                if plen:
+                    posstack[-1] = None
+                else:
+                    posstack.append(None)
+                valstack.append(targ[0])
+                state = gtable[gbase[statestack[-1]] + lhs[-t]]
+                statestack.append(state)
+                continue
+
+            return valstack[-1]
+
+        if sym < 0:
+            lookahead = ltype = None
+        elif index < ntokens:
+            lookahead = tokens.token(index)
+            ltype = lookahead.type
+            index += 1
+        else:
+            lookahead, ltype = None, '$end'
+        return self.resume(lexer, tokens.feed(index), statestack, valstack, posstack, lookahead, ltype)
+
+    # -------------------------------------------------------------------------
+    # parsegenerated().
+    #
+    # Parse with the parse() function of the module written for the grammar by
+    # write_parser_module().  Like parsearrays(), it keeps values rather than
+    # symbols on the stack and leaves error recovery to parseopt_notrack(),
+    # which goes on from its stacks on a syntax error.
+    # -------------------------------------------------------------------------
+
+    def parsegenerated(self, input=None, lexer=None, tokenfunc=None):
+        if not lexer:
+            from . import lex
+            lexer = lex.lexer
+        if input is not None:
+            lexer.input(input)
+        get_token = tokenfunc or lexer.token
+
+        pslice = YaccValueProduction(None)
+        pslice.lexer = lexer
+        pslice.parser = self
+
+        ok, result = self.generated.parse(get_token, pslice, self.generated_rules())
+        if ok:
+            return result
+        return self.resume(lexer, get_token, *result)
+
+    # The reductions for the generated parse(): per production, its length,
+    # its function and the goto column of its left-hand side.  The function is
+    # None for rules that only copy their one symbol, t[0] = t[1], which the
+    # generated code does without a call.  Bound on each parse, so that grammar
+    # functions can be replaced between parses.
+    def generated_rules(self):
+        goto = self.generated._goto
+        rules = []
+        for p in self.productions:
+            func = p.callable
+            if p.len == 1 and is_copy_rule(func):
+                func = None
+            rules.append((p.len, func, goto.get(p.name)))
+        return rules
+
+    # -------------------------------------------------------------------------
+    # parseprofile().
+    #
+    # The loop of parsegenerated() on the action and goto dicts, counting the
+    # actions taken in each state and the reductions by each production in a
+    # ParseProfile, and timing the grammar function of each reduction.  Rules
+    # that only copy their symbol are called like the others, so that they
+    # show up in the profile.  On a syntax error the parse goes on in
+    # parseopt_notrack(), which is not profiled.
+    # -------------------------------------------------------------------------
+
+    def parseprofile(self, profile, input=None, lexer=None, tokenfunc=None):
+        if not lexer:
+            from . import lex
+            lexer = lex.lexer
+        if input is not None:
+            lexer.input(input)
+        get_token = tokenfunc or lexer.token
+
+        pslice = YaccValueProduction(None)
+        pslice.lexer = lexer
+        pslice.parser = self
+
+        action    = self.action
+        goto      = self.goto
+        defaulted = self.defaulted_states
+        prod      = self.productions
+        hits      = profile.states
+        counts    = profile.reductions
+        times     = profile.times
+        timer     = profile.timer
+
+        statestack = [0]
+        valstack   = [None]
+        posstack   = [None]
+        pslice.stack = valstack
+        pslice.positions = posstack
+        ntokens = 0
+        lookahead = None
+        ltype = None
+        state = 0
+        begin = timer()
+        profile.parses += 1
+
+        while True:
+            hits[state] += 1
+            t = defaulted.get(state)
+            if t is None:
+                if ltype is None:
+                    lookahead = get_token()
+                    if lookahead is None:
+                        ltype = '$end'
+                    else:
+                        ntokens += 1
+                        ltype = lookahead.type
+                t = action[state].get(ltype)
+                if t is None:
+                    break
+
+            if t > 0:
+                statestack.append(t)
+                state = t
+                valstack.append(lookahead.value)
+                posstack.append(lookahead.lexpos)
+                ltype = None
+                continue
+
+            if t < 0:
+                p = prod[-t]
+                plen = p.len
+                if plen:
+                    targ = valstack[-plen-1:]
+                    targ[0] = None
+                    del valstack[-plen:]
+                else:
+                    targ = [None]
+                pslice.slice = targ
+                start = timer()
+                try:
+                    p.callable(pslice)
+                except SyntaxError:
+                    valstack.extend(targ[1:])
+                    break
+                finally:
+                    times[-t] += timer() - start
+                counts[-t] += 1
+                if plen:
+                    del statestack[-plen:]
+                if plen > 1:
+                    del posstack[1 - plen:]
+                if plen:
+                    posstack[-1] = None
+                else:
+                    posstack.append(None)
+                valstack.append(targ[0])
+                state = goto[statestack[-1]][p.name]
+                statestack.append(state)
+                continue
+
+            profile.tokens += ntokens
+            profile.time += timer() - begin
+            return valstack[-1]
+
+        profile.tokens += ntokens
+        profile.time += timer() - begin
+        return self.resume(lexer, get_token, statestack, valstack, posstack, lookahead, ltype)
+
+    # -------------------------------------------------------------------------
+    # resume().
+    #
+    # Go on with a parse that parsearrays(), parsegenerated() or parseprofile()
+    # stopped at a syntax error in parseopt_notrack(), from the same stacks,
+    # so that the input read so far is neither kept nor read again.  Each
+    # state is entered by a single grammar symbol, so the symbol stack is
+    # rebuilt from the state stack, the values and the terminal positions,
+    # with tokens for the terminals as the lexer would have returned them
+    # (parseopt_notrack() reuses the YaccSymbols of nonterminals, which
+    # must not have a position).  The lookahead is the token of type ltype that was not shifted yet, if
+    # ltype is not None.  A grammar rule that raised SyntaxError is left on
+    # the stack unreduced and is called again by parseopt_notrack().
+    # -------------------------------------------------------------------------
+
+    def resume(self, lexer, get_token, statestack, valstack, posstack, lookahead, ltype):
+        if self.entry_symbols is None:
+            symbols = {}
+            for table in (self.action, self.goto):
+                for row in table.values():
+                    for name, t in row.items():
+                        if t > 0:
+                            symbols[t] = name
+            self.entry_symbols = symbols
+        symbols = self.entry_symbols
+
+        lineindex = lexer.lineindex() if hasattr(lexer, 'lineindex') else None
+        sym = YaccSymbol()
+        sym.type = '$end'
+        symstack = [sym]
+        for state, value, lexpos in zip(statestack[1:], valstack[1:], posstack[1:]):
+            if lexpos is None:
+                sym = YaccSymbol()
+            else:
+                sym = LexToken()
+                sym.lexpos = lexpos
+                sym.lineno = lineindex.position(lexpos)[0] if lineindex else 0
+                sym.lexer = lexer
+            sym.type = symbols[state]
+            sym.value = value
+            symstack.append(sym)
+
+        if ltype is None:
+            lookahead = None
+        elif lookahead is None:
+            lookahead = YaccSymbol()
+            lookahead.type = '$end'
+        return self.parseopt_notrack(None, lexer, tokenfunc=get_token, resume=(statestack, symstack, lookahead))
+
+# -----------------------------------------------------------------------------
+#                        === Generated parser modules ===
+#
+# write_parser_module() writes a Python module for the tables of an LRParser.
+# The tables are inlined as literals, with the goto table split into one
+# column per nonterminal so that a reduction finds its goto with a single
+# lookup, and the module's parse() function is a parsing loop specialized for
+# them.  yacc(parsermodule=...) writes and loads the module, after which the
+# parser's parse() uses it (see LRParser.parsegenerated()).
+# -----------------------------------------------------------------------------
+
+def _copy_rule(t):
+    'rule : symbol'
+    t[0] = t[1]
+
+def is_copy_rule(func):
+    """
+    True if func is a grammar rule function that only does t[0] = t[1].
+    """
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return False
+    ref = _copy_rule.__code__
+    return (code.co_code == ref.co_code and code.co_consts[1:] == ref.co_consts[1:] and
+            code.co_names == ref.co_names and code.co_argcount == ref.co_argcount)
+
+# Changed with the code of _parser_module, so that modules written by another
+# version are written again
+_parser_module_version = 3
+
+_parser_module = """
+# %(filename)s
+# This file is automatically generated by PLY. Do not edit.
+# pylint: disable=W,C,R
+_signature = %(signature)r
+_version = %(version)r
+
+# Per state, token type -> shift to state (> 0), reduce by rule (< 0) or accept (0)
+_action = [
+%(action)s
+]
+
+# Per state, the rule it reduces by without reading a token, or 0
+_defaults = %(defaults)r
+
+# Per nonterminal, state -> state after reducing to the nonterminal
+_goto = {
+%(goto)s
+}
+
+# The arrays of the tables packed by rows, for LRParser.parsearrays()
+_packed = {
+%(packed)s
+}
+
+def parse(get_token, pslice, rules):
+    # Returns (True, result), or on a syntax error (False, (state stack,
+    # value stack, position stack, lookahead, lookahead type))
+    action = _action
+    defaults = _defaults
+    statestack = [0]
+    valstack = [None]
+    posstack = [None]
+    pslice.stack = valstack
+    pslice.positions = posstack
+    lookahead = None
+    ltype = None
+    state = 0
+
+    while True:
+        t = defaults[state]
+        if not t:
+            if ltype is None:
+                lookahead = get_token()
+                if lookahead is None:
+                    ltype = '$end'
+                else:
+                    ltype = lookahead.type
+            t = action[state].get(ltype)
+            if t is None:
+                return False, (statestack, valstack, posstack, lookahead, ltype)
+
+        if t > 0:
+            statestack.append(t)
+            state = t
+            valstack.append(lookahead.value)
+            posstack.append(lookahead.lexpos)
+            ltype = None
+            continue
+
+        if t < 0:
+            plen, func, goto = rules[-t]
+            if func is None:
+                state = statestack[-1] = goto[statestack[-2]]
+                posstack[-1] = None
+                continue
+            if plen:
+                targ = valstack[-plen-1:]
+                targ[0] = None
+                del valstack[-plen:]
+            else:
+                targ = [None]
+            pslice.slice = targ
+            try:
+                func(pslice)
+            except SyntaxError:
+                valstack.extend(targ[1:])
+                return False, (statestack, valstack, posstack, lookahead, ltype)
+            if plen:
+                del statestack[-plen:]
+            if plen > 1:
+                del posstack[1 - plen:]
+            if plen:
+                posstack[-1] = None
+            else:
+                posstack.append(None)
+            valstack.append(targ[0])
+            state = goto[statestack[-1]]
+            statestack.append(state)
+            continue
+
+        return True, valstack[-1]
+"""
+
+def _dict_literal(d):
+    return '{%s}' % ', '.join('%r: %r' % (k, d[k]) for k in sorted(d))
+
+def write_parser_module(parser, modulename, outputdir='', signature=''):
+    basemodulename = modulename.split('.')[-1]
+    filename = os.path.join(outputdir, basemodulename) + '.py'
+    nstates = max(parser.action) + 1
+    columns = {}
+    for state, row in parser.goto.items():
+        for name, target in row.items():
+            columns.setdefault(name, {})[state] = target
+    packed = parser.packed_tables()
+    text = _parser_module % {
+        'filename': os.path.basename(filename),
+        'signature': signature,
+        'version': _parser_module_version,
+        'action': '\n'.join('    %s,' % _dict_literal(parser.action.get(s, {})) for s in range(nstates)),
+        'defaults': [parser.defaulted_states.get(s, 0) for s in range(nstates)],
+        'goto': '\n'.join('    %r: %s,' % (name, _dict_literal(columns[name])) for name in sorted(columns)),
+        'packed': '\n'.join('    %r: %r,' % (name, list(getattr(packed, name))) for name in PACKED_ARRAYS),
+    }
+    with cache.replacing(filename) as f:
+        f.write(text)
+    # A bytecode file written in the same second would be taken as current
+    stale = [filename + 'c', filename + 'o']
+    if sys.version_info[0] >= 3:
+        import importlib.util
+        stale.append(importlib.util.cache_from_source(filename))
+    for name in stale:
+        if os.path.exists(name):
+            os.remove(name)
+
+def load_parser_module(parser, modulename, outputdir, signature, errorlog):
+    """
+    Load the generated module modulename for parser from outputdir, writing it
+    first if it is missing or was written for another grammar, and make parser
+    use it.
+    """
+    filename = os.path.join(outputdir, modulename.split('.')[-1]) + '.py'
+    module = sys.modules.get(modulename)
+    if module is None and os.path.exists(filename):
+        try:
+            module = cache.load_source(modulename, filename)
+        except Exception as e:
+            errorlog.warning('There was a problem loading the parser module: %r', e)
+    if getattr(module, '_signature', None) != signature or getattr(module, '_version', None) != _parser_module_version:
+        try:
+            write_parser_module(parser, modulename, outputdir, signature)
+        except (IOError, OSError) as e:
+            errorlog.warning("Couldn't create %r. %s" % (modulename, e))
+            return
+        module = cache.load_source(modulename, filename)
+    parser.generated = module
+
 # -----------------------------------------------------------------------------
 #                          === Grammar Representation ===
 #
@@ -2822,7 +3559,7 @@ del _lr_goto_items
             import cPickle as pickle
         except ImportError:
             import pickle
-        with open(filename, 'wb') as outf:
+        with cache.replacing(filename, 'wb') as outf:
             pickle.dump(__tabversion__, outf, pickle_protocol)
             pickle.dump(self.lr_method, outf, pickle_protocol)
             pickle.dump(signature, outf, pickle_protocol)
@@ -2975,6 +3712,8 @@ class ParserReflect(object):
     # -----------------------------------------------------------------------------
 
     def validate_modules(self):
+        import inspect
+
         # Match def p_funcname(
         fre = re.compile(r'\s*def\s+(p_[a-zA-Z_0-9]*)\(')
 
@@ -3011,6 +3750,8 @@ class ParserReflect(object):
 
     # Validate the error function
     def validate_error_func(self):
+        import inspect
+
         if self.error_func:
             if isinstance(self.error_func, types.FunctionType):
                 ismethod = 0
@@ -3108,7 +3849,7 @@ class ParserReflect(object):
                 continue
             if isinstance(item, (types.FunctionType, types.MethodType)):
                 line = item.__code__.co_firstlineno
-                module = inspect.getmodule(item)
+                module = sys.modules.get(item.__module__)
                 p_functions.append((line, module, name, item.__doc__))
 
         # Sort all of the actions by line number; make sure to stringify
@@ -3123,6 +3864,8 @@ class ParserReflect(object):
 
     # Validate all of the p_functions
     def validate_pfunctions(self):
+        import inspect
+
         grammar = []
         # Check for non-empty symbols
         if len(self.pfuncs) == 0:
@@ -3190,7 +3933,8 @@ class ParserReflect(object):
 
 def yacc(method='LALR', debug=yaccdebug, module=None, tabmodule=tab_module, start=None,
          check_recursion=True, optimize=False, write_tables=True, debugfile=debug_file,
-         outputdir=None, debuglog=None, errorlog=None, picklefile=None):
+         outputdir=None, debuglog=None, errorlog=None, picklefile=None, parsermodule=None,
+         cachedir=None):
 
     if tabmodule is None:
         tabmodule = tab_module
@@ -3238,6 +3982,8 @@ def yacc(method='LALR', debug=yaccdebug, module=None, tabmodule=tab_module, star
     if pkg and isinstance(tabmodule, str):
         if '.' not in tabmodule:
             tabmodule = pkg + '.' + tabmodule
+    if pkg and parsermodule and '.' not in parsermodule:
+        parsermodule = pkg + '.' + parsermodule
 
 
 
@@ -3255,217 +4001,246 @@ def yacc(method='LALR', debug=yaccdebug, module=None, tabmodule=tab_module, star
     # Check signature against table files (if any)
     signature = pinfo.signature()
 
-    # Read the tables
+    # With a cache directory, the tables, the debugging output and the
+    # generated parser module are kept in the cache under the signature of the
+    # grammar (see the cache module)
+    lock = None
     try:
-        lr = LRTable()
-        if picklefile:
-            read_signature = lr.read_pickle(picklefile)
-        else:
-            read_signature = lr.read_table(tabmodule)
-        if optimize or (read_signature == signature):
+        if cachedir:
+            key = cache.key(signature, method, __tabversion__)
+            picklefile = os.path.join(cachedir, 'parsetab-%s.pickle' % key)
+            write_tables = 0
+            debugfile = 'parser-%s.out' % key
+            outputdir = cachedir
+            if parsermodule:
+                parsermodule = '%s_%s' % (parsermodule.split('.')[-1], key)
+
+        # Read the tables
+        while True:
             try:
-                lr.bind_callables(pinfo.pdict)
-                parser = LRParser(lr, pinfo.error_func)
-                parse = parser.parse
-                return parser
-            except Exception as e:
-                errorlog.warning('There was a problem loading the table file: %r', e)
-    except VersionError as e:
-        errorlog.warning(str(e))
-    except ImportError:
-        pass
+                lr = LRTable()
+                if picklefile:
+                    read_signature = lr.read_pickle(picklefile)
+                else:
+                    read_signature = lr.read_table(tabmodule)
+                if optimize or (read_signature == signature):
+                    try:
+                        lr.bind_callables(pinfo.pdict)
+                        parser = LRParser(lr, pinfo.error_func)
+                        if parsermodule:
+                            load_parser_module(parser, parsermodule, outputdir, signature, errorlog)
+                        parse = parser.parse
+                        return parser
+                    except Exception as e:
+                        errorlog.warning('There was a problem loading the table file: %r', e)
+            except VersionError as e:
+                errorlog.warning(str(e))
+            except ImportError:
+                pass
 
-    if debuglog is None:
-        if debug:
-            try:
-                debuglog = PlyLogger(open(os.path.join(outputdir, debugfile), 'w'))
-            except IOError as e:
-                errorlog.warning("Couldn't open %r. %s" % (debugfile, e))
+            # Wait for any other process building the tables, and look again
+            if not cachedir or lock:
+                break
+            lock = cache.FileLock(picklefile + '.lock')
+            if not lock.acquire():
+                break
+
+        if debuglog is None:
+            if debug:
+                try:
+                    debuglog = PlyLogger(open(os.path.join(outputdir, debugfile), 'w'))
+                except IOError as e:
+                    errorlog.warning("Couldn't open %r. %s" % (debugfile, e))
+                    debuglog = NullLogger()
+            else:
                 debuglog = NullLogger()
-        else:
-            debuglog = NullLogger()
 
-    debuglog.info('Created by PLY version %s (http://www.dabeaz.com/ply)', __version__)
+        debuglog.info('Created by PLY version %s (http://www.dabeaz.com/ply)', __version__)
 
-    errors = False
+        errors = False
 
-    # Validate the parser information
-    if pinfo.validate_all():
-        raise YaccError('Unable to build parser')
+        # Validate the parser information
+        if pinfo.validate_all():
+            raise YaccError('Unable to build parser')
 
-    if not pinfo.error_func:
-        errorlog.warning('no p_error() function is defined')
+        if not pinfo.error_func:
+            errorlog.warning('no p_error() function is defined')
 
-    # Create a grammar object
-    grammar = Grammar(pinfo.tokens)
+        # Create a grammar object
+        grammar = Grammar(pinfo.tokens)
 
-    # Set precedence level for terminals
-    for term, assoc, level in pinfo.preclist:
-        try:
-            grammar.set_precedence(term, assoc, level)
-        except GrammarError as e:
-            errorlog.warning('%s', e)
+        # Set precedence level for terminals
+        for term, assoc, level in pinfo.preclist:
+            try:
+                grammar.set_precedence(term, assoc, level)
+            except GrammarError as e:
+                errorlog.warning('%s', e)
+
+        # Add productions to the grammar
+        for funcname, gram in pinfo.grammar:
+            file, line, prodname, syms = gram
+            try:
+                grammar.add_production(prodname, syms, funcname, file, line)
+            except GrammarError as e:
+                errorlog.error('%s', e)
+                errors = True
 
-    # Add productions to the grammar
-    for funcname, gram in pinfo.grammar:
-        file, line, prodname, syms = gram
+        # Set the grammar start symbols
         try:
-            grammar.add_production(prodname, syms, funcname, file, line)
+            if start is None:
+                grammar.set_start(pinfo.start)
+            else:
+                grammar.set_start(start)
         except GrammarError as e:
-            errorlog.error('%s', e)
+            errorlog.error(str(e))
             errors = True
 
-    # Set the grammar start symbols
-    try:
-        if start is None:
-            grammar.set_start(pinfo.start)
-        else:
-            grammar.set_start(start)
-    except GrammarError as e:
-        errorlog.error(str(e))
-        errors = True
-
-    if errors:
-        raise YaccError('Unable to build parser')
+        if errors:
+            raise YaccError('Unable to build parser')
 
-    # Verify the grammar structure
-    undefined_symbols = grammar.undefined_symbols()
-    for sym, prod in undefined_symbols:
-        errorlog.error('%s:%d: Symbol %r used, but not defined as a token or a rule', prod.file, prod.line, sym)
-        errors = True
-
-    unused_terminals = grammar.unused_terminals()
-    if unused_terminals:
-        debuglog.info('')
-        debuglog.info('Unused terminals:')
-        debuglog.info('')
-        for term in unused_terminals:
-            errorlog.warning('Token %r defined, but not used', term)
-            debuglog.info('    %s', term)
-
-    # Print out all productions to the debug log
-    if debug:
-        debuglog.info('')
-        debuglog.info('Grammar')
-        debuglog.info('')
-        for n, p in enumerate(grammar.Productions):
-            debuglog.info('Rule %-5d %s', n, p)
-
-    # Find unused non-terminals
-    unused_rules = grammar.unused_rules()
-    for prod in unused_rules:
-        errorlog.warning('%s:%d: Rule %r defined, but not used', prod.file, prod.line, prod.name)
-
-    if len(unused_terminals) == 1:
-        errorlog.warning('There is 1 unused token')
-    if len(unused_terminals) > 1:
-        errorlog.warning('There are %d unused tokens', len(unused_terminals))
-
-    if len(unused_rules) == 1:
-        errorlog.warning('There is 1 unused rule')
-    if len(unused_rules) > 1:
-        errorlog.warning('There are %d unused rules', len(unused_rules))
-
-    if debug:
-        debuglog.info('')
-        debuglog.info('Terminals, with rules where they appear')
-        debuglog.info('')
-        terms = list(grammar.Terminals)
-        terms.sort()
-        for term in terms:
-            debuglog.info('%-20s : %s', term, ' '.join([str(s) for s in grammar.Terminals[term]]))
-
-        debuglog.info('')
-        debuglog.info('Nonterminals, with rules where they appear')
-        debuglog.info('')
-        nonterms = list(grammar.Nonterminals)
-        nonterms.sort()
-        for nonterm in nonterms:
-            debuglog.info('%-20s : %s', nonterm, ' '.join([str(s) for s in grammar.Nonterminals[nonterm]]))
-        debuglog.info('')
-
-    if check_recursion:
-        unreachable = grammar.find_unreachable()
-        for u in unreachable:
-            errorlog.warning('Symbol %r is unreachable', u)
-
-        infinite = grammar.infinite_cycles()
-        for inf in infinite:
-            errorlog.error('Infinite recursion detected for symbol %r', inf)
+        # Verify the grammar structure
+        undefined_symbols = grammar.undefined_symbols()
+        for sym, prod in undefined_symbols:
+            errorlog.error('%s:%d: Symbol %r used, but not defined as a token or a rule', prod.file, prod.line, sym)
             errors = True
 
-    unused_prec = grammar.unused_precedence()
-    for term, assoc in unused_prec:
-        errorlog.error('Precedence rule %r defined for unknown symbol %r', assoc, term)
-        errors = True
-
-    if errors:
-        raise YaccError('Unable to build parser')
-
-    # Run the LRGeneratedTable on the grammar
-    if debug:
-        errorlog.debug('Generating %s tables', method)
-
-    lr = LRGeneratedTable(grammar, method, debuglog)
+        unused_terminals = grammar.unused_terminals()
+        if unused_terminals:
+            debuglog.info('')
+            debuglog.info('Unused terminals:')
+            debuglog.info('')
+            for term in unused_terminals:
+                errorlog.warning('Token %r defined, but not used', term)
+                debuglog.info('    %s', term)
 
-    if debug:
-        num_sr = len(lr.sr_conflicts)
-
-        # Report shift/reduce and reduce/reduce conflicts
-        if num_sr == 1:
-            errorlog.warning('1 shift/reduce conflict')
-        elif num_sr > 1:
-            errorlog.warning('%d shift/reduce conflicts', num_sr)
-
-        num_rr = len(lr.rr_conflicts)
-        if num_rr == 1:
-            errorlog.warning('1 reduce/reduce conflict')
-        elif num_rr > 1:
-            errorlog.warning('%d reduce/reduce conflicts', num_rr)
+        # Print out all productions to the debug log
+        if debug:
+            debuglog.info('')
+            debuglog.info('Grammar')
+            debuglog.info('')
+            for n, p in enumerate(grammar.Productions):
+                debuglog.info('Rule %-5d %s', n, p)
+
+        # Find unused non-terminals
+        unused_rules = grammar.unused_rules()
+        for prod in unused_rules:
+            errorlog.warning('%s:%d: Rule %r defined, but not used', prod.file, prod.line, prod.name)
+
+        if len(unused_terminals) == 1:
+            errorlog.warning('There is 1 unused token')
+        if len(unused_terminals) > 1:
+            errorlog.warning('There are %d unused tokens', len(unused_terminals))
+
+        if len(unused_rules) == 1:
+            errorlog.warning('There is 1 unused rule')
+        if len(unused_rules) > 1:
+            errorlog.warning('There are %d unused rules', len(unused_rules))
 
-    # Write out conflicts to the output file
-    if debug and (lr.sr_conflicts or lr.rr_conflicts):
-        debuglog.warning('')
-        debuglog.warning('Conflicts:')
-        debuglog.warning('')
+        if debug:
+            debuglog.info('')
+            debuglog.info('Terminals, with rules where they appear')
+            debuglog.info('')
+            terms = list(grammar.Terminals)
+            terms.sort()
+            for term in terms:
+                debuglog.info('%-20s : %s', term, ' '.join([str(s) for s in grammar.Terminals[term]]))
+
+            debuglog.info('')
+            debuglog.info('Nonterminals, with rules where they appear')
+            debuglog.info('')
+            nonterms = list(grammar.Nonterminals)
+            nonterms.sort()
+            for nonterm in nonterms:
+                debuglog.info('%-20s : %s', nonterm, ' '.join([str(s) for s in grammar.Nonterminals[nonterm]]))
+            debuglog.info('')
+
+        if check_recursion:
+            unreachable = grammar.find_unreachable()
+            for u in unreachable:
+                errorlog.warning('Symbol %r is unreachable', u)
+
+            infinite = grammar.infinite_cycles()
+            for inf in infinite:
+                errorlog.error('Infinite recursion detected for symbol %r', inf)
+                errors = True
+
+        unused_prec = grammar.unused_precedence()
+        for term, assoc in unused_prec:
+            errorlog.error('Precedence rule %r defined for unknown symbol %r', assoc, term)
+            errors = True
 
-        for state, tok, resolution in lr.sr_conflicts:
-            debuglog.warning('shift/reduce conflict for %s in state %d resolved as %s',  tok, state, resolution)
+        if errors:
+            raise YaccError('Unable to build parser')
 
-        already_reported = set()
-        for state, rule, rejected in lr.rr_conflicts:
-            if (state, id(rule), id(rejected)) in already_reported:
-                continue
-            debuglog.warning('reduce/reduce conflict in state %d resolved using rule (%s)', state, rule)
-            debuglog.warning('rejected rule (%s) in state %d', rejected, state)
-            errorlog.warning('reduce/reduce conflict in state %d resolved using rule (%s)', state, rule)
-            errorlog.warning('rejected rule (%s) in state %d', rejected, state)
-            already_reported.add((state, id(rule), id(rejected)))
-
-        warned_never = []
-        for state, rule, rejected in lr.rr_conflicts:
-            if not rejected.reduced and (rejected not in warned_never):
-                debuglog.warning('Rule (%s) is never reduced', rejected)
-                errorlog.warning('Rule (%s) is never reduced', rejected)
-                warned_never.append(rejected)
-
-    # Write the table file if requested
-    if write_tables:
-        try:
-            lr.write_table(tabmodule, outputdir, signature)
-        except IOError as e:
-            errorlog.warning("Couldn't create %r. %s" % (tabmodule, e))
+        # Run the LRGeneratedTable on the grammar
+        if debug:
+            errorlog.debug('Generating %s tables', method)
 
-    # Write a pickled version of the tables
-    if picklefile:
-        try:
-            lr.pickle_table(picklefile, signature)
-        except IOError as e:
-            errorlog.warning("Couldn't create %r. %s" % (picklefile, e))
+        lr = LRGeneratedTable(grammar, method, debuglog)
 
-    # Build the parser
-    lr.bind_callables(pinfo.pdict)
-    parser = LRParser(lr, pinfo.error_func)
+        if debug:
+            num_sr = len(lr.sr_conflicts)
+
+            # Report shift/reduce and reduce/reduce conflicts
+            if num_sr == 1:
+                errorlog.warning('1 shift/reduce conflict')
+            elif num_sr > 1:
+                errorlog.warning('%d shift/reduce conflicts', num_sr)
+
+            num_rr = len(lr.rr_conflicts)
+            if num_rr == 1:
+                errorlog.warning('1 reduce/reduce conflict')
+            elif num_rr > 1:
+                errorlog.warning('%d reduce/reduce conflicts', num_rr)
+
+        # Write out conflicts to the output file
+        if debug and (lr.sr_conflicts or lr.rr_conflicts):
+            debuglog.warning('')
+            debuglog.warning('Conflicts:')
+            debuglog.warning('')
+
+            for state, tok, resolution in lr.sr_conflicts:
+                debuglog.warning('shift/reduce conflict for %s in state %d resolved as %s',  tok, state, resolution)
+
+            already_reported = set()
+            for state, rule, rejected in lr.rr_conflicts:
+                if (state, id(rule), id(rejected)) in already_reported:
+                    continue
+                debuglog.warning('reduce/reduce conflict in state %d resolved using rule (%s)', state, rule)
+                debuglog.warning('rejected rule (%s) in state %d', rejected, state)
+                errorlog.warning('reduce/reduce conflict in state %d resolved using rule (%s)', state, rule)
+                errorlog.warning('rejected rule (%s) in state %d', rejected, state)
+                already_reported.add((state, id(rule), id(rejected)))
+
+            warned_never = []
+            for state, rule, rejected in lr.rr_conflicts:
+                if not rejected.reduced and (rejected not in warned_never):
+                    debuglog.warning('Rule (%s) is never reduced', rejected)
+                    errorlog.warning('Rule (%s) is never reduced', rejected)
+                    warned_never.append(rejected)
+
+        # Write the table file if requested
+        if write_tables:
+            try:
+                lr.write_table(tabmodule, outputdir, signature)
+            except IOError as e:
+                errorlog.warning("Couldn't create %r. %s" % (tabmodule, e))
 
-    parse = parser.parse
-    return parser
+        # Write a pickled version of the tables
+        if picklefile:
+            try:
+                lr.pickle_table(picklefile, signature)
+            except (IOError, OSError) as e:
+                errorlog.warning("Couldn't create %r. %s" % (picklefile, e))
+
+        # Build the parser
+        lr.bind_callables(pinfo.pdict)
+        parser = LRParser(lr, pinfo.error_func)
+        if parsermodule:
+            load_parser_module(parser, parsermodule, outputdir, signature, errorlog)
+
+        parse = parser.parse
+        return parser
+    finally:
+        if lock:
+            lock.release()
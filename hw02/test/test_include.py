@@ -0,0 +1,13 @@
+import os 
+import pytest 
+
+from hw02.main import parser
+from hw02.preprocess import parse_includes
+
+def test_include_header(tmpdir):
+    tmpdir.join('decls.h').write('extern int bar;\n')
+    src = '#include "decls.h"\nint sum = 1;\n'
+    for i in range(2):
+        assert parse_includes(src, parser, directory=str(tmpdir), cache_dir=str(tmpdir.join('cache'))) == [
+            ('EXTERN', ('VAR_DEC', ('TYPE', 'int'), [('ID', 'bar')])),
+            ('VAR_DEC', ('TYPE', 'int'), [('INIT_ASSIGN', ('ID', 'sum'), ('ICONST', '1'))])]
@@ -0,0 +1,43 @@
+"""
+Memory and garbage collector cost of the AST of a large generated C source,
+built from node objects or in an arena.Arena.  The source is lexed into token
+arrays before the measurement starts.  Reports the growth of the peak RSS
+while parsing, the number of objects tracked by the collector afterwards and
+the time of a full collection with the tree alive.
+
+    $ python -m bench.ast_memory [nodes|flat] [lines]
+"""
+
+import gc
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+from bench.parse_memory import peak_rss_mb
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'flat'
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    data = corpus.generate(functions=max(1, lines // 61), statements=50)
+    tokens = clex.lexer.clone().tokenize_all(data)
+    gc.collect()
+    before = peak_rss_mb()
+
+    start = time.time()
+    if mode == 'flat':
+        tree = cparse.parse_flat(tokens)
+        size = '%d nodes' % len(tree)
+    else:
+        tree = cparse.parser.parse(tokens)
+        size = '%d top-level declarations' % len(tree)
+    elapsed = time.time() - start
+
+    start = time.time()
+    gc.collect()
+    collect = time.time() - start
+
+    print '%d lines, %s' % (data.count('\n'), size)
+    print '%-5s  parse %.2f s, peak RSS +%.1f MB, %d objects tracked, full collection %.3f s' % (
+        mode, elapsed, peak_rss_mb() - before, len(gc.get_objects()), collect)
@@ -0,0 +1,62 @@
+"""
+Synthetic C sources in the subset accepted by hw03.cparse, used as input for
+the benchmarks in this directory.
+"""
+
+import random
+
+def gen_expression(rnd, names, depth):
+    if depth <= 0 or rnd.random() < 0.2:
+        if rnd.random() < 0.5:
+            return rnd.choice(names)
+        return str(rnd.randint(0, 1000))
+    op = rnd.choice(['+', '-', '*', '/', '%'])
+    a = gen_expression(rnd, names, depth - 1)
+    b = gen_expression(rnd, names, depth - 1)
+    if rnd.random() < 0.2:
+        return '(%s %s %s)' % (a, op, b)
+    return '%s %s %s' % (a, op, b)
+
+def gen_condition(rnd, names, depth):
+    op = rnd.choice(['<', '<=', '>', '>=', '==', '!='])
+    return '%s %s %s' % (gen_expression(rnd, names, depth), op, gen_expression(rnd, names, depth))
+
+def gen_statement(rnd, names, depth):
+    x = rnd.choice(names)
+    r = rnd.random()
+    if r < 0.5:
+        return '%s = %s;' % (x, gen_expression(rnd, names, depth))
+    elif r < 0.6:
+        return 'printd(%s);' % gen_expression(rnd, names, depth)
+    elif r < 0.75:
+        return 'if (%s) %s = %s; else %s = %s;' % (
+            gen_condition(rnd, names, depth), x, gen_expression(rnd, names, depth),
+            x, gen_expression(rnd, names, depth))
+    elif r < 0.9:
+        return 'for (%s = 0; %s < %d; %s = %s + 1) { %s } // count' % (
+            x, x, rnd.randint(1, 100), x, x,
+            '%s = %s;' % (rnd.choice(names), gen_expression(rnd, names, depth)))
+    else:
+        return 'while (%s) { %s = %s - 1; } /* loop */' % (gen_condition(rnd, names, depth), x, x)
+
+def generate(functions=10, statements=20, depth=3, identifiers=8, seed=0):
+    """
+    Generate a C program with the given number of functions, statements per
+    function, expression depth and local identifiers per function.
+    """
+    rnd = random.Random(seed)
+    out = ['int printd( int i );', '']
+    for f in range(functions):
+        names = ['v%d_%d' % (f, i) for i in range(identifiers)]
+        out.append('int f%d(int %s) {' % (f, names[0]))
+        for name in names[1:]:
+            out.append('  int %s;' % name)
+        for s in range(statements):
+            out.append('  ' + gen_statement(rnd, names, depth))
+        out.append('  return %s;' % gen_expression(rnd, names, depth))
+        out.append('}')
+        out.append('')
+    out.append('int main() {')
+    out.append('  return 0;')
+    out.append('}')
+    return '\n'.join(out) + '\n'
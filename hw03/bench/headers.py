@@ -0,0 +1,38 @@
+"""
+Parse a number of small compilation units that all include one large header
+of extern prototypes, without and with the parsed header cache.
+
+    $ python -m bench.headers [units] [prototypes]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+from hw03 import cparse
+from hw03.preprocess import parse_includes
+from bench import corpus
+
+def run(units, directory, cache_dir, header='#include "protos.h"\n'):
+    start = time.clock()
+    for i in range(units):
+        src = header + corpus.generate(functions=1, statements=10, seed=i)
+        parse_includes(src, cparse.parser, directory=directory, cache_dir=cache_dir)
+    return time.clock() - start
+
+if __name__ == '__main__':
+    units = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    prototypes = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    directory = tempfile.mkdtemp()
+    try:
+        with open('%s/protos.h' % directory, 'w') as f:
+            for i in range(prototypes):
+                f.write('extern int proto%d( int a, int b );\n' % i)
+        print '%d units, header of %d prototypes' % (units, prototypes)
+        print 'no header  %8.2fs' % run(units, directory, None, header='')
+        print 'no cache   %8.2fs' % run(units, directory, None)
+        print 'cold cache %8.2fs' % run(units, directory, directory + '/cache')
+        print 'warm cache %8.2fs' % run(units, directory, directory + '/cache')
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,31 @@
+"""
+Wall time of starting the compiler with the tables in the cache: the bare
+interpreter, importing gen_asm, which builds neither the lexer nor the
+parser, and compiling a small source, which builds both.  Reports the best
+of several runs.
+
+    $ python -m bench.import_time [repeat]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+SOURCE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'add.c')
+
+def best(repeat, args, stdin=None):
+    times = []
+    for i in range(repeat):
+        with open(stdin or os.devnull) as f:
+            begin = time.time()
+            subprocess.check_call([sys.executable] + args, stdin=f, stdout=open(os.devnull, 'w'))
+            times.append(time.time() - begin)
+    return min(times)
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    best(1, ['-m', 'hw03.gen_asm'], SOURCE)       # Fill the cache
+    print 'interpreter       %6.1f ms' % (1e3 * best(repeat, ['-c', 'pass']))
+    print 'import gen_asm    %6.1f ms' % (1e3 * best(repeat, ['-c', 'import hw03.gen_asm']))
+    print 'compile add.c     %6.1f ms' % (1e3 * best(repeat, ['-m', 'hw03.gen_asm'], SOURCE))
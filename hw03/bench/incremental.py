@@ -0,0 +1,63 @@
+"""
+Parse time of a large generated C source after one function in the middle
+is edited: a full parse, against an incremental.IncrementalParser that has
+the ASTs of the source before the edit, in memory and loaded from a cache
+file.  Lexing is not timed.
+
+    $ python -m bench.incremental [functions]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from hw03 import incremental
+from bench import corpus
+
+def timed(func, *args):
+    start = time.clock()
+    result = func(*args)
+    return time.clock() - start, result
+
+if __name__ == '__main__':
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    data = corpus.generate(functions=functions, statements=20)
+    middle = data.index('int f%d(' % (functions // 2))
+    edited = data[:middle] + data[middle:].replace(' = ', ' = 1 + ', 1)
+    tokens = clex.lexer.clone().tokenize_all(data)
+    edited_tokens = clex.lexer.clone().tokenize_all(edited)
+    print '%d functions, %d lines, %d tokens' % (functions, data.count('\n'), len(tokens))
+
+    elapsed, full = timed(cparse.parser.parse, edited_tokens)
+    print 'full parse                %8.3f s' % elapsed
+
+    directory = tempfile.mkdtemp()
+    try:
+        reparser = incremental.IncrementalParser(os.path.join(directory, 'asts.pickle'))
+        elapsed, decls = timed(reparser.parse, tokens)
+        print 'incremental, no cache     %8.3f s' % elapsed
+        elapsed, _ = timed(reparser.save)
+        print 'save cache                %8.3f s  %d KB' % (
+            elapsed, os.path.getsize(reparser.cache_file) // 1024)
+
+        reparser.parsed = reparser.reused = 0
+        elapsed, decls = timed(reparser.parse, edited_tokens)
+        assert decls == full
+        print 'incremental, in memory    %8.3f s  %d parsed, %d reused' % (
+            elapsed, reparser.parsed, reparser.reused)
+
+        reparser = incremental.IncrementalParser(reparser.cache_file)
+        elapsed, _ = timed(reparser.load)
+        print 'load cache                %8.3f s' % elapsed
+        elapsed, decls = timed(reparser.parse, edited_tokens)
+        assert decls == full
+        print 'incremental, from file    %8.3f s  %d parsed, %d reused' % (
+            elapsed, reparser.parsed, reparser.reused)
+        elapsed, _ = timed(reparser.save)
+        print 'save cache after the edit %8.3f s' % elapsed
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,42 @@
+"""
+Compare the tokens/sec of the regular expression driven Lexer.token() with
+the DFA backend on a synthetic C source.
+
+    $ python -m bench.lex_dfa [functions]
+"""
+
+import sys
+import time
+
+from hw03 import clex
+from bench import corpus
+
+def count_tokens(lexer, data):
+    lexer.input(data)
+    token = lexer.token
+    n = 0
+    while token():
+        n += 1
+    return n
+
+def best_of(lexer, data, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        n = count_tokens(lexer, data)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return n, best
+
+if __name__ == '__main__':
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    data = corpus.generate(functions=functions, statements=50)
+
+    start = time.time()
+    dfa_lexer = clex.dfa_lexer()
+    print 'DFA build time: %.3fs (%d states)' % (time.time() - start, len(dfa_lexer.lexdfa[0]))
+
+    for name, lexer in [('Lexer.token', clex.lexer.clone()), ('DFALexer.token', dfa_lexer)]:
+        n, elapsed = best_of(lexer, data)
+        print '%-16s %8d tokens %8.3fs %10.0f tokens/sec' % (name, n, elapsed, n / elapsed)
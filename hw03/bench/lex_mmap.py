@@ -0,0 +1,43 @@
+"""
+Time and peak memory of the gen_asm front end on a large generated C file,
+either reading it into a string and running the remove_comment() and
+remove_blank() passes before lexing ('read', the former three-stage
+pipeline) or memory-mapping it and lexing the mapping directly, comments
+and blank lines included ('mmap').
+
+    $ python -m bench.lex_mmap [read|mmap] [lines]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from hw03 import clex
+from hw03.preprocess import read_source, remove_blank, remove_comment
+from bench import corpus
+from bench.parse_memory import peak_rss_mb
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'mmap'
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    fd, path = tempfile.mkstemp(suffix='.c')
+    os.write(fd, corpus.generate(functions=max(1, lines // 61), statements=50))
+    os.close(fd)
+    before = peak_rss_mb()
+
+    try:
+        start = time.time()
+        with open(path) as f:
+            if mode == 'read':
+                s = remove_blank(remove_comment(f.read()))
+            else:
+                s = read_source(f)
+            tokens = clex.lexer.clone().tokenize_all(s)
+        elapsed = time.time() - start
+    finally:
+        os.remove(path)
+
+    print '%d tokens from %d bytes' % (len(tokens), len(s))
+    print '%-6s time  %8.2fs' % (mode, elapsed)
+    print 'peak RSS     %8.1f MB (%.1f MB before)' % (peak_rss_mb(), before)
@@ -0,0 +1,29 @@
+"""
+Wall clock time of lexing a multi-megabyte generated C source with
+parallel.tokenize() in 1, 2, 4... processes, up to the number of CPUs.
+
+    $ python -m bench.lex_parallel [lines] [max processes]
+"""
+
+import multiprocessing
+import sys
+import time
+
+from hw03 import parallel
+from bench import corpus
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    data = corpus.generate(functions=max(1, lines // 61), statements=50)
+    print '%d bytes, %d CPUs' % (len(data), multiprocessing.cpu_count())
+
+    processes = 1
+    serial = None
+    while processes <= limit:
+        start = time.time()
+        tokens = parallel.tokenize(data, processes=processes, min_piece=1 << 16)
+        elapsed = time.time() - start
+        serial = serial or elapsed
+        print '%2d processes %8d tokens %8.2fs  speedup %.2f' % (processes, len(tokens), elapsed, serial / elapsed)
+        processes *= 2
@@ -0,0 +1,42 @@
+"""
+Stream the tokens of a large generated C file through clex.tokenize_file()
+and report the throughput and peak memory, which should not grow with the
+size of the file.
+
+    $ python -m bench.lex_stream [lines] [blocksize]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from hw03 import clex
+from bench import corpus
+from bench.parse_memory import peak_rss_mb
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    blocksize = int(sys.argv[2]) if len(sys.argv) > 2 else 1 << 20
+    fd, path = tempfile.mkstemp(suffix='.c')
+    # Write the corpus a piece at a time so that it is never in memory whole
+    for i in range(0, lines, 10000):
+        os.write(fd, corpus.generate(functions=max(1, min(10000, lines - i) // 61),
+                                     statements=50, seed=i))
+    os.close(fd)
+    before = peak_rss_mb()
+
+    try:
+        start = time.time()
+        n = 0
+        with open(path) as f:
+            for tok in clex.tokenize_file(f, blocksize):
+                n += 1
+        elapsed = time.time() - start
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+    print '%d tokens from %d bytes in %d byte blocks' % (n, size, blocksize)
+    print 'time  %8.2fs %10.0f tokens/sec' % (elapsed, n / elapsed)
+    print 'peak RSS     %8.1f MB (%.1f MB before)' % (peak_rss_mb(), before)
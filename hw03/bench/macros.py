@@ -0,0 +1,42 @@
+"""
+Time the macro preprocessor on a generated source that uses a few nested
+function-like macros many times, with and without the expansion cache.
+
+    $ python -m bench.macros [uses]
+"""
+
+import sys
+import time
+
+from hw03 import clex
+from hw03 import macros
+
+DEFINES = '''\
+#define SQ(x) ((x) * (x))
+#define CUBE(x) (SQ(x) * (x))
+#define POLY(x, y) (CUBE(x) + 3 * SQ(x) * (y) + CUBE(y))
+'''
+
+def generate(uses):
+    lines = [DEFINES, 'int f(int a, int b, int c) {']
+    for i in range(uses):
+        lines.append('  c = POLY(a, b) + POLY(b, %s);' % ['a', 'c', '1'][i % 3])
+    lines.append('  return c;')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def run(data, memoize):
+    pp = macros.Preprocessor(clex.lexer.clone(), memoize)
+    pp.input(data)
+    start = time.clock()
+    n = 0
+    while pp.token():
+        n += 1
+    return n, time.clock() - start
+
+if __name__ == '__main__':
+    uses = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    data = generate(uses)
+    for memoize in [False, True]:
+        n, elapsed = run(data, memoize)
+        print 'memoize=%-5s %8d tokens %8.2fs %10.0f tokens/sec' % (memoize, n, elapsed, n / elapsed)
@@ -0,0 +1,55 @@
+"""
+Time to fail on a large malformed C source, a generated one with a syntax
+error in every statement: a parse that reports every error, against parses
+in cparse.collect_errors() that stop at the error budget, on a lazily lexed
+source and on token arrays (which includes lexing all of it).
+
+    $ python -m bench.parse_errors [functions] [max_errors]
+"""
+
+import os
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+
+def timed(func, *args):
+    start = time.clock()
+    try:
+        func(*args)
+    except cparse.TooManyErrors:
+        pass
+    return time.clock() - start
+
+def parse_source(data):
+    return cparse.parser.parse(data, lexer=clex.lexer.clone())
+
+def parse_tokens(data):
+    return cparse.parser.parse(clex.lexer.clone().tokenize_all(data))
+
+if __name__ == '__main__':
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_errors = int(sys.argv[2]) if len(sys.argv) > 2 else cparse.MAX_ERRORS
+    data = corpus.generate(functions=functions, statements=20).replace(' = ', ' = = ')
+    cparse.get_parser()
+    print '%d functions, %d lines, %d KB' % (functions, data.count('\n'), len(data) // 1024)
+
+    with cparse.collect_errors(None) as errors:
+        elapsed = timed(parse_source, data)
+    print 'all errors            %8.3f s  %d errors' % (elapsed, len(errors))
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        elapsed = timed(parse_source, data)
+    finally:
+        sys.stdout = stdout
+    print 'all errors, printed   %8.3f s' % elapsed
+
+    with cparse.collect_errors(max_errors) as errors:
+        elapsed = timed(parse_source, data)
+    print 'budget, source        %8.3f s  %d errors' % (elapsed, len(errors))
+    with cparse.collect_errors(max_errors) as errors:
+        elapsed = timed(parse_tokens, data)
+    print 'budget, tokens        %8.3f s  %d errors' % (elapsed, len(errors))
@@ -0,0 +1,31 @@
+"""
+Parse time of the generated parser module (yacc(parsermodule=...)) against
+the generic parseopt_notrack() loop, on the same list of tokens.
+
+    $ python -m bench.parse_generated [functions]
+"""
+
+import sys
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+from bench.suite import best_time
+
+if __name__ == '__main__':
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    data = corpus.generate(functions=functions)
+    lexer = clex.lexer.clone()
+    lexer.input(data)
+    tokens = list(lexer) + [None]
+
+    parser = cparse.parser
+    generic = best_time(lambda: parser.parseopt_notrack(lexer=lexer, tokenfunc=iter(tokens).next), 5)
+    generated = best_time(lambda: parser.parse(lexer=lexer, tokenfunc=iter(tokens).next), 5)
+    assert parser.parse(lexer=lexer, tokenfunc=iter(tokens).next) == \
+        parser.parseopt_notrack(lexer=lexer, tokenfunc=iter(tokens).next)
+
+    print '%d tokens' % (len(tokens) - 1)
+    print 'parseopt_notrack  %.3f s  %8.0f tokens/sec' % (generic, (len(tokens) - 1) / generic)
+    print 'generated module  %.3f s  %8.0f tokens/sec  (%.2fx)' % (
+        generated, (len(tokens) - 1) / generated, generic / generated)
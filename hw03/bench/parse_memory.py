@@ -0,0 +1,42 @@
+"""
+Peak memory and time of lexing and parsing a large generated C source with
+LexToken objects.  The 'tokens' mode keeps every LexToken of the input alive
+in a list; the 'parse' mode runs parser.parse(text).
+
+    $ python -m bench.parse_memory [tokens|parse] [lines]
+"""
+
+import gc
+import resource
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'parse'
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    data = corpus.generate(functions=max(1, lines // 61), statements=50)
+    gc.collect()
+    before = peak_rss_mb()
+
+    start = time.time()
+    lexer = clex.lexer.clone()
+    if mode == 'tokens':
+        lexer.input(data)
+        result = list(lexer)
+        what = 'tokens'
+    else:
+        result = cparse.parser.parse(data, lexer=lexer)
+        what = 'top-level declarations'
+    elapsed = time.time() - start
+
+    print '%d lines, %d %s' % (data.count('\n'), len(result), what)
+    print '%-6s time  %8.2fs' % (mode, elapsed)
+    print 'peak RSS     %8.1f MB (%.1f MB before)' % (peak_rss_mb(), before)
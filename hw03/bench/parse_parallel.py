@@ -0,0 +1,40 @@
+"""
+Wall clock and CPU time of parsing a multi-megabyte generated C source with
+parallel.parse() in 1, 2, 4... processes, up to the number of CPUs.  The CPU
+time includes the worker processes, so it shows the cost of cutting the
+source and sending the ASTs back, which the workers share on several CPUs.
+
+    $ python -m bench.parse_parallel [lines] [max processes]
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+from hw03 import cparse
+from hw03 import parallel
+from bench import corpus
+
+def cpu_time():
+    t = os.times()
+    return t[0] + t[1] + t[2] + t[3]
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    data = corpus.generate(functions=max(1, lines // 61), statements=50)
+    print '%d bytes, %d CPUs' % (len(data), multiprocessing.cpu_count())
+    cparse.get_parser()
+
+    processes = 1
+    serial = None
+    while processes <= limit:
+        start, cpu = time.time(), cpu_time()
+        decls = parallel.parse(data, processes=processes, min_piece=1 << 16)
+        elapsed, cpu = time.time() - start, cpu_time() - cpu
+        serial = serial or elapsed
+        print '%2d processes %6d declarations %8.2fs  CPU %8.2fs  speedup %.2f' % (
+            processes, len(decls), elapsed, cpu, serial / elapsed)
+        del decls
+        processes *= 2
@@ -0,0 +1,61 @@
+"""
+Profile the cparse grammar on a generated C source with
+yacc.ParseProfile: the productions that take the most time in their grammar
+functions, the share of the unit rules from expression down to
+primary_expression, and the parse time with and without profiling.  The
+report can be written to a JSON file.  State numbers are those of the
+parser-<hash>.out file next to the parse tables in the cache directory.
+
+    $ python -m bench.parse_profile [functions] [report.json]
+"""
+
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from hw03.ply import yacc
+from bench import corpus
+
+# The chain of single-symbol rules an operand goes through
+UNIT_CHAIN = [
+    'expression -> additive_expression',
+    'additive_expression -> multiplicative_expression',
+    'multiplicative_expression -> unary_expression',
+    'unary_expression -> postfix_expression',
+    'postfix_expression -> primary_expression',
+]
+
+def timed(func, *args, **kwargs):
+    start = time.clock()
+    func(*args, **kwargs)
+    return time.clock() - start
+
+if __name__ == '__main__':
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    data = corpus.generate(functions=functions, statements=20)
+    tokens = clex.lexer.clone().tokenize_all(data)
+    parser = cparse.get_parser()
+    print '%d functions, %d lines, %d tokens' % (functions, data.count('\n'), len(tokens))
+
+    print 'parse                 %8.3f s' % timed(parser.parse, tokens)
+    profile = yacc.ParseProfile(parser)
+    print 'parse, profiled       %8.3f s' % timed(parser.parse, tokens, profile=profile)
+
+    report = profile.report()
+    print '%d reductions, %.3f s in grammar functions' % (report['reductions'], report['action_time'])
+    print
+    print '%-75s %10s %8s %6s' % ('production', 'reductions', 'time', '%')
+    for p in report['productions'][:15]:
+        print '%-75s %10d %8.3f %5.1f%%' % (p['rule'], p['reductions'], p['time'],
+                                           100 * p['time'] / report['action_time'])
+    chain = [p for p in report['productions'] if p['rule'] in UNIT_CHAIN]
+    print
+    print 'unit chain expression -> primary_expression: %d reductions, %.3f s, %.1f%%' % (
+        sum(p['reductions'] for p in chain), sum(p['time'] for p in chain),
+        100 * sum(p['time'] for p in chain) / report['action_time'])
+    print 'busiest states: %s' % ', '.join('%(state)d (%(actions)d)' % s for s in report['states'][:8])
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w') as f:
+            profile.dump(f)
@@ -0,0 +1,61 @@
+"""
+Parse time against the number of statements in a function body, from 1k to
+1M statements by default.  The list-building rules append to the list of
+their left operand, so the time per statement should stay flat as the body
+grows.  With --copy they build a new list on each reduction instead, as they
+used to, which makes the time per statement grow with the body.
+
+    $ python -m bench.parse_scaling [--copy] [statements ...]
+"""
+
+import argparse
+import gc
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+
+LIST_RULES = ['p_program_2', 'p_declaration_list_2', 'p_declarator_list_2',
+              'p_parameter_list_2', 'p_instruction_list_2', 'p_argument_expression_list_2']
+
+def copying(p):
+    # The rule as it was: t[0] = t[1] + [t[n]]
+    last = p.len
+    def rule(t):
+        t[0] = t[1] + [t[last]]
+    return rule
+
+def parse_time(tokens):
+    gc.collect()
+    start = time.clock()
+    cparse.parser.parse(tokens)
+    return time.clock() - start
+
+def main(argv):
+    ap = argparse.ArgumentParser(description='Parse time against function body size')
+    ap.add_argument('--copy', action='store_true', help='copy lists on each reduction')
+    ap.add_argument('sizes', nargs='*', type=int, default=[1000, 10000, 100000, 1000000])
+    opts = ap.parse_args(argv)
+
+    productions = cparse.parser.productions
+    saved = [p.callable for p in productions]
+    if opts.copy:
+        for p in productions:
+            if p.callable and p.callable.__name__ in LIST_RULES:
+                p.callable = copying(p)
+    try:
+        for n in opts.sizes:
+            data = corpus.generate(functions=1, statements=n, depth=1)
+            tokens = clex.lexer.clone().tokenize_all(data)
+            elapsed = parse_time(tokens)
+            print '%8d statements %9d tokens %8.2f s %6.2f us/statement' % (
+                n, len(tokens), elapsed, 1e6 * elapsed / n)
+            sys.stdout.flush()
+    finally:
+        for p, func in zip(productions, saved):
+            p.callable = func
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
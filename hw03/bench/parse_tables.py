@@ -0,0 +1,52 @@
+"""
+Throughput of cparse.parser.parse() on token arrays, which reads the packed
+integer parse tables, and the memory taken by the dictionary and the packed
+forms of the tables.  With --engine every grammar action is replaced by one
+that does nothing, which leaves the time of the parsing loop itself.
+
+    $ python -m bench.parse_tables [--engine] [functions]
+"""
+
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+from bench.suite import best_time, count_reductions
+
+def table_size(action, goto):
+    size = sys.getsizeof(action) + sys.getsizeof(goto)
+    for table in [action, goto]:
+        for row in table.values():
+            size += sys.getsizeof(row)
+    return size
+
+def nothing(p):
+    pass
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    engine = '--engine' in args
+    if engine:
+        args.remove('--engine')
+    functions = int(args[0]) if args else 200
+    data = corpus.generate(functions=functions)
+    tokens = clex.lexer.clone().tokenize_all(data)
+    reductions = count_reductions(list(tokens))
+
+    parser = cparse.parser
+    if engine:
+        for p in parser.productions:
+            if p.callable:
+                p.callable = nothing
+    elapsed = best_time(lambda: parser.parse(tokens), 5)
+    print '%d tokens, %d reductions: %.3f s, %.0f tokens/sec, %.0f reductions/sec' % (
+        len(tokens), reductions, elapsed, len(tokens) / elapsed, reductions / elapsed)
+
+    print 'dict tables:   %6d bytes' % table_size(parser.action, parser.goto)
+    if hasattr(parser, 'packed_tables'):
+        packed = parser.packed_tables()
+        arrays = [packed.action_base, packed.action_table, packed.action_check,
+                  packed.goto_base, packed.goto_table, packed.goto_check, packed.lhs, packed.defaults]
+        print 'packed tables: %6d bytes' % sum(sys.getsizeof(a) for a in arrays)
@@ -0,0 +1,47 @@
+"""
+Start-up time of processes building the cparse parser, with the lexer and
+parser tables built into an empty cache directory and read from it.  The
+concurrent case starts several processes together on an empty cache; one of
+them builds the tables and the others wait for them.
+
+    $ python -m bench.startup [processes] [repeat]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = 'from hw03 import cparse; cparse.get_parser()'
+
+def start(processes, cachedir):
+    env = dict(os.environ, PLY_CACHE_DIR=cachedir)
+    begin = time.time()
+    running = [subprocess.Popen([sys.executable, '-c', SCRIPT], env=env,
+                                stderr=open(os.devnull, 'w'))
+               for i in range(processes)]
+    for p in running:
+        p.wait()
+    return time.time() - begin
+
+def best(repeat, processes, warm):
+    times = []
+    for i in range(repeat):
+        cachedir = tempfile.mkdtemp()
+        try:
+            if warm:
+                start(1, cachedir)
+            times.append(start(processes, cachedir))
+        finally:
+            shutil.rmtree(cachedir)
+    return min(times)
+
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print 'cold cache, 1 process    %6.3f s' % best(repeat, 1, False)
+    print 'warm cache, 1 process    %6.3f s' % best(repeat, 1, True)
+    print 'cold cache, %2d processes %6.3f s' % (processes, best(repeat, processes, False))
+    print 'warm cache, %2d processes %6.3f s' % (processes, best(repeat, processes, True))
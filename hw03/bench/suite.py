@@ -0,0 +1,141 @@
+"""
+Benchmark suite for the lexer and parser.
+
+Each case generates a synthetic C source that stresses one axis of the
+corpus generator (functions, statements per function, expression depth and
+identifiers) and measures the tokens/sec of clex.lexer and the reductions/sec
+of cparse.parser on it, using the best CPU time of several runs.  The results
+are compared with a baseline file and cases that got slower by more than the
+threshold are flagged as regressions.
+
+    $ python -m bench.suite --save        # record bench/baseline.json
+    $ python -m bench.suite               # compare with it
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from hw03 import clex
+from hw03 import cparse
+from bench import corpus
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Case name -> corpus.generate() arguments.  The sources are of similar sizes.
+CASES = [
+    ('default',     dict(functions=40, statements=20, depth=3, identifiers=8)),
+    ('functions',   dict(functions=200, statements=2, depth=3, identifiers=4)),
+    ('statements',  dict(functions=2, statements=400, depth=3, identifiers=8)),
+    ('depth',       dict(functions=10, statements=20, depth=6, identifiers=8)),
+    ('identifiers', dict(functions=20, statements=20, depth=3, identifiers=64)),
+]
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.clock()
+        func()
+        elapsed = time.clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def lex(data):
+    lexer = clex.lexer.clone()
+    lexer.input(data)
+    return list(lexer)
+
+def parse(tokens):
+    return cparse.parser.parse(lexer=clex.lexer.clone(), tokenfunc=iter(tokens + [None]).next)
+
+def count_reductions(tokens):
+    """
+    Parse tokens once with every grammar rule wrapped in a counter and return
+    the number of reductions.
+    """
+    count = [0]
+    def counting(func):
+        def rule(p):
+            count[0] += 1
+            func(p)
+        return rule
+
+    productions = cparse.parser.productions
+    saved = [p.callable for p in productions]
+    try:
+        for p in productions:
+            if p.callable:
+                p.callable = counting(p.callable)
+        parse(tokens)
+    finally:
+        for p, func in zip(productions, saved):
+            p.callable = func
+    return count[0]
+
+def run_case(args, repeat):
+    data = corpus.generate(**args)
+    tokens = lex(data)
+    lex_time = best_time(lambda: lex(data), repeat)
+    parse_time = best_time(lambda: parse(tokens), repeat)
+    reductions = count_reductions(tokens)
+    return {
+        'tokens': len(tokens),
+        'reductions': reductions,
+        'tokens_per_sec': len(tokens) / lex_time,
+        'reductions_per_sec': reductions / parse_time,
+    }
+
+def compare(name, result, baseline, threshold):
+    flags = []
+    if name in baseline and baseline[name]['tokens'] != result['tokens']:
+        flags.append('corpus changed since the baseline')
+    for metric in ['tokens_per_sec', 'reductions_per_sec']:
+        old = baseline.get(name, {}).get(metric)
+        if not old:
+            continue
+        change = result[metric] / old - 1
+        if change < -threshold:
+            flags.append('REGRESSION %s %+.1f%%' % (metric, 100 * change))
+        elif change > threshold:
+            flags.append('faster %s %+.1f%%' % (metric, 100 * change))
+    return flags
+
+def main(argv):
+    ap = argparse.ArgumentParser(description='Lexer and parser benchmark suite')
+    ap.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    ap.add_argument('--baseline', default=BASELINE, help='baseline file (default: %(default)s)')
+    ap.add_argument('--repeat', type=int, default=5, help='runs per measurement, the best is kept')
+    ap.add_argument('--threshold', type=float, default=0.10,
+                    help='relative slowdown reported as a regression (default: %(default)s)')
+    ap.add_argument('cases', nargs='*', help='cases to run (default: all)')
+    opts = ap.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(opts.baseline):
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = 0
+    for name, args in CASES:
+        if opts.cases and name not in opts.cases:
+            continue
+        result = results[name] = run_case(args, opts.repeat)
+        flags = compare(name, result, baseline, opts.threshold)
+        regressions += sum(1 for flag in flags if flag.startswith('REGRESSION'))
+        print '%-12s %7d tokens %10.0f tokens/sec %7d reductions %10.0f reductions/sec  %s' % (
+            name, result['tokens'], result['tokens_per_sec'],
+            result['reductions'], result['reductions_per_sec'], ', '.join(flags))
+
+    if opts.save:
+        baseline.update(results)
+        with open(opts.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print 'Baseline saved to %s' % opts.baseline
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
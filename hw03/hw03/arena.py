@@ -0,0 +1,177 @@
+"""
+A flat AST for very large programs.
+
+An Arena stores the nodes of a tree in four typed arrays indexed by node
+number: the node kind, its first child, its next sibling and the index of its
+literal (an identifier, constant, type name or comparison operator) in a
+table shared by equal literals.  The children of a node are its node fields,
+in order; a list field is a LIST node whose children are the list items and a
+field that is None a NIL node.  A node costs 13 bytes instead of a node object
+and its share of the lists.
+
+An Arena has a constructor for each class in the nodes module, with the same
+arguments, that adds a node and returns its number, so cparse can build it in
+place of node objects (see cparse.parse_flat()).  Code generation walks it
+through ArenaNode views, which have the kind and field attributes of the node
+objects.
+"""
+
+from array import array
+
+import nodes
+
+LIST = len(nodes.TAGS)      # Kinds that only occur in an arena
+NIL = LIST + 1
+
+# Kind -> the field of the node class that holds a literal
+LITERALS = {
+    nodes.TYPE:     'name',
+    nodes.ID:       'name',
+    nodes.COND:     'op',
+    nodes.ICONST:   'value',
+    nodes.FCONST:   'value',
+    nodes.SCONST:   'value',
+}
+
+class Arena(object):
+    def __init__(self):
+        self.kinds = array('B')
+        self.first = array('i')
+        self.next = array('i')
+        self.values = array('i')
+        self.literals = []
+        self.literal_ids = {}
+        self.decls = array('i')     # Top-level declarations
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def literal(self, value):
+        i = self.literal_ids.get(value)
+        if i is None:
+            i = self.literal_ids[value] = len(self.literals)
+            self.literals.append(value)
+        return i
+
+    def add(self, kind, value, children):
+        """
+        Add a node and return its number. children are node numbers, lists of
+        them or None.
+        """
+        first = prev = -1
+        for c in children:
+            if c is None:
+                c = self.add(NIL, -1, ())
+            elif c.__class__ is list:
+                c = self.add(LIST, -1, c)
+            if prev < 0:
+                first = c
+            else:
+                self.next[prev] = c
+            prev = c
+        i = len(self.kinds)
+        self.kinds.append(kind)
+        self.first.append(first)
+        self.next.append(-1)
+        self.values.append(value)
+        return i
+
+    def children(self, i):
+        c = self.first[i]
+        while c >= 0:
+            yield c
+            c = self.next[c]
+
+    def get(self, i):
+        """
+        Return node i as an ArenaNode, a list of them for a LIST node and None
+        for a NIL node.
+        """
+        kind = self.kinds[i]
+        if kind == LIST:
+            return [self.get(c) for c in self.children(i)]
+        if kind == NIL:
+            return None
+        return ArenaNode(self, i, kind)
+
+    def field(self, i, kind, name):
+        position = _positions[kind].get(name)
+        if position is None:
+            raise AttributeError(name)
+        if position < 0:
+            return self.literals[self.values[i]]
+        c = self.first[i]
+        for n in xrange(position):
+            c = self.next[c]
+        return self.get(c)
+
+    def set_declarations(self, decls):
+        self.decls = array('i', decls)
+
+    def declarations(self):
+        return [self.get(i) for i in self.decls]
+
+    def tree(self, i=None):
+        """
+        Convert node i, or the list of top-level declarations by default, to
+        node objects.
+        """
+        if i is None:
+            return [self.tree(d) for d in self.decls]
+        kind = self.kinds[i]
+        if kind == NIL:
+            return None
+        children = [self.tree(c) for c in self.children(i)]
+        if kind == LIST:
+            return children
+        if kind in LITERALS:
+            children.insert(nodes.CLASSES[kind].fields.index(LITERALS[kind]),
+                            self.literals[self.values[i]])
+        return nodes.CLASSES[kind](*children)
+
+class ArenaNode(object):
+    """
+    View of node index of an Arena. Fields are looked up on access.
+    """
+    __slots__ = ('arena', 'index', 'kind')
+
+    def __init__(self, arena, index, kind):
+        self.arena = arena
+        self.index = index
+        self.kind = kind
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.arena.field(self.index, self.kind, name)
+
+    def __reduce__(self):
+        return (ArenaNode, (self.arena, self.index, self.kind))
+
+    def __repr__(self):
+        return '<%s node %d>' % (nodes.CLASSES[self.kind].__name__, self.index)
+
+# Kind -> field name -> child position, or -1 for the literal
+_positions = []
+
+def _constructor(cls):
+    kind = cls.kind
+    literal = LITERALS.get(kind)
+    if literal is None:
+        def build(self, *args):
+            return self.add(kind, -1, args)
+    else:
+        position = cls.fields.index(literal)
+        def build(self, *args):
+            args = list(args)
+            return self.add(kind, self.literal(args.pop(position)), args)
+    build.__name__ = cls.__name__
+    return build
+
+for cls in nodes.CLASSES:
+    literal = LITERALS.get(cls.kind)
+    positions = dict((name, n) for n, name in enumerate(f for f in cls.fields if f != literal))
+    if literal:
+        positions[literal] = -1
+    _positions.append(positions)
+    setattr(Arena, cls.__name__, _constructor(cls))
@@ -4,9 +4,12 @@
 # A lexer for ANSI C.
 # ----------------------------------------------------------------------
 
+import re
 import sys
 
 import ply.lex as lex
+import ply.cache as cache
+import ply.dfa as dfa
 
 # Reserved words
 reserved = (
@@ -36,14 +39,10 @@ tokens = reserved + (
 
     )
 
-# Completely ignored characters
-t_ignore           = ' \t\x0c'
+# Completely ignored characters. Newlines are not counted as they are lexed,
+# line numbers are looked up in lexer.lineindex() when they are needed.
+t_ignore           = ' \t\x0c\n'
 
-# Newlines
-def t_NEWLINE(t):
-    r'\n+'
-    t.lexer.lineno += t.value.count("\n")
-    
 # Operators
 t_PLUS             = r'\+'
 t_MINUS            = r'-'
@@ -86,9 +85,33 @@ reserved_map = { }
 for r in reserved:
     reserved_map[r.lower()] = r
 
+# Identifier names are interned as they are lexed. Every distinct name is
+# a single Identifier object, and its integer id indexes the names table.
+class Identifier(str):
+    """
+    An interned identifier. It compares and hashes like the plain name, and
+    later phases can key their tables on the small integer id instead.
+    """
+    def __reduce__(self):
+        return (intern_name, (str(self),))
+
+names = []          # id -> Identifier
+name_ids = { }      # name -> Identifier
+
+def intern_name(name):
+    ident = name_ids.get(name)
+    if ident is None:
+        ident = Identifier(name)
+        ident.id = len(names)
+        names.append(ident)
+        name_ids[name] = ident
+    return ident
+
 def t_ID(t):
     r'[A-Za-z_][\w_]*'
     t.type = reserved_map.get(t.value,"ID")
+    if t.type == "ID":
+        t.value = intern_name(t.value)
     return t
 
 # Integer literal
@@ -103,19 +126,70 @@ t_SCONST = r'\"([^\\\n]|(\\.))*?\"'
 # Comments
 def t_comment(t):
     r' /\*(.|\n)*?\*/'
-    t.lineno += t.value.count('\n')
+    pass
+
+def t_linecomment(t):
+    r'//.*'
+    pass
+
+# Character literals are not part of the language and are skipped
+def t_charliteral(t):
+    r"'(\\(.|\n)|[^\\'])*'"
+    pass
 
-# Preprocessor directive (ignored)
+# Preprocessor directive, continued on the next line after a backslash at the
+# end of a line. Ignored, unless the lexer has a directives list (see
+# macros.Preprocessor), which then receives its position and text.
 def t_preprocessor(t):
-    r'\#(.)*?\n'
-    t.lineno += 1
+    r'\#([^\\\n]|\\(.|\n))*\n'
+    directives = getattr(t.lexer, 'directives', None)
+    if directives is not None:
+        directives.append((t.lexpos, t.value))
     
 def t_error(t):
-    print "Illegal character %s" % repr(t.value[0])
+    print "Illegal character %s at line %d" % (repr(t.value[0]), t.lexer.lineindex().lineno(t.lexpos))
     t.lexer.skip(1)
     
-lexer = lex.lex(optimize=1)
+# The text that the rules above may match across a newline, or past one when
+# it is not closed (comments, character literals and directives), and the
+# strings, which may contain the start of such text. Unclosed text is matched
+# to the end of the input. Lexer.relex() restarts at newlines outside of it.
+opaque = re.compile(r'"(?:[^\\\n]|\\.)*?"|/\*(?:.|\n)*?(?:\*/|\Z)|//.*|'
+                    r'\'(?:\\(?:.|\n)|[^\\\'])*(?:\'|\Z)|\#(?:\\\n|.)*?(?:\n|\Z)')
+
+_lexer = None
+
+def get_lexer():
+    """
+    Return the lexer, reading its table from the cache on the first call.
+    """
+    global _lexer
+    if _lexer is None:
+        _lexer = lex.lex(optimize=1, cachedir=cache.CACHE_DIR)
+        _lexer.lexopaque = opaque
+    return _lexer
+
+lexer = cache.Lazy(get_lexer)
+
+_dfa_lexer = None
+
+def dfa_lexer():
+    """
+    Return a clone of the lexer driven by the table-driven DFA backend.
+    The automaton is compiled on the first call and shared afterwards.
+    """
+    global _dfa_lexer
+    if _dfa_lexer is None:
+        _dfa_lexer = dfa.build(get_lexer())
+    return _dfa_lexer.clone()
+
+def tokenize_file(f, blocksize=1 << 20):
+    """
+    Generate the tokens of file f, reading it blocksize bytes at a time so
+    that sources larger than memory can be lexed.
+    """
+    return dfa_lexer().stream(iter(lambda: f.read(blocksize), ''))
 
 if __name__ == "__main__":
-    lex.runmain(lexer)
+    lex.runmain(get_lexer())
 
@@ -1,15 +1,21 @@
+import contextlib
 import sys
 import pprint
 
 import clex
 import ply.yacc as yacc
+import ply.cache as cache
+import arena
+import nodes
 
 import preprocess
-from preprocess import remove_blank
-from preprocess import remove_comment
+from preprocess import input_stripped
 
 pp = pprint.PrettyPrinter(indent=4, width=120)
 
+# Constructors of the AST nodes, the nodes module or an arena.Arena
+build = nodes
+
 # token map
 tokens = clex.tokens
 
@@ -22,9 +28,20 @@ def p_program_1(t):
 
 def p_program_2(t):
     'program : program external_declaration'
-    t[0] = t[1] + [t[2]]
+    t[1].append(t[2])
+    t[0] = t[1]
     return t[0]
 
+def p_program_error(t):
+    '''
+    program : error SEMI
+            | error RBRACE
+            | program error SEMI
+            | program error RBRACE
+            '''
+    # Skip to the end of a malformed external declaration
+    t[0] = t[1] if len(t) == 4 else []
+
 # external-declaration:
 
 def p_external_declaration_1(t):
@@ -37,17 +54,17 @@ def p_external_declaration_2(t):
 
 def p_external_declaration_3(t):
     'external_declaration : EXTERN declaration'
-    t[0] = 'EXTERN', t[2]
+    t[0] = build.Extern(t[2])
 
 # function-definition:
 def p_function_definition(t):
     'function_definition : type function_declarator compound_instruction'
-    t[0] = 'FUNC_DEF', t[1], t[2], t[3]
+    t[0] = build.FuncDef(t[1], t[2], t[3])
 
 # declaration:
 def p_declaration(t):
     'declaration : type declarator_list SEMI'
-    t[0] = 'VAR_DEC', t[1], t[2]
+    t[0] = build.VarDec(t[1], t[2])
 
 # declaration-list:
 def p_declaration_list_1(t):
@@ -56,7 +73,8 @@ def p_declaration_list_1(t):
 
 def p_declaration_list_2(t):
     'declaration_list : declaration_list declaration '
-    t[0] = t[1] + [t[2]]
+    t[1].append(t[2])
+    t[0] = t[1]
 
 
 # type-specifier:
@@ -65,7 +83,7 @@ def p_type(t):
             | FLOAT
             | STRING
                       '''
-    t[0] = 'TYPE', t[1]
+    t[0] = build.Type(t[1])
 
 # init-declarator-list:
 
@@ -75,7 +93,8 @@ def p_declarator_list_1(t):
 
 def p_declarator_list_2(t):
     'declarator_list : declarator_list COMMA declarator'
-    t[0] = t[1] + [t[3]]
+    t[1].append(t[3])
+    t[0] = t[1]
 
 # init-declarator
 
@@ -85,21 +104,21 @@ def p_declarator_1(t):
 
 def p_declarator_2(t):
     'declarator : function_declarator EQUALS expression'
-    t[0] = 'INIT_ASSIGN', t[1], t[3]
+    t[0] = build.InitAssign(t[1], t[3])
 
 # declarator:
 
 def p_function_declarator_1(t):
     'function_declarator : ID'
-    t[0] = 'ID', t[1]
+    t[0] = build.Id(t[1])
 
 def p_function_declarator_2(t):
     'function_declarator : ID LPAREN parameter_list RPAREN '
-    t[0] = ('ID', t[1]), t[3]
+    t[0] = build.FuncDeclarator(build.Id(t[1]), t[3])
 
 def p_function_declarator_3(t):
     'function_declarator : ID LPAREN RPAREN '
-    t[0] = ('ID', t[1]), None
+    t[0] = build.FuncDeclarator(build.Id(t[1]), None)
 
 def p_parameter_list_1(t):
     'parameter_list : parameter_declaration'
@@ -107,12 +126,13 @@ def p_parameter_list_1(t):
 
 def p_parameter_list_2(t):
     'parameter_list : parameter_list COMMA parameter_declaration'
-    t[0] = t[1] + [t[3]]
+    t[1].append(t[3])
+    t[0] = t[1]
 
 # parameter-declaration:
 def p_parameter_declaration(t):
     'parameter_declaration : type function_declarator'
-    t[0] = t[1], t[2]
+    t[0] = build.Param(t[1], t[2])
 
 # instruction:
 
@@ -124,7 +144,12 @@ def p_instruction(t):
               | iteration_instruction
               | jump_instruction
               '''
-    t[0] = 'STAT', t[1]
+    t[0] = build.Stat(t[1])
+
+def p_instruction_error(t):
+    'instruction : error SEMI'
+    # Skip to the end of a malformed instruction, which becomes {}
+    t[0] = build.Stat(build.Compound([]))
 
 # expression-instruction:
 def p_expression_instruction(t):
@@ -135,19 +160,32 @@ def p_expression_instruction(t):
 
 def p_compound_instruction_1(t):
     'compound_instruction : LBRACE declaration_list instruction_list RBRACE'
-    t[0] = 'COMP_STATS', t[2] + t[3]
+    t[0] = build.Compound(t[2] + t[3])
 
 def p_compound_instruction_2(t):
     'compound_instruction : LBRACE instruction_list RBRACE'
-    t[0] = 'COMP_STATS', t[2]
+    t[0] = build.Compound(t[2])
 
 def p_compound_instruction_3(t):
     'compound_instruction : LBRACE declaration_list RBRACE'
-    t[0] = 'COMP_STATS', t[2] 
+    t[0] = build.Compound(t[2])
 
 def p_compound_instruction_4(t):
     'compound_instruction : LBRACE RBRACE'
-    t[0] = 'COMP_STATS', []
+    t[0] = build.Compound([])
+
+def p_compound_instruction_error(t):
+    '''
+    compound_instruction : LBRACE error RBRACE
+                         | LBRACE declaration_list error RBRACE
+                         | LBRACE instruction_list error RBRACE
+                         | LBRACE declaration_list instruction_list error RBRACE
+                         '''
+    # Close the block at its brace, keeping what parsed before the error
+    items = []
+    for i in range(2, len(t) - 2):
+        items += t[i]
+    t[0] = build.Compound(items)
 
 # instruction-list:
 
@@ -157,35 +195,36 @@ def p_instruction_list_1(t):
 
 def p_instruction_list_2(t):
     'instruction_list : instruction_list instruction'
-    t[0] = t[1] + [t[2]]
+    t[1].append(t[2])
+    t[0] = t[1]
 
 # selection-instruction
 
 def p_select_instruction_1(t):
     'select_instruction : IF LPAREN condition RPAREN instruction'
-    t[0] = 'IF', t[3], t[5]
+    t[0] = build.If(t[3], t[5])
 
 def p_select_instruction_2(t):
     'select_instruction : IF LPAREN condition RPAREN instruction ELSE instruction '
-    t[0] = 'IF_ELSE', t[3], t[5], t[7]
+    t[0] = build.IfElse(t[3], t[5], t[7])
 
 # iteration_instruction:
 def p_iteration_instruction_1(t):
     'iteration_instruction : WHILE LPAREN condition RPAREN instruction'
-    t[0] = 'WHILE', t[3], t[5]
+    t[0] = build.While(t[3], t[5])
 
 def p_iteration_instruction_2(t):
     'iteration_instruction : FOR LPAREN expression SEMI condition SEMI expression RPAREN instruction '
-    t[0] = 'FOR', t[3], t[5], t[7], t[9]
+    t[0] = build.For(t[3], t[5], t[7], t[9])
 
 def p_iteration_instruction_3(t):
     'iteration_instruction : DO instruction WHILE LPAREN condition RPAREN SEMI'
-    t[0] = 'DO_WHILE', t[2], t[5]
+    t[0] = build.DoWhile(t[2], t[5])
 
 # jump_instruction:
 def p_jump_instruction(t):
     'jump_instruction : RETURN expression SEMI'
-    t[0] = 'RET', t[2]
+    t[0] = build.Return(t[2])
 
 # expression:
 
@@ -195,20 +234,20 @@ def p_expression_1(t):
 
 def p_expression_2(t):
     'expression : unary_expression assignment_operator expression'
-    t[0] = 'ASSIGN', t[1], t[3]
+    t[0] = build.Assign(t[1], t[3])
 
 def p_expression_3(t):
     'expression : expression LSHIFT additive_expression'
-    t[0] = 'LSHIFT', t[1], t[3]
+    t[0] = build.LShift(t[1], t[3])
 
 def p_expression_4(t):
     'expression : expression RSHIFT additive_expression'
-    t[0] = 'RSHIFT', t[1], t[3]
+    t[0] = build.RShift(t[1], t[3])
 
 # condition
 def p_condition(t):
     'condition : expression comparison_operator expression'
-    t[0] = t[2], t[1], t[3]
+    t[0] = build.Condition(t[2], t[1], t[3])
 
 def p_comparison_operator(t):
     '''comparison_operator : EQ
@@ -240,12 +279,12 @@ def p_additive_expression_1(t):
 
 def p_additive_expression_2(t):
     'additive_expression : additive_expression PLUS multiplicative_expression'
-    t[0] = 'ADD', t[1], t[3]
+    t[0] = build.Add(t[1], t[3])
     # print 'Addition', t[1][1], 'and', t[3][1][1]
 
 def p_additive_expression_3(t):
     'additive_expression : additive_expression MINUS multiplicative_expression'
-    t[0] = 'SUB', t[1], t[3]
+    t[0] = build.Sub(t[1], t[3])
 
 # multiplicative-expression
 
@@ -255,15 +294,15 @@ def p_multiplicative_expression_1(t):
 
 def p_multiplicative_expression_2(t):
     'multiplicative_expression : multiplicative_expression TIMES unary_expression'
-    t[0] = 'MUL', t[1], t[3]
+    t[0] = build.Mul(t[1], t[3])
 
 def p_multiplicative_expression_3(t):
     'multiplicative_expression : multiplicative_expression DIVIDE unary_expression'
-    t[0] = 'DIV', t[1], t[3]
+    t[0] = build.Div(t[1], t[3])
 
 def p_multiplicative_expression_4(t):
     'multiplicative_expression : multiplicative_expression MOD unary_expression'
-    t[0] = 'MOD', t[1], t[3]
+    t[0] = build.Mod(t[1], t[3])
 
 
 # unary-expression:
@@ -273,7 +312,7 @@ def p_unary_expression_1(t):
 
 def p_unary_expression_2(t):
     'unary_expression : MINUS unary_expression'
-    t[0] = 'NEG', t[2]
+    t[0] = build.Neg(t[2])
 
 # postfix-expression:
 
@@ -283,24 +322,24 @@ def p_postfix_expression_1(t):
 
 def p_postfix_expression_2(t):
     'postfix_expression : postfix_expression LPAREN argument_expression_list RPAREN'
-    t[0] = 'FUNC_CALL', t[1], t[3]
+    t[0] = build.FuncCall(t[1], t[3])
 
 def p_postfix_expression_3(t):
     'postfix_expression : postfix_expression LPAREN RPAREN'
-    t[0] = 'FUNC_CALL', t[1], None
+    t[0] = build.FuncCall(t[1], None)
 
 def p_postfix_expression_4(t):
     'postfix_expression : postfix_expression PLUSPLUS'
-    t[0] = 'POST_INC', t[1]
+    t[0] = build.PostInc(t[1])
 
 def p_postfix_expression_5(t):
     'postfix_expression : postfix_expression MINUSMINUS'
-    t[0] = 'POST_DEC', t[1]
+    t[0] = build.PostDec(t[1])
 
 # primary-expression:
 def p_primary_expression_1(t):
     '''primary_expression : ID'''
-    t[0] = 'ID', t[1]
+    t[0] = build.Id(t[1])
 
 def p_primary_expression_2(t):
     '''primary_expression : constant'''
@@ -308,11 +347,11 @@ def p_primary_expression_2(t):
 
 def p_primary_expression_3(t):
     '''primary_expression : SCONST'''
-    t[0] = 'SCONST', t[1]
+    t[0] = build.SConst(t[1])
 
 def p_primary_expression_4(t):
     '''primary_expression : LPAREN expression RPAREN'''
-    t[0] = 'PRIMARY', t[2]
+    t[0] = build.Primary(t[2])
 
 # argument-expression-list:
 def p_argument_expression_list_1(t):
@@ -321,31 +360,121 @@ def p_argument_expression_list_1(t):
 
 def p_argument_expression_list_2(t):
     '''argument_expression_list : argument_expression_list COMMA expression'''
-    t[0] = t[1] + [t[3]]
+    t[1].append(t[3])
+    t[0] = t[1]
 
 # constant:
 def p_constant(t): 
    '''constant : ICONST'''
-   t[0] = 'ICONST',t[1]
+   t[0] = build.IConst(t[1])
 
 def p_constant_1(t):
     '''constant : FCONST'''
-    t[0] = 'FCONST',t[1]
+    t[0] = build.FConst(t[1])
+
+class Diagnostic(object):
+    """
+    A syntax error at a token, or at the end of the input if type is None.
+    """
+    __slots__ = ('line', 'column', 'type', 'value')
+
+    def __init__(self, line=None, column=None, type=None, value=None):
+        self.line = line
+        self.column = column
+        self.type = type
+        self.value = value
+
+    def __str__(self):
+        if self.type is None:
+            return 'Syntax error at EOF'
+        return 'Syntax error at line %d, column %d, token %s %r' % (self.line, self.column, self.type, self.value)
+
+    def __repr__(self):
+        return 'Diagnostic(%r, %r, %r, %r)' % (self.line, self.column, self.type, self.value)
+
+class TooManyErrors(Exception):
+    """
+    Raised by p_error() at the error that exhausts the budget of
+    collect_errors().
+    """
+    def __init__(self, diagnostics):
+        Exception.__init__(self, '%d syntax errors, giving up' % len(diagnostics))
+        self.diagnostics = diagnostics
+
+# Default error budget of collect_errors()
+MAX_ERRORS = 20
+
+# Where p_error() records syntax errors, a list set by collect_errors(), and
+# the number of errors at which it stops the parse
+diagnostics = None
+max_errors = None
+
+@contextlib.contextmanager
+def collect_errors(limit=MAX_ERRORS):
+    """
+    Record the syntax errors of the parses in the with block, as Diagnostics,
+    in the list it yields instead of printing them. The error that makes
+    limit of them raises TooManyErrors out of the parse (None for no limit).
+    """
+    global diagnostics, max_errors
+    saved = diagnostics, max_errors
+    diagnostics, max_errors = [], limit
+    try:
+        yield diagnostics
+    finally:
+        diagnostics, max_errors = saved
 
 def p_error(t):
+    # The error rules above then skip to the next SEMI or RBRACE at which the
+    # parse can go on. Errors in the next three tokens are not reported.
     if t:
-         print("Syntax error at token", t)
-         # Just discard the token and tell the parser it's okay.
-         parser.errok()
+        line, column = t.lexer.lineindex().position(t.lexpos)
+        error = Diagnostic(line, column, t.type, t.value)
     else:
-         print("Syntax error at EOF")
-
-
-
-parser = yacc.yacc(method='LALR')
+        error = Diagnostic()
+    if diagnostics is None:
+        if t:
+            print("Syntax error at line %d, column %d, token" % (line, column), t)
+        else:
+            print("Syntax error at EOF")
+        return
+    diagnostics.append(error)
+    if max_errors is not None and len(diagnostics) >= max_errors:
+        raise TooManyErrors(diagnostics)
+
+
+
+_parser = None
+
+def get_parser():
+    """
+    Return the parser, reading its tables from the cache on the first call.
+    """
+    global _parser
+    if _parser is None:
+        clex.get_lexer()        # The default lexer of parser.parse()
+        _parser = yacc.yacc(method='LALR', parsermodule='parsegen', cachedir=cache.CACHE_DIR)
+    return _parser
+
+parser = cache.Lazy(get_parser)
+
+def parse_flat(*args, **kwargs):
+    """
+    Parse like parser.parse(), building an arena.Arena instead of node
+    objects.
+    """
+    global build
+    build = arena.Arena()
+    try:
+        decls = parser.parse(*args, **kwargs)
+    finally:
+        tree, build = build, nodes
+    tree.set_declarations(decls or [])
+    return tree
 
 if __name__ == '__main__':
     s = sys.stdin.read()
-    s = remove_blank(remove_comment(s))
+    lexer = clex.lexer.clone()
+    s = input_stripped(lexer, s)
     print s
-    pp.pprint(parser.parse(s))
+    pp.pprint(nodes.to_tuples(parser.parse(lexer=lexer)))
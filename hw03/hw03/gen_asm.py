@@ -1,45 +1,31 @@
+import argparse
+import binascii
+import os
 import sys
-from uuid import uuid4
-from functools import partial
 
 import ply.yacc as yacc
+import clex
 import cparse
+import incremental
+import macros
+import nodes
+import parallel
 
-from preprocess import remove_blank
-from preprocess import remove_comment
+from preprocess import parse_includes
+from preprocess import read_source
+from nodes import Stat
 
 instructions = []
-st = []
+st = []                 # scope stack, symbol tables are keyed on clex identifier ids
 num_string = 0
 call_cat = False
 exist_str = False
 string_ins = []
 
 def gen_id():
-    return '_'.join(str(uuid4()).split('-'))
-
-def is_sth(root, t):
-    return root[0] in t
-
-is_func_def             = partial(is_sth, t=['FUNC_DEF'])
-is_declaration          = partial(is_sth, t=['VAR_DEC'])
-is_instruction          = partial(is_sth, t=['STAT'])
-is_init_assign          = partial(is_sth, t=['INIT_ASSIGN'])
-is_shift_expr           = partial(is_sth, t=['LSHIFT', 'RSHIFT'])
-is_additive_expr        = partial(is_sth, t=['ADD', 'SUB'])
-is_multiplicative_expr  = partial(is_sth, t=['MUL', 'DIV', 'MOD'])
-is_neg_expr             = partial(is_sth, t=['NEG'])
-is_primary_expr         = partial(is_sth, t=['PRIMARY'])
-is_iconst               = partial(is_sth, t=['ICONST'])
-is_sconst               = partial(is_sth, t=['SCONST'])
-is_id                   = partial(is_sth, t=['ID'])
-is_ret_instruction      = partial(is_sth, t=['RET'])
-is_expr_instruction     = partial(is_sth, t=['ASSIGN', 'FUNC_CALL'])
-is_assign_instruction   = partial(is_sth, t=['ASSIGN'])
-is_select_instruction   = partial(is_sth, t=['IF', 'IF_ELSE'])
-is_compound_instruction = partial(is_sth, t=['COMP_STATS'])
-is_iter_instruction     = partial(is_sth, t=['WHILE', 'FOR', 'DO_WHILE'])
-is_func_call            = partial(is_sth, t=['FUNC_CALL'])
+    # Random label in the layout of a uuid4; the uuid module loads ctypes on import
+    h = binascii.hexlify(os.urandom(16))
+    return '_'.join([h[:8], h[8:12], h[12:16], h[16:20], h[20:]])
 
 op_to_cmd = {'<':   'jge',
              '<=':  'jg',
@@ -151,15 +137,15 @@ def find_sym(s):
         if(table['name'] == 'global'):
             glo_num = table['env']['count']
     for table in st[::-1]:
-        if s in table['syms']:
-            return table['syms'][s], table['name'], glo_num
+        if s.id in table['syms']:
+            return table['syms'][s.id], table['name'], glo_num
     raise ValueError("Can't find symbol %s." %(s))
 
 def insert_sym(s):
     table = st[-1]
     if s in table:
         raise ValueError("%s conflict in block %s." %(s, table['name']))
-    table['syms'][s] = table['env']['count']
+    table['syms'][s.id] = table['env']['count']
     table['env']['count'] += 1
 
 def addr_of_sym(x):
@@ -173,205 +159,184 @@ def reg_of_arg(idx):
     return 'r%d' %(idx + 8)
 
 def traverse_ast(root):
-    if is_func_def(root):
-        _, t, f, insts = root
-        traverse_func_declarator(f)
-        traverse_compound_instruction(insts)
+    if root.kind == nodes.FUNC_DEF:
+        traverse_func_declarator(root.declarator)
+        traverse_compound_instruction(root.body)
         leave_block()
-    if is_declaration(root):
-        if (len(root[2][0][0][0]) == 1):
-            declaration_list = []
-            declaration_list.append(root)
-            map(traverse_delaration, declaration_list)
+    elif root.kind == nodes.VAR_DEC:
+        # Global variables, function prototypes need no code
+        if root.declarators[0].kind != nodes.FUNC_DECL:
+            traverse_delaration(root)
 
 
 def traverse_compound_instruction(insts):
-    _, lst = insts
-    declaration_list = filter(is_declaration, lst)
-    instruction_list = filter(is_instruction, lst)
+    declaration_list = [x for x in insts.items if x.kind == nodes.VAR_DEC]
+    instruction_list = [x for x in insts.items if x.kind == nodes.STAT]
 
     map(traverse_delaration, declaration_list)
     map(traverse_instruction, instruction_list)
 
 def traverse_delaration(dec):
-    _, t, lst = dec
-    map(traverse_var_declarator, lst)
+    map(traverse_var_declarator, dec.declarators)
 
 def traverse_instruction(inst):
-    if is_ret_instruction(inst[1]):
-        # RET
-        _, v = inst[1]
-        traverse_expression(v)
-        add_ret_asm()
+    inst = inst.instruction
+    handler = instruction_handlers.get(inst.kind)
+    if handler:
+        handler(inst)
 
-    elif is_assign_instruction(inst[1]):
-        _, (_, x), v = inst[1]
-        traverse_expression(v)
-        add_asm('popq %s' %(addr_of_sym(x)))
+def traverse_ret_instruction(inst):
+    traverse_expression(inst.value)
+    add_ret_asm()
 
-    elif is_expr_instruction(inst[1]):
-        traverse_expression(inst[1])
+def traverse_assign_instruction(inst):
+    traverse_expression(inst.value)
+    add_asm('popq %s' %(addr_of_sym(inst.target.name)))
 
-    elif is_select_instruction(inst[1]):
-        taverse_select_instruction(inst[1])
-
-    elif is_iter_instruction(inst[1]):
-        traverse_iter_instruction(inst[1])
-
-    elif is_compound_instruction(inst[1]):
-        traverse_compound_instruction(inst[1])
-    
 def traverse_var_declarator(declarator):
-    if is_init_assign(declarator):
-        # _, (_, x), v = declarator
-        # traverse_expression(v)
+    if declarator.kind == nodes.INIT_ASSIGN:
+        # traverse_expression(declarator.value)
         pass
     else:
-        _, x = declarator
-        insert_sym(x)
+        insert_sym(declarator.name)
 
 def traverse_func_declarator(declarator):
-    (_, fn), params = declarator
+    fn = declarator.name.name
     enter_block(fn)
     add_func_dec_asm(fn)
-    if params:
-        for i, (t, (_, x)) in enumerate(params):
+    if declarator.params:
+        for i, param in enumerate(declarator.params):
+            x = param.declarator.name
             insert_sym(x)
             add_asm('movq %%%s, %s' %(reg_of_arg(i), addr_of_sym(x)))
 
 def traverse_expression(expr):
+    handler = expression_handlers.get(expr.kind)
+    if handler:
+        handler(expr)
+
+def traverse_iconst(expr):
+    add_asm('pushq $%s' %(expr.value))
+
+def traverse_sconst(expr):
     global num_string
-    global call_cat
     global exist_str
-    if is_iconst(expr):
-        _, n = expr
-        add_asm('pushq $%s' %(n))
-
-    if is_sconst(expr):
-        _, string = expr
-        num_string = num_string + 1
-        add_asm('leaq L_.str'+str(num_string)+'(%rip), %rcx')
-        add_asm('pushq %rcx')
-        string_ins.append(('L_.str'+str(num_string)+':'))
-        string_ins.append('.asciz '+str(string))
-        exist_str = True
-
-    if is_id(expr):
-        _, x = expr
-        add_asm('pushq %s' %(addr_of_sym(x)))
-
-    elif is_func_call(expr):
-        _, (_, f), args = expr
-
-        if f == 'printd':
-            assert len(args) == 1
-            expr = args[0]
-            traverse_expression(expr) 
-            add_asm('popq %rax')
-            add_asm('leaq L_.str(%rip), %rdi')
-            add_asm('movl %eax, %esi')
-            add_asm('movb $0, %al') 
-            add_asm('callq _printf')
-
-        elif f == 'sleep':
-            assert len(args) == 1
-            expr = args[0]
-            traverse_expression(expr) 
-            add_asm('popq %rdi') 
-            add_asm('movb $0, %al')
-            add_asm('callq _sleep')
-        
-        elif f == 'cat':
-            assert len(args) == 2
-            expr = args[0]
-            traverse_expression(expr)
-            expr2 = args[1]
-            traverse_expression(expr2)
-            add_asm('popq %rsi')
-            add_asm('popq %rdi')
-            add_asm('callq _cat')
-            add_asm('pushq %rax')
-            call_cat = True
-        
-        elif f == 'printf':
-            assert len(args) == 1
-            expr = args[0]
-            traverse_expression(expr)
-            add_asm('popq %rdi')
-            add_asm('callq _printf')
+    num_string = num_string + 1
+    add_asm('leaq L_.str'+str(num_string)+'(%rip), %rcx')
+    add_asm('pushq %rcx')
+    string_ins.append(('L_.str'+str(num_string)+':'))
+    string_ins.append('.asciz '+str(expr.value))
+    exist_str = True
 
-        else:
-            for i, expr in enumerate(args):
-                traverse_expression(expr)
-                add_asm('popq %%%s' %(reg_of_arg(i)))
-
-            add_asm('call _%s' %(f))
-            add_asm('pushq %rax')
-
-
-    elif is_additive_expr(expr):
-        op, a, b = expr
-        traverse_expression(a)
-        traverse_expression(b)
-        add_op_asm('addq' if op == 'ADD' else 'subq')
-
-    elif is_multiplicative_expr(expr):
-        op, a, b = expr
-        traverse_expression(a)
-        traverse_expression(b)
-        add_op_asm('imulq' if op == 'MUL' else 'idivq')
-        
-        if op == 'MOD':
-            add_asm('popq %rax')
-            add_asm('pushq %rdx')
-
-    elif is_neg_expr(expr):
-        _, e = expr
-        traverse_expression(e)
+def traverse_id(expr):
+    add_asm('pushq %s' %(addr_of_sym(expr.name)))
+
+def traverse_func_call(expr):
+    global call_cat
+    f, args = expr.func.name, expr.args
+
+    if f == 'printd':
+        assert len(args) == 1
+        expr = args[0]
+        traverse_expression(expr) 
         add_asm('popq %rax')
-        add_asm('negq %rax')
+        add_asm('leaq L_.str(%rip), %rdi')
+        add_asm('movl %eax, %esi')
+        add_asm('movb $0, %al') 
+        add_asm('callq _printf')
+
+    elif f == 'sleep':
+        assert len(args) == 1
+        expr = args[0]
+        traverse_expression(expr) 
+        add_asm('popq %rdi') 
+        add_asm('movb $0, %al')
+        add_asm('callq _sleep')
+    
+    elif f == 'cat':
+        assert len(args) == 2
+        expr = args[0]
+        traverse_expression(expr)
+        expr2 = args[1]
+        traverse_expression(expr2)
+        add_asm('popq %rsi')
+        add_asm('popq %rdi')
+        add_asm('callq _cat')
+        add_asm('pushq %rax')
+        call_cat = True
+    
+    elif f == 'printf':
+        assert len(args) == 1
+        expr = args[0]
+        traverse_expression(expr)
+        add_asm('popq %rdi')
+        add_asm('callq _printf')
+
+    else:
+        for i, expr in enumerate(args):
+            traverse_expression(expr)
+            add_asm('popq %%%s' %(reg_of_arg(i)))
+
+        add_asm('call _%s' %(f))
         add_asm('pushq %rax')
 
-    elif is_primary_expr(expr):
-        _, e = expr
-        traverse_expression(e)
+arith_cmd = {nodes.ADD: 'addq',
+             nodes.SUB: 'subq',
+             nodes.MUL: 'imulq',
+             nodes.DIV: 'idivq',
+             nodes.MOD: 'idivq'}
+
+def traverse_arith_expr(expr):
+    traverse_expression(expr.left)
+    traverse_expression(expr.right)
+    add_op_asm(arith_cmd[expr.kind])
 
-    elif is_shift_expr(expr):
-        op, a, b = expr
-        traverse_expression(a)
-        traverse_expression(b)
-        add_asm('popq %rcx')
+    if expr.kind == nodes.MOD:
         add_asm('popq %rax')
-        add_asm('cltd') 
-        add_asm('%s %%cl, %%eax' %('shll' if op == 'LSHIFT' else 'shrl'))
-        add_asm('pushq %rax')
+        add_asm('pushq %rdx')
+
+def traverse_neg_expr(expr):
+    traverse_expression(expr.operand)
+    add_asm('popq %rax')
+    add_asm('negq %rax')
+    add_asm('pushq %rax')
+
+def traverse_primary_expr(expr):
+    traverse_expression(expr.expr)
+
+def traverse_shift_expr(expr):
+    traverse_expression(expr.left)
+    traverse_expression(expr.right)
+    add_asm('popq %rcx')
+    add_asm('popq %rax')
+    add_asm('cltd') 
+    add_asm('%s %%cl, %%eax' %('shll' if expr.kind == nodes.LSHIFT else 'shrl'))
+    add_asm('pushq %rax')
 
 def taverse_select_instruction(inst):
     inst_id = 'BRANCH_%s' %(gen_id())
 
-    if inst[0] == 'IF':
-        _, pred, branch = inst
-        cmp_op = traverse_condition(pred)
+    if inst.kind == nodes.IF:
+        cmp_op = traverse_condition(inst.condition)
         add_asm('%s %s_END' %(op_to_cmd[cmp_op], inst_id))
 
         enter_block('%s_IF' %inst_id, 'local')
-        traverse_instruction(branch)
+        traverse_instruction(inst.then)
         leave_block()
 
         add_asm('%s_END:' %inst_id)
     else:
-        _, pred, branch_a, branch_b = inst
-        cmp_op = traverse_condition(pred)
+        cmp_op = traverse_condition(inst.condition)
         add_asm('%s %s_ELSE' %(op_to_cmd[cmp_op], inst_id))
 
         enter_block('%s_IF' %inst_id, 'local')
-        traverse_instruction(branch_a)
+        traverse_instruction(inst.then)
         leave_block()
         add_asm('jmp %s_END' %inst_id)
 
         add_asm('%s_ELSE:' %inst_id)
         enter_block('%s_ELSE' %inst_id, 'local')
-        traverse_instruction(branch_b)
+        traverse_instruction(inst.otherwise)
         leave_block()
 
         add_asm('%s_END:' %inst_id)
@@ -380,38 +345,35 @@ def traverse_iter_instruction(inst):
     inst_id = 'ITER_%s' %(gen_id())
     enter_block(inst_id, 'local')
 
-    if inst[0] == 'WHILE':
+    if inst.kind == nodes.WHILE:
         add_asm('%s_START:' %inst_id)
 
-        _, pred, block = inst
-        cmp_op = traverse_condition(pred)
+        cmp_op = traverse_condition(inst.condition)
         add_asm('%s %s_END' %(op_to_cmd[cmp_op], inst_id))
 
-        traverse_instruction(block)
+        traverse_instruction(inst.body)
 
         add_asm('jmp %s_START' %inst_id)
         add_asm('%s_END:' %inst_id)
 
-    elif inst[0] == 'FOR':
-        _, init, pred, incr, block = inst
-        traverse_instruction(('STAT', init))
+    elif inst.kind == nodes.FOR:
+        traverse_instruction(Stat(inst.init))
         add_asm('%s_START:' %inst_id)
 
-        cmp_op = traverse_condition(pred)
+        cmp_op = traverse_condition(inst.condition)
         add_asm('%s %s_END' %(op_to_cmd[cmp_op], inst_id))
 
-        traverse_instruction(block)
-        traverse_instruction(('STAT', incr))
+        traverse_instruction(inst.body)
+        traverse_instruction(Stat(inst.step))
 
         add_asm('jmp %s_START' %inst_id)
         add_asm('%s_END:' %inst_id)
 
-    elif inst[0] == 'DO_WHILE':
-        _, block, pred = inst
+    elif inst.kind == nodes.DO_WHILE:
         add_asm('%s_START:' %inst_id)
-        traverse_instruction(block)
+        traverse_instruction(inst.body)
 
-        cmp_op = traverse_condition(pred)
+        cmp_op = traverse_condition(inst.condition)
         add_asm('%s %s_END' %(op_to_cmd[cmp_op], inst_id))
         add_asm('jmp %s_START' %inst_id)
         add_asm('%s_END:' %inst_id)
@@ -419,16 +381,96 @@ def traverse_iter_instruction(inst):
     leave_block()
 
 def traverse_condition(pred):
-    cmp_op, e1, e2 = pred
-    traverse_expression(e1)
-    traverse_expression(e2)
+    traverse_expression(pred.left)
+    traverse_expression(pred.right)
     add_cmp_asm('cmpq')
-    return cmp_op
+    return pred.op
+
+# Node kind -> code generator, for the statements and expressions that
+# produce code
+instruction_handlers = {
+    nodes.RET:          traverse_ret_instruction,
+    nodes.ASSIGN:       traverse_assign_instruction,
+    nodes.FUNC_CALL:    traverse_expression,
+    nodes.IF:           taverse_select_instruction,
+    nodes.IF_ELSE:      taverse_select_instruction,
+    nodes.WHILE:        traverse_iter_instruction,
+    nodes.FOR:          traverse_iter_instruction,
+    nodes.DO_WHILE:     traverse_iter_instruction,
+    nodes.COMP_STATS:   traverse_compound_instruction,
+}
+
+expression_handlers = {
+    nodes.ICONST:       traverse_iconst,
+    nodes.SCONST:       traverse_sconst,
+    nodes.ID:           traverse_id,
+    nodes.FUNC_CALL:    traverse_func_call,
+    nodes.ADD:          traverse_arith_expr,
+    nodes.SUB:          traverse_arith_expr,
+    nodes.MUL:          traverse_arith_expr,
+    nodes.DIV:          traverse_arith_expr,
+    nodes.MOD:          traverse_arith_expr,
+    nodes.NEG:          traverse_neg_expr,
+    nodes.PRIMARY:      traverse_primary_expr,
+    nodes.LSHIFT:       traverse_shift_expr,
+    nodes.RSHIFT:       traverse_shift_expr,
+}
 
 if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Compile the C source on stdin to assembly.')
+    ap.add_argument('--macros', action='store_true',
+                    help='expand #define macros (cat() then no longer calls the built-in _cat)')
+    ap.add_argument('-I', dest='include_dir', default='.',
+                    help='directory of #include "file" headers (default: %(default)s)')
+    ap.add_argument('--flat', action='store_true',
+                    help='keep the AST in flat arrays (arena.Arena), for very large sources')
+    ap.add_argument('--ast-cache', metavar='FILE',
+                    help='keep the ASTs of top-level declarations in FILE and reparse only '
+                         'the declarations that changed since the last compilation')
+    ap.add_argument('--max-errors', metavar='N', type=int, default=cparse.MAX_ERRORS,
+                    help='stop at the N-th syntax error (default: %(default)s, 0 for no limit)')
+    opts = ap.parse_args()
+    if opts.ast_cache and (opts.flat or opts.macros):
+        ap.error('--ast-cache cannot be used with --flat or --macros')
+
     parser = cparse.parser
-    s = remove_blank(remove_comment(sys.stdin.read()))
-    asts = parser.parse(s)
+    if opts.flat:
+        parse_tree = lambda *args, **kwargs: cparse.parse_flat(*args, **kwargs).declarations()
+    else:
+        parse_tree = parser.parse
+    s = read_source(sys.stdin)
+    preprocessor = None
+    if opts.macros:
+        # One preprocessor for the whole compilation, so that definitions
+        # carry across #include lines
+        preprocessor = macros.Preprocessor(clex.lexer.clone())
+        parse = lambda text: parse_tree(text, lexer=preprocessor)
+    elif opts.ast_cache:
+        reparser = incremental.IncrementalParser(opts.ast_cache)
+        reparser.load()
+        parse = lambda text: reparser.parse(parallel.tokenize(text))
+    elif opts.flat:
+        parse = lambda text: parse_tree(parallel.tokenize(text))
+    else:
+        parse = parallel.parse
+    if opts.flat:
+        # Cached headers are node objects rather than views of their arena
+        header_parse = lambda text: [d.arena.tree(d.index) for d in parse(text)]
+    else:
+        header_parse = None
+    with cparse.collect_errors(opts.max_errors or None) as errors:
+        try:
+            asts = parse_includes(s, parser, parse, opts.include_dir, header_parse=header_parse,
+                                  preprocessor=preprocessor)
+        except cparse.TooManyErrors as e:
+            errors.append(e)
+        else:
+            if opts.ast_cache:
+                reparser.save()
+    if errors:
+        for error in errors:
+            sys.stderr.write('%s\n' % error)
+        sys.exit(1)
 
     enter_block('global')
     map(traverse_ast, asts)
@@ -0,0 +1,151 @@
+"""
+Reparse a changing source one top-level declaration at a time.
+
+The tokens of a source are cut into the spans of its external declarations,
+each ending with a SEMI or with the RBRACE that closes a function body.  A
+span is keyed by a hash of the text of its tokens and the grammar, so the
+key of a declaration does not change when the declarations around it are
+edited, added or removed.  An IncrementalParser keeps the AST of each span
+under its key and parses only the spans it has no AST for, each on its own.
+Its cache can be saved to a file and loaded by the next compilation
+(gen_asm --ast-cache).  The file holds the AST of each span pickled on its
+own, so a save only pickles the spans parsed since the load.
+
+The ASTs are node objects shared between parses, which code generation does
+not modify.
+"""
+
+import gc
+import hashlib
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import cparse
+from ply import cache
+from preprocess import grammar_fingerprint
+
+def declaration_spans(tokens):
+    """
+    Return the (start, end) token indices of the external declarations in
+    tokens, a TokenArrays.
+    """
+    ids = dict((t, n) for n, t in enumerate(tokens.types))
+    semi, lbrace, rbrace = [ids.get(t, -1) for t in ('SEMI', 'LBRACE', 'RBRACE')]
+    spans = []
+    start = depth = 0
+    for i, t in enumerate(tokens.typeids):
+        if t == lbrace:
+            depth += 1
+        elif t == rbrace:
+            depth -= 1
+            if depth <= 0:
+                depth = 0
+                spans.append((start, i + 1))
+                start = i + 1
+        elif t == semi and depth == 0:
+            spans.append((start, i + 1))
+            start = i + 1
+    if start < len(tokens):
+        spans.append((start, len(tokens)))
+    return spans
+
+def span_key(tokens, start, end, fingerprint):
+    # The text of a token determines its type
+    h = hashlib.sha1(fingerprint)
+    lexdata, starts, lengths = tokens.lexdata, tokens.starts, tokens.lengths
+    h.update('\0'.join([lexdata[starts[i]:starts[i] + lengths[i]] for i in range(start, end)]))
+    return h.digest()
+
+class IncrementalParser(object):
+    """
+    Parses token arrays with the cparse parser, reusing the ASTs of the
+    declarations it has parsed before. cache_file, if given, is where load()
+    and save() keep them between compilations.
+    """
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.asts = {}          # Span key -> declarations
+        self.pickles = {}       # Span key -> declarations pickled, as loaded
+        self.used = set()       # Keys of the spans parsed or reused since load()
+        self.parsed = 0
+        self.reused = 0
+
+    def load(self):
+        self.used = set()
+        if self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    self.pickles = pickle.load(f)
+            except Exception:
+                self.pickles = {}       # Unreadable cache, parse everything again
+
+    def save(self):
+        """
+        Write the ASTs of the spans used since load() to the cache file.
+        """
+        if not self.cache_file or self.used == set(self.pickles):
+            return
+        pickles = {}
+        for key in self.used:
+            data = self.pickles.get(key)
+            if data is None:
+                data = pickle.dumps(self.asts[key], pickle.HIGHEST_PROTOCOL)
+            pickles[key] = data
+        with cache.replacing(self.cache_file, 'wb') as f:
+            pickle.dump(pickles, f, pickle.HIGHEST_PROTOCOL)
+        self.pickles = pickles
+
+    def parse(self, tokens):
+        """
+        Return the list of declarations of tokens, a TokenArrays, like
+        cparse.parser.parse(tokens) does.
+        """
+        # Unpickling and parsing allocate many objects and no cycles, so the
+        # collections that they would trigger only walk the growing trees
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.parse_spans(tokens)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def parse_spans(self, tokens):
+        parser = cparse.get_parser()
+        fingerprint = grammar_fingerprint(parser)
+        decls = []
+        for start, end in declaration_spans(tokens):
+            key = span_key(tokens, start, end, fingerprint)
+            tree = self.asts.get(key)
+            if tree is None and key in self.pickles:
+                tree = self.asts[key] = pickle.loads(self.pickles[key])
+            if tree is None:
+                tree, ok = self.parse_span(parser, tokens.slice(start, end))
+                self.parsed += 1
+                if ok:
+                    self.asts[key] = tree
+                    self.used.add(key)
+            else:
+                self.reused += 1
+                self.used.add(key)
+            decls.extend(tree or [])
+        return decls
+
+    def parse_span(self, parser, tokens):
+        # Returns the declarations and whether they parsed without errors,
+        # which are reported again each time the span is parsed
+        errors = []
+        errorfunc = parser.errorfunc
+        def counting(t):
+            errors.append(t)
+            return errorfunc(t)
+        parser.errorfunc = counting
+        try:
+            tree = parser.parse(tokens)
+        finally:
+            parser.errorfunc = errorfunc
+        return tree, not errors
@@ -0,0 +1,200 @@
+"""
+A token-level preprocessor for #define macros.
+
+Preprocessor wraps a clex lexer and has the same input()/token() interface, so
+it can be handed to the parser as its lexer.  Object-like and function-like
+macros are expanded as the tokens go by; #undef removes a definition and other
+directives are ignored, as the lexer does.  A directive is continued on the
+next line after a backslash at the end of a line.  Arguments are
+macro-expanded before they are substituted and the result is rescanned, with
+the macros being expanded hidden from the rescan so that recursive
+definitions terminate.  The # and ## operators are not supported, and a
+function-like macro name produced by an expansion only takes arguments from
+within that expansion.
+
+Expansions are cached by macro name and argument tokens, so a form that is
+used many times is only expanded once.
+"""
+
+import re
+
+from ply.lex import LexToken
+
+_define = re.compile(r'\#\s*define\s+([A-Za-z_]\w*)(\(([^)]*)\))?(.*)', re.DOTALL)
+_undef = re.compile(r'\#\s*undef\s+([A-Za-z_]\w*)')
+
+class Preprocessor(object):
+    def __init__(self, lexer, memoize=True):
+        self.lexer = lexer
+        self.lexer.directives = []
+        self.memoize = memoize  # Cache expansions
+        self.macros = {}        # name -> (parameter names or None, body as (type, value) pairs)
+        self.cache = {}         # (name, arguments, hidden names) -> expansion
+        self.pending = []       # Tokens read ahead, in reverse order
+        self.output = []        # Expanded tokens still to return, in reverse order
+
+    def input(self, data):
+        self.lexer.input(data)
+        del self.lexer.directives[:]
+        self.pending = []
+        self.output = []
+
+    def lineindex(self):
+        return self.lexer.lineindex()
+
+    def apply(self, data):
+        """
+        Apply the directives of data, which has no other tokens.
+        """
+        self.input(data)
+        while self.next() is not None:
+            pass
+
+    def define(self, name, params, body):
+        """
+        Define a macro. params is a list of parameter names, or None for an
+        object-like macro, and body is the replacement text.
+        """
+        lexer = self.lexer.clone()
+        lexer.directives = None
+        lexer.input(body)
+        self.macros[name] = (params, tuple((t.type, t.value) for t in lexer))
+        self.cache.clear()
+
+    def undefine(self, name):
+        self.macros.pop(name, None)
+        self.cache.clear()
+
+    def directive(self, text):
+        text = text.replace('\\\n', '')
+        m = _define.match(text)
+        if m:
+            params = None
+            if m.group(2):
+                params = [p.strip() for p in m.group(3).split(',') if p.strip()]
+            self.define(m.group(1), params, m.group(4))
+            return
+        m = _undef.match(text)
+        if m:
+            self.undefine(m.group(1))
+
+    # Next token from the lexer, with the directives that preceded it applied
+    def next(self):
+        if self.pending:
+            return self.pending.pop()
+        tok = self.lexer.token()
+        directives = self.lexer.directives
+        if directives:
+            for lexpos, text in directives:
+                self.directive(text)
+            del directives[:]
+        return tok
+
+    def token(self):
+        while True:
+            if self.output:
+                return self.output.pop()
+            tok = self.next()
+            if tok is None or tok.type != 'ID' or tok.value not in self.macros:
+                return tok
+            params = self.macros[tok.value][0]
+            args = None
+            if params is not None:
+                args = self.collect(self.next, self.pending.append)
+                if args is None:
+                    return tok
+            expansion = self.expand_macro(tok.value, args, frozenset())
+            self.output = [self.make_token(t, tok) for t in reversed(expansion)]
+
+    def make_token(self, item, origin):
+        tok = LexToken()
+        tok.type, tok.value = item
+        tok.lineno = origin.lineno
+        tok.lexpos = origin.lexpos
+        tok.lexer = self
+        return tok
+
+    # Read the arguments of a function-like macro invocation with next(),
+    # which returns tokens or (type, value) pairs.  Returns a tuple of
+    # arguments, each a tuple of (type, value) pairs, or None if no '('
+    # follows, in which case the token read is handed back to pushback().
+    def collect(self, next, pushback):
+        tok = next()
+        if tok is None or self.kind(tok) != 'LPAREN':
+            if tok is not None:
+                pushback(tok)
+            return None
+        args = []
+        arg = []
+        depth = 0
+        while True:
+            tok = next()
+            if tok is None:
+                raise SyntaxError('Unterminated macro invocation')
+            kind = self.kind(tok)
+            if kind == 'RPAREN' and depth == 0:
+                args.append(tuple(arg))
+                break
+            if kind == 'COMMA' and depth == 0:
+                args.append(tuple(arg))
+                arg = []
+                continue
+            if kind == 'LPAREN':
+                depth += 1
+            elif kind == 'RPAREN':
+                depth -= 1
+            arg.append(self.pair(tok))
+        if args == [()]:
+            args = []
+        return tuple(args)
+
+    def kind(self, tok):
+        return tok[0] if isinstance(tok, tuple) else tok.type
+
+    def pair(self, tok):
+        return tok if isinstance(tok, tuple) else (tok.type, tok.value)
+
+    # Expand an invocation of macro name with the given arguments (None for
+    # an object-like macro) and return the resulting (type, value) pairs.
+    def expand_macro(self, name, args, hidden):
+        key = (name, args, hidden)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        params, body = self.macros[name]
+        if params is not None:
+            if len(args) != len(params):
+                raise SyntaxError('Macro %s expects %d arguments, got %d' % (name, len(params), len(args)))
+            values = dict(zip(params, [self.expand(arg, hidden) for arg in args]))
+            replaced = []
+            for item in body:
+                if item[0] == 'ID' and item[1] in values:
+                    replaced.extend(values[item[1]])
+                else:
+                    replaced.append(item)
+            body = replaced
+        result = self.expand(body, hidden | frozenset([name]))
+        if self.memoize:
+            self.cache[key] = result
+        return result
+
+    # Expand all macro invocations in a sequence of (type, value) pairs
+    def expand(self, items, hidden):
+        result = []
+        items = list(items)
+        items.reverse()
+        while items:
+            item = items.pop()
+            name = item[1]
+            if item[0] != 'ID' or name not in self.macros or name in hidden:
+                result.append(item)
+                continue
+            args = None
+            if self.macros[name][0] is not None:
+                args = self.collect(lambda: items.pop() if items else None, items.append)
+                if args is None:
+                    result.append(item)
+                    continue
+            result.extend(self.expand_macro(name, args, hidden))
+        return tuple(result)
@@ -0,0 +1,116 @@
+"""
+AST node classes built by cparse.
+
+Every node class has an integer kind code, kept in its kind attribute and in a
+module constant named after the node's tag, and stores its fields in
+__slots__.  Code generation can then dispatch on node.kind with a dictionary
+instead of comparing tag strings.  Lists of declarations, instructions and so
+on are plain lists, and leaves such as identifiers and constants keep the token
+value.
+
+to_tuples() converts a tree to the nested tuples that cparse used to produce,
+('FUNC_CALL', ('ID', 'printd'), [...]) and so on.
+"""
+
+TAGS = []               # kind code -> tag
+CLASSES = []            # kind code -> node class
+
+class Node(object):
+    __slots__ = ()
+    kind = None
+    tag = None          # Tag of the old tuple form, None if it had none
+    fields = ()
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.fields)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (type(self), self.values())
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.fields))
+
+_methods = '''def __init__(self, %(args)s):
+    %(assign)s
+
+def values(self):
+    return (%(values)s)
+
+def __reduce__(self):
+    return (self.__class__, (%(values)s))
+'''
+
+def node(name, tag, fields, constant=None):
+    """
+    Create a node class with the given field names and the next kind code,
+    which is also stored in the module constant constant (by default tag).
+    """
+    fields = tuple(fields.split())
+    kind = len(TAGS)
+    TAGS.append(tag or constant)
+    namespace = {}
+    exec _methods % {'args': ', '.join(fields),
+                     'assign': '\n    '.join('self.%s = %s' % (f, f) for f in fields),
+                     'values': ''.join('self.%s, ' % f for f in fields)} in namespace
+    attrs = {'__slots__': fields, 'fields': fields, 'kind': kind, 'tag': tag}
+    for method in ('__init__', 'values', '__reduce__'):
+        attrs[method] = namespace[method]
+    cls = type(name, (Node,), attrs)
+    globals()[constant or tag] = kind
+    CLASSES.append(cls)
+    return cls
+
+FuncDef        = node('FuncDef',        'FUNC_DEF',    'type declarator body')
+VarDec         = node('VarDec',         'VAR_DEC',     'type declarators')
+Extern         = node('Extern',         'EXTERN',      'declaration')
+Type           = node('Type',           'TYPE',        'name')
+InitAssign     = node('InitAssign',     'INIT_ASSIGN', 'declarator value')
+Id             = node('Id',             'ID',          'name')
+FuncDeclarator = node('FuncDeclarator', None,          'name params', 'FUNC_DECL')
+Param          = node('Param',          None,          'type declarator', 'PARAM')
+Stat           = node('Stat',           'STAT',        'instruction')
+Compound       = node('Compound',       'COMP_STATS',  'items')
+If             = node('If',             'IF',          'condition then')
+IfElse         = node('IfElse',         'IF_ELSE',     'condition then otherwise')
+While          = node('While',          'WHILE',       'condition body')
+For            = node('For',            'FOR',         'init condition step body')
+DoWhile        = node('DoWhile',        'DO_WHILE',    'body condition')
+Return         = node('Return',         'RET',         'value')
+Condition      = node('Condition',      None,          'op left right', 'COND')
+Assign         = node('Assign',         'ASSIGN',      'target value')
+LShift         = node('LShift',         'LSHIFT',      'left right')
+RShift         = node('RShift',         'RSHIFT',      'left right')
+Add            = node('Add',            'ADD',         'left right')
+Sub            = node('Sub',            'SUB',         'left right')
+Mul            = node('Mul',            'MUL',         'left right')
+Div            = node('Div',            'DIV',         'left right')
+Mod            = node('Mod',            'MOD',         'left right')
+Neg            = node('Neg',            'NEG',         'operand')
+FuncCall       = node('FuncCall',       'FUNC_CALL',   'func args')
+PostInc        = node('PostInc',        'POST_INC',    'operand')
+PostDec        = node('PostDec',        'POST_DEC',    'operand')
+IConst         = node('IConst',         'ICONST',      'value')
+FConst         = node('FConst',         'FCONST',      'value')
+SConst         = node('SConst',         'SCONST',      'value')
+Primary        = node('Primary',        'PRIMARY',     'expr')
+
+def to_tuples(tree):
+    """
+    Convert tree, a node or a list of nodes, to the nested tuples and lists
+    that cparse used to build.
+    """
+    if isinstance(tree, Node):
+        values = tuple(to_tuples(v) for v in tree.values())
+        return (tree.tag,) + values if tree.tag else values
+    if isinstance(tree, list):
+        return [to_tuples(v) for v in tree]
+    return tree
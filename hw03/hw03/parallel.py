@@ -0,0 +1,231 @@
+"""
+Lex and parse large sources in several processes.
+
+For lexing, the source is cut at newlines that lie outside comments, string
+and character literals and preprocessor lines.  No token spans such a
+newline, so each piece can be lexed on its own with the clex rules.  The
+token arrays of the pieces are then joined with their offsets and line
+numbers shifted, which gives the same tokens as lexing the whole source in
+one go.
+
+For parsing, the source is cut after closing braces at depth zero, which end
+function definitions, so that each piece is a sequence of external
+declarations.  The pieces are lexed and parsed on their own, and their lists
+of declarations joined in order make the list a parse of the whole source
+returns.  A syntax error in a piece makes the whole source be parsed again in
+one go, so that errors are reported and recovered from as usual.
+"""
+
+import gc
+import multiprocessing
+import re
+from array import array
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import clex
+import cparse
+from ply.lex import TokenArrays
+
+# Tokens that may contain a newline or the start of one of the others, with
+# the same patterns as in clex.  Like the lexer, a search for them from the
+# start of the source skips over each match as a whole.
+_opaque = re.compile(r'"(?:[^\\\n]|\\.)*?"|/\*(?:.|\n)*?\*/|//.*|\'(?:\\(?:.|\n)|[^\\\'])*\'|\#(?:\\\n|.)*?\n')
+
+def split_points(data, pieces):
+    """
+    Return the offsets at which data can be cut into at most pieces pieces of
+    about the same size, each starting right after a safe newline.
+    """
+    points = []
+    size = len(data) // pieces
+    skips = _opaque.finditer(data)
+    start, end = -1, -1
+    pos = size
+    while len(points) < pieces - 1:
+        nl = data.find('\n', pos)
+        if nl < 0:
+            break
+        while end <= nl:
+            m = next(skips, None)
+            if m is None:
+                start, end = len(data), len(data)
+                break
+            start, end = m.span()
+        if start <= nl < end - 1:
+            pos = end - 1
+            continue
+        if nl + 1 >= len(data):
+            break
+        points.append(nl + 1)
+        pos = max(nl + 1, size * (len(points) + 1))
+    return points
+
+def _lex_piece(args):
+    piece, offset = args
+    lexer = clex.lexer.clone()
+    lexer.lineno = 0
+    tokens = lexer.tokenize_all(piece)
+
+    # Number the token types in the order of clex.tokens, so that the pieces
+    # agree on the type ids in all but unusual cases.
+    types = list(clex.tokens)
+    types.extend(t for t in tokens.types if t not in clex.tokens)
+    mapping = [types.index(t) for t in tokens.types]
+    typeids = array('H', [mapping[i] for i in tokens.typeids])
+    starts = array('l', [s + offset for s in tokens.starts])
+
+    # Most values are interned identifiers.  Send each name once and refer to
+    # it by index, which pickles much faster than a dictionary of Identifiers.
+    names, refs, keys, values = {}, array('l'), array('l'), {}
+    for i, value in tokens.values.iteritems():
+        if isinstance(value, clex.Identifier):
+            keys.append(i)
+            refs.append(names.setdefault(str(value), len(names)))
+        else:
+            values[i] = value
+    names = sorted(names, key=names.get)
+
+    # Arrays are sent as raw bytes, pickling them is slow
+    return (types, typeids.tostring(), starts.tostring(), tokens.lengths.tostring(),
+            tokens.linenos.tostring(), names, refs.tostring(), keys.tostring(),
+            values, lexer.lineno)
+
+def tokenize(data, processes=None, lineno=1, min_piece=1 << 20):
+    """
+    Lex data into a TokenArrays object, like clex.lexer.tokenize_all() does
+    for a lexer starting on line lineno. Inputs of at least two pieces of
+    min_piece bytes are split between a pool of processes (one per CPU by
+    default).
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pieces = min(processes, len(data) // min_piece)
+    points = split_points(data, pieces) if pieces > 1 else []
+
+    lexer = clex.lexer.clone()
+    if not points:
+        lexer.lineno = lineno
+        return lexer.tokenize_all(data)
+
+    bounds = zip([0] + points, points + [len(data)])
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_lex_piece, [(data[start:end], start) for start, end in bounds])
+    finally:
+        pool.close()
+        pool.join()
+
+    # Join the pieces, renumbering token types and shifting line numbers
+    lexer.input(data)
+    tokens = TokenArrays(data, lexer)
+    for types, ids, starts, lengths, linenos, names, refs, keys, values, lines in results:
+        base = len(tokens.typeids)
+        if types[:len(tokens.types)] == tokens.types[:len(types)]:
+            tokens.types[len(tokens.types):] = types[len(tokens.types):]
+            tokens.typeids.fromstring(ids)
+        else:
+            mapping = []
+            for t in types:
+                if t not in tokens.types:
+                    tokens.types.append(t)
+                mapping.append(tokens.types.index(t))
+            tokens.typeids.extend([mapping[i] for i in array('H', ids)])
+        tokens.starts.fromstring(starts)
+        tokens.lengths.fromstring(lengths)
+        tokens.linenos.extend([n + lineno for n in array('l', linenos)])
+        names = map(clex.intern_name, names)
+        tokens.values.update(zip([base + i for i in array('l', keys)],
+                                 [names[j] for j in array('l', refs)]))
+        for i, value in values.iteritems():
+            tokens.values[base + i] = value
+        lineno += lines
+    lexer.lineno = lineno
+    return tokens
+
+_braces = re.compile(_opaque.pattern + r'|[{}]')
+
+def declaration_points(data, pieces):
+    """
+    Return the offsets at which data can be cut into at most pieces pieces of
+    about the same size, each starting right after the closing brace of a
+    function body.
+    """
+    points = []
+    size = len(data) // pieces
+    depth = 0
+    for m in _braces.finditer(data):
+        c = m.group()
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0 and m.end() >= size * (len(points) + 1) and m.end() < len(data):
+                points.append(m.end())
+                if len(points) == pieces - 1:
+                    break
+    return points
+
+class _PieceError(Exception):
+    pass
+
+def _piece_error(t):
+    raise _PieceError()
+
+def _parse_piece(piece):
+    # Returns the declarations of piece pickled, to be unpickled by parse()
+    # with the collector paused, or None on a syntax error
+    tokens = clex.lexer.clone().tokenize_all(piece)
+    tree = []
+    if len(tokens):
+        parser = cparse.get_parser()
+        errorfunc = parser.errorfunc
+        parser.errorfunc = _piece_error
+        gc.disable()
+        try:
+            tree = parser.parse(tokens)
+        except _PieceError:
+            return None
+        finally:
+            parser.errorfunc = errorfunc
+            gc.enable()
+    return pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+
+def parse(data, processes=None, min_piece=1 << 20):
+    """
+    Parse data into a list of declarations, like cparse.parser.parse() does
+    with the tokens of data. Inputs of at least two pieces of min_piece bytes
+    are split between a pool of processes (one per CPU by default).
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pieces = min(processes, len(data) // min_piece)
+    points = declaration_points(data, pieces) if pieces > 1 else []
+
+    if points:
+        bounds = zip([0] + points, points + [len(data)])
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_parse_piece, [data[start:end] for start, end in bounds])
+        finally:
+            pool.close()
+            pool.join()
+        if None not in results:
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                decls = []
+                for result in results:
+                    decls.extend(pickle.loads(result))
+                return decls
+            finally:
+                if enabled:
+                    gc.enable()
+        # Lex as the parse goes, which may stop at the error budget of
+        # cparse.collect_errors() well before the end
+        return cparse.parser.parse(data, lexer=clex.lexer.clone())
+
+    return cparse.parser.parse(tokenize(data, processes, min_piece=min_piece))
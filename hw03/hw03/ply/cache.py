@@ -0,0 +1,149 @@
+# -----------------------------------------------------------------------------
+# ply: cache.py
+#
+# A directory of lexer and parser tables shared by many processes.
+#
+# lex(cachedir=...) and yacc(cachedir=...) keep their tables in the directory
+# under a hash of the token rules or the grammar, so processes using the same
+# rules share one set of tables and a changed grammar never picks up stale
+# ones.  Files are written to a temporary name and renamed into place, so a
+# reader sees either a complete file or none.  A process that finds no tables
+# takes an exclusive lock for them and looks again before building them, so
+# processes started together wait for the first one to write the tables
+# instead of all building them.  The lock file is removed when the lock is
+# released.  A cache directory that cannot be written is not an error; the
+# tables are then built in memory as without a cache.
+#
+# Lazy stands in for a lexer or parser until it is first used, so that
+# importing the module that defines it does not load the tables.
+# -----------------------------------------------------------------------------
+
+import contextlib
+import errno
+import hashlib
+import os
+import sys
+
+try:
+    import importlib.util
+except ImportError:
+    import imp          # Python 2
+    importlib = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Default cache directory
+CACHE_DIR = os.environ.get('PLY_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'ply')
+
+def key(*parts):
+    parts = [p if isinstance(p, bytes) else p.encode('utf-8') for p in parts]
+    return hashlib.sha1(b'\0'.join(parts)).hexdigest()
+
+def makedirs(dirname):
+    try:
+        os.makedirs(dirname)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+@contextlib.contextmanager
+def replacing(filename, mode='w'):
+    """
+    Open a temporary file to write in place of filename, and rename it to
+    filename once the with block completes.
+    """
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp, mode) as f:
+            yield f
+        os.rename(tmp, filename)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def load_source(name, filename):
+    """
+    Import the Python source file filename as module name.
+    """
+    if importlib is None:
+        return imp.load_source(name, filename)
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except:
+        del sys.modules[name]
+        raise
+    return module
+
+def load_module(name, filename):
+    if not os.path.exists(filename):
+        raise ImportError('No module %s in %s' % (name, filename))
+    return load_source(name, filename)
+
+class FileLock(object):
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    @property
+    def held(self):
+        return self.f is not None
+
+    def acquire(self):
+        """
+        Wait for an exclusive lock on path. Returns False if the lock file
+        cannot be created.
+        """
+        while True:
+            try:
+                makedirs(os.path.dirname(self.path))
+                f = open(self.path, 'a')
+            except (IOError, OSError):
+                return False
+            if not fcntl:
+                break
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # The holder removes the file before releasing it, in which case
+            # the lock is taken again on the file now at path
+            try:
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(self.path)):
+                    break
+            except OSError:
+                pass
+            f.close()
+        self.f = f
+        return True
+
+    def release(self):
+        if self.f is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            if fcntl:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            self.f.close()
+            self.f = None
+
+class Lazy(object):
+    """
+    Stand-in for the object returned by factory(), which is called on each
+    attribute lookup. factory should build the object on its first call and
+    return the same one afterwards.
+    """
+    __slots__ = ('factory',)
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self.factory(), name)
+
+    def __repr__(self):
+        return '<lazy %s>' % self.factory.__name__
@@ -39,7 +39,10 @@ import sys
 import types
 import copy
 import os
-import inspect
+from array import array
+from bisect import bisect_right
+
+from . import cache
 
 # This tuple contains known string types
 try:
@@ -60,8 +63,11 @@ class LexError(Exception):
         self.text = s
 
 
-# Token class.  This class is used to represent the tokens produced.
+# Token class.  This class is used to represent the tokens produced.  One is
+# created for every token, so it uses __slots__ instead of an instance dict.
 class LexToken(object):
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'lexer', 'endlineno', 'endlexpos')
+
     def __str__(self):
         return 'LexToken(%s,%r,%d,%d)' % (self.type, self.value, self.lineno, self.lexpos)
 
@@ -69,6 +75,182 @@ class LexToken(object):
         return str(self)
 
 
+# Columnar token storage produced by Lexer.tokenize_all().  Token i has type
+# types[typeids[i]] and spans lexdata[starts[i]:starts[i]+lengths[i]].  Values
+# that a rule function replaced with something other than the matched text
+# (including an equal string of another type) are kept in the values
+# dictionary, keyed by token index.
+class TokenArrays(object):
+    def __init__(self, lexdata, lexer=None):
+        self.lexdata = lexdata
+        self.lexer = lexer
+        self.types = []                 # Token type names, indexed by type id
+        self.typeids = array('H')       # Type id of each token
+        self.starts = array('l')        # Offset of each token in lexdata
+        self.lengths = array('l')       # Length of the text matched by each token
+        self.linenos = array('l')       # Line number of each token
+        self.values = {}                # Token index -> value, when not the matched text
+
+    def __len__(self):
+        return len(self.typeids)
+
+    def type(self, i):
+        return self.types[self.typeids[i]]
+
+    def value(self, i):
+        if i in self.values:
+            return self.values[i]
+        start = self.starts[i]
+        return self.lexdata[start:start + self.lengths[i]]
+
+    # Tokens start to end as a TokenArrays on the same data
+    def slice(self, start, end):
+        tokens = TokenArrays(self.lexdata, self.lexer)
+        tokens.types = self.types
+        tokens.typeids = self.typeids[start:end]
+        tokens.starts = self.starts[start:end]
+        tokens.lengths = self.lengths[start:end]
+        tokens.linenos = self.linenos[start:end]
+        values = self.values
+        tokens.values = dict((i - start, values[i]) for i in range(start, end) if i in values)
+        return tokens
+
+    # Materialize token i as a LexToken
+    def token(self, i):
+        tok = LexToken()
+        tok.type = self.types[self.typeids[i]]
+        tok.value = self.value(i)
+        tok.lineno = self.linenos[i]
+        tok.lexpos = self.starts[i]
+        tok.lexer = self.lexer
+        return tok
+
+    # Return a token() style function that produces LexTokens one at a time,
+    # from token start on
+    def feed(self, start=0):
+        it = iter(range(start, len(self.typeids)))
+        def token():
+            for i in it:
+                return self.token(i)
+            return None
+        return token
+
+    def __iter__(self):
+        for i in range(len(self.typeids)):
+            yield self.token(i)
+
+# A list of LexTokens kept up to date across edits by Lexer.relex().  An edit
+# shifts the position of every token after it.  Rather than rewriting them,
+# the list records the shift of the tokens from index gap on, and applies it
+# to a token when it is read or when the gap moves past it to a later edit,
+# so that each edit costs in proportion to the tokens around it and between
+# it and the previous one.  Tokens taken out of the list before an edit are
+# not shifted by it.
+class TokenList(object):
+    def __init__(self, tokens=()):
+        self.tokens = list(tokens)
+        self.gap = len(self.tokens)     # The tokens from index gap on are
+        self.dpos = 0                   # dpos characters and dline lines
+        self.dline = 0                  # before their true position
+        self.syncpoints = []            # Offsets at which relex() can restart, see there
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self.tokens))
+            self.move(max(stop, self.gap))
+        else:
+            if i < 0:
+                i += len(self.tokens)
+            if i >= self.gap:
+                self.move(i + 1)
+        return self.tokens[i]
+
+    def __iter__(self):
+        for i in range(len(self.tokens)):
+            yield self[i]
+
+    # The position and line number of token i, without moving the gap
+    def lexpos(self, i):
+        return self.tokens[i].lexpos + (self.dpos if i >= self.gap else 0)
+
+    def lineno(self, i):
+        return self.tokens[i].lineno + (self.dline if i >= self.gap else 0)
+
+    # Index of the first token at or after position lexpos, from lo on
+    def bisect(self, lexpos, lo=0):
+        hi = len(self.tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.lexpos(mid) < lexpos:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Move the gap to index gap, shifting the tokens in between
+    def move(self, gap):
+        if self.dpos or self.dline:
+            tokens, dpos, dline = self.tokens, self.dpos, self.dline
+            if gap < self.gap:
+                dpos, dline = -dpos, -dline
+                indices = range(gap, self.gap)
+            else:
+                indices = range(self.gap, gap)
+            for i in indices:
+                tok = tokens[i]
+                tok.lexpos += dpos
+                tok.lineno += dline
+        self.gap = gap
+        if gap == len(self.tokens):
+            self.dpos = self.dline = 0
+
+    # Shift the tokens from index i on
+    def shift(self, i, dpos, dline):
+        self.move(i)
+        self.dpos += dpos
+        self.dline += dline
+
+    # Replace tokens first to last by the list new, which are at their true
+    # positions
+    def replace(self, first, last, new):
+        if self.gap < first:
+            self.move(first)
+        if self.gap <= last:
+            gap = first + len(new)
+        else:
+            gap = self.gap - (last - first) + len(new)
+        self.tokens[first:last] = new
+        self.gap = gap
+        if gap == len(self.tokens):
+            self.dpos = self.dline = 0
+
+# Offsets at which the lines of a string start.  The index is built once per
+# input and turns a lexpos into a line and column number (both counted from 1)
+# with a binary search, so that lexers need not count newlines as they go.
+class LineIndex(object):
+    def __init__(self, lexdata):
+        self.starts = array('l', [0])
+        append = self.starts.append
+        find = lexdata.find
+        pos = find('\n')
+        while pos >= 0:
+            append(pos + 1)
+            pos = find('\n', pos + 1)
+
+    def lineno(self, lexpos):
+        return bisect_right(self.starts, lexpos)
+
+    def column(self, lexpos):
+        return lexpos - self.starts[bisect_right(self.starts, lexpos) - 1] + 1
+
+    def position(self, lexpos):
+        line = bisect_right(self.starts, lexpos)
+        return line, lexpos - self.starts[line - 1] + 1
+
+
 # This object is a stand-in for a logging object created by the
 # logging module.
 
@@ -140,6 +322,8 @@ class Lexer:
         self.lexmodule = None         # Module
         self.lineno = 1               # Current line number
         self.lexoptimize = False      # Optimized mode
+        self.lexlineindex = None      # LineIndex of the input, built on demand
+        self.lexopaque = None         # Regex of the text that may span a newline, see relex()
 
     def clone(self, object=None):
         c = copy.copy(self)
@@ -176,7 +360,7 @@ class Lexer:
             raise IOError("Won't overwrite existing lextab module")
         basetabmodule = lextab.split('.')[-1]
         filename = os.path.join(outputdir, basetabmodule) + '.py'
-        with open(filename, 'w') as tf:
+        with cache.replacing(filename) as tf:
             tf.write('# %s.py. This file automatically created by PLY (version %s). Don\'t edit!\n' % (basetabmodule, __version__))
             tf.write('_tabversion   = %s\n' % repr(__tabversion__))
             tf.write('_lextokens    = %s\n' % repr(self.lextokens))
@@ -247,15 +431,28 @@ class Lexer:
 
     # ------------------------------------------------------------
     # input() - Push a new string into the lexer
+    #
+    # s may also be a memory-mapped file.  Matching then runs directly over
+    # the mapping and only the text of each token is copied out of it.
     # ------------------------------------------------------------
     def input(self, s):
         # Pull off the first character to see if s looks like a string
+        # (slicing an mmap yields a string too)
         c = s[:1]
         if not isinstance(c, StringTypes):
             raise ValueError('Expected a string')
         self.lexdata = s
         self.lexpos = 0
         self.lexlen = len(s)
+        self.lexlineindex = None
+
+    # ------------------------------------------------------------
+    # lineindex() - Return the LineIndex of the current input
+    # ------------------------------------------------------------
+    def lineindex(self):
+        if self.lexlineindex is None:
+            self.lexlineindex = LineIndex(self.lexdata)
+        return self.lexlineindex
 
     # ------------------------------------------------------------
     # begin() - Changes the lexing state
@@ -411,6 +608,210 @@ class Lexer:
             raise RuntimeError('No input string given with input()')
         return None
 
+    # ------------------------------------------------------------
+    # tokenize_all() - Lex the whole input into a TokenArrays object
+    #
+    # Produces the same token stream as repeated calls to token(), but
+    # stores it in parallel arrays instead of creating a LexToken for
+    # every token.  Rule functions are called with a single scratch
+    # token that is reused for the whole input, so they must not keep
+    # references to it.
+    # ------------------------------------------------------------
+    def tokenize_all(self, s=None):
+        if s is not None:
+            self.input(s)
+
+        lexpos    = self.lexpos
+        lexlen    = self.lexlen
+        lexignore = self.lexignore
+        lexdata   = self.lexdata
+
+        result   = TokenArrays(lexdata, self)
+        typeids  = {}
+        types    = result.types
+        add_type = result.typeids.append
+        add_pos  = result.starts.append
+        add_len  = result.lengths.append
+        add_line = result.linenos.append
+        values   = result.values
+        scratch  = LexToken()
+
+        while lexpos < lexlen:
+            if lexdata[lexpos] in lexignore:
+                lexpos += 1
+                continue
+
+            for lexre, lexindexfunc in self.lexre:
+                m = lexre.match(lexdata, lexpos)
+                if not m:
+                    continue
+
+                end = m.end()
+                func, toktype = lexindexfunc[m.lastindex]
+
+                if not func:
+                    if not toktype:
+                        lexpos = end
+                        break
+                    lineno = self.lineno
+                    nextpos = end
+                else:
+                    text = m.group()
+                    tok = scratch
+                    tok.value = text
+                    tok.type = toktype
+                    tok.lineno = self.lineno
+                    tok.lexpos = lexpos
+                    tok.lexer = self
+                    self.lexmatch = m
+                    self.lexpos = end
+
+                    newtok = func(tok)
+
+                    if not newtok:
+                        lexpos    = self.lexpos
+                        lexignore = self.lexignore
+                        break
+
+                    if not self.lexoptimize:
+                        if newtok.type not in self.lextokens_all:
+                            raise LexError("%s:%d: Rule '%s' returned an unknown token type '%s'" % (
+                                func.__code__.co_filename, func.__code__.co_firstlineno,
+                                func.__name__, newtok.type), lexdata[lexpos:])
+
+                    toktype = newtok.type
+                    lineno = newtok.lineno
+                    value = newtok.value
+                    if value is not text and (value.__class__ is not text.__class__ or value != text):
+                        values[len(result.typeids)] = newtok.value
+                    nextpos = self.lexpos
+
+                tid = typeids.get(toktype)
+                if tid is None:
+                    tid = typeids[toktype] = len(types)
+                    types.append(toktype)
+                add_type(tid)
+                add_pos(lexpos)
+                add_len(end - lexpos)
+                add_line(lineno)
+                lexpos = nextpos
+                break
+            else:
+                # No regular expression matched.  Fall back on token() so that
+                # literals and t_error() are handled in exactly one place.
+                self.lexpos = lexpos
+                tok = self.token()
+                lexpos = self.lexpos
+                lexignore = self.lexignore
+                if tok is None:
+                    break
+                tid = typeids.get(tok.type)
+                if tid is None:
+                    tid = typeids[tok.type] = len(types)
+                    types.append(tok.type)
+                end = tok.lexpos + len(tok.value) if isinstance(tok.value, StringTypes) else lexpos
+                if tok.value != lexdata[tok.lexpos:end]:
+                    values[len(result.typeids)] = tok.value
+                add_type(tid)
+                add_pos(tok.lexpos)
+                add_len(end - tok.lexpos)
+                add_line(tok.lineno)
+
+        self.lexpos = lexpos
+        return result
+
+    # ------------------------------------------------------------
+    # relex() - Update a list of tokens after an edit
+    #
+    # tokens is a TokenList of the tokens produced for the text before the
+    # edit.  s is the text after it, in which the old text from start to
+    # oldend was replaced by s[start:newend].  Lexing restarts before the
+    # edit at a point from which it is known to give the old tokens (see
+    # resync_point()) and stops as soon as a new token lines up with an
+    # old token after the edit: same position once shifted, same type and
+    # value.  From there on the old tokens are kept and shifted by the
+    # TokenList.  tokens is updated in place; the return value is the
+    # (first, last) slice of tokens that was lexed anew.
+    #
+    # When lexing restarts at the start of the text, self.lineno must be
+    # the line number of the start of the text, just as for input().
+    # Lexers with several states are always relexed from the start of the
+    # text to the end, since a position says nothing about the state the
+    # lexer was in.
+    # ------------------------------------------------------------
+    def relex(self, tokens, s, start, oldend, newend):
+        delta = newend - oldend
+
+        # Restart at the last token that begins before the resync point
+        lo = tokens.bisect(self.resync_point(tokens, s, start))
+        first = max(lo - 1, 0)
+
+        # Old tokens that begin after the edit are candidates for resynchronizing
+        last = tokens.bisect(oldend, lo)
+
+        self.input(s)
+        if lo > 0:
+            self.lexpos = tokens.lexpos(first)
+            self.lineno = tokens.lineno(first)
+        resync = len(self.lexstatere) == 1
+
+        new = []
+        ntokens = len(tokens)
+        while True:
+            tok = self.token()
+            if not tok:
+                last = ntokens
+                break
+            while last < ntokens and tokens.lexpos(last) + delta < tok.lexpos:
+                last += 1
+            if resync and last < ntokens:
+                old = tokens.tokens[last]
+                if tokens.lexpos(last) + delta == tok.lexpos and old.type == tok.type and old.value == tok.value:
+                    tokens.shift(last, delta, tok.lineno - tokens.lineno(last))
+                    self.lexpos = self.lexlen
+                    break
+            new.append(tok)
+
+        tokens.replace(first, last, new)
+        return first, first + len(new)
+
+    # ------------------------------------------------------------
+    # resync_point() - Where relex() can restart lexing before an edit
+    #
+    # Matches of the master regular expression stop at a newline, except
+    # those of rules for text such as comments, strings or directives,
+    # which may span newlines or, when they are not closed, look past them
+    # up to the end of the input.  self.lexopaque matches that text, from
+    # its start to its end or to the end of the input if it is not closed.
+    # The offset after a newline that lies outside its matches in s[:end]
+    # is a point from which lexing gives the same tokens whatever follows
+    # end, and which stays one for as long as the text before it is not
+    # edited.  The last such offset before end is returned, or 0 if the
+    # lexer has no lexopaque.  Points found on the way are kept in
+    # tokens.syncpoints, from the last of which later calls scan on.
+    # ------------------------------------------------------------
+    def resync_point(self, tokens, s, end):
+        opaque = self.lexopaque
+        if opaque is None or len(self.lexstatere) != 1:
+            return 0
+        points = tokens.syncpoints
+        del points[bisect_right(points, end):]
+        pos = safe = points[-1] if points else 0
+        rfind = s.rfind
+        for m in opaque.finditer(s, pos, end):
+            nl = rfind('\n', pos, m.start())
+            if nl >= 0:
+                safe = nl + 1
+                if not points or safe - points[-1] >= 4096:
+                    points.append(safe)
+            pos = m.end()
+        nl = rfind('\n', pos, end)
+        if nl >= 0:
+            safe = nl + 1
+        if safe and (not points or safe > points[-1]):
+            points.append(safe)
+        return safe
+
     # Iterator interface
     def __iter__(self):
         return self
@@ -573,6 +974,19 @@ class LexerReflect(object):
         self.get_states()
         self.get_rules()
 
+    # Compute a signature over the rules, which identifies the tables
+    def signature(self):
+        parts = [repr(self.tokens), repr(self.literals), repr(sorted(self.stateinfo.items())),
+                 repr(self.reflags)]
+        for state in sorted(self.stateinfo):
+            parts.append(repr([(fname, _get_regex(f)) for fname, f in self.funcsym[state]]))
+            parts.append(repr(self.strsym[state]))
+            parts.append(repr(self.ignore.get(state)))
+            for funcs in (self.errorf, self.eoff):
+                f = funcs.get(state)
+                parts.append(f.__name__ if f else '')
+        return ' '.join(parts)
+
     # Validate all of the information
     def validate_all(self):
         self.validate_tokens()
@@ -727,6 +1141,8 @@ class LexerReflect(object):
 
     # Validate all of the t_rules collected
     def validate_rules(self):
+        import inspect
+
         for state in self.stateinfo:
             # Validate all rules defined by functions
 
@@ -830,6 +1246,8 @@ class LexerReflect(object):
     # -----------------------------------------------------------------------------
 
     def validate_module(self, module):
+        import inspect
+
         lines, linen = inspect.getsourcelines(module)
 
         fre = re.compile(r'\s*def\s+(t_[a-zA-Z_0-9]*)\(')
@@ -858,7 +1276,7 @@ class LexerReflect(object):
 # Build all of the regular expression rules from definitions in the supplied module
 # -----------------------------------------------------------------------------
 def lex(module=None, object=None, debug=False, optimize=False, lextab='lextab',
-        reflags=0, nowarn=False, outputdir=None, debuglog=None, errorlog=None):
+        reflags=0, nowarn=False, outputdir=None, debuglog=None, errorlog=None, cachedir=None):
 
     if lextab is None:
         lextab = 'lextab'
@@ -906,142 +1324,164 @@ def lex(module=None, object=None, debug=False, optimize=False, lextab='lextab',
         if linfo.validate_all():
             raise SyntaxError("Can't build lexer")
 
-    if optimize and lextab:
-        try:
-            lexobj.readtab(lextab, ldict)
-            token = lexobj.token
-            input = lexobj.input
-            lexer = lexobj
-            return lexobj
-
-        except ImportError:
-            pass
-
-    # Dump some basic debugging information
-    if debug:
-        debuglog.info('lex: tokens   = %r', linfo.tokens)
-        debuglog.info('lex: literals = %r', linfo.literals)
-        debuglog.info('lex: states   = %r', linfo.stateinfo)
-
-    # Build a dictionary of valid token names
-    lexobj.lextokens = set()
-    for n in linfo.tokens:
-        lexobj.lextokens.add(n)
-
-    # Get literals specification
-    if isinstance(linfo.literals, (list, tuple)):
-        lexobj.lexliterals = type(linfo.literals[0])().join(linfo.literals)
-    else:
-        lexobj.lexliterals = linfo.literals
-
-    lexobj.lextokens_all = lexobj.lextokens | set(lexobj.lexliterals)
+    # In optimize mode with a cache directory, the table is kept in the cache
+    # under the signature of the rules (see the cache module)
+    lock = None
+    try:
+        if optimize and cachedir:
+            lextab = 'lextab_' + cache.key(linfo.signature(), __tabversion__)
+            outputdir = cachedir
+            tabfile = os.path.join(cachedir, lextab + '.py')
+
+        while optimize and lextab:
+            try:
+                if cachedir:
+                    lexobj.readtab(cache.load_module(lextab, tabfile), ldict)
+                else:
+                    lexobj.readtab(lextab, ldict)
+                token = lexobj.token
+                input = lexobj.input
+                lexer = lexobj
+                return lexobj
+
+            except ImportError:
+                pass
+
+            # Wait for any other process building the table, and look again
+            if not cachedir or lock:
+                break
+            lock = cache.FileLock(tabfile + '.lock')
+            if not lock.acquire():
+                break
+
+        # Dump some basic debugging information
+        if debug:
+            debuglog.info('lex: tokens   = %r', linfo.tokens)
+            debuglog.info('lex: literals = %r', linfo.literals)
+            debuglog.info('lex: states   = %r', linfo.stateinfo)
+
+        # Build a dictionary of valid token names
+        lexobj.lextokens = set()
+        for n in linfo.tokens:
+            lexobj.lextokens.add(n)
+
+        # Get literals specification
+        if isinstance(linfo.literals, (list, tuple)):
+            lexobj.lexliterals = type(linfo.literals[0])().join(linfo.literals)
+        else:
+            lexobj.lexliterals = linfo.literals
 
-    # Get the stateinfo dictionary
-    stateinfo = linfo.stateinfo
+        lexobj.lextokens_all = lexobj.lextokens | set(lexobj.lexliterals)
 
-    regexs = {}
-    # Build the master regular expressions
-    for state in stateinfo:
-        regex_list = []
+        # Get the stateinfo dictionary
+        stateinfo = linfo.stateinfo
 
-        # Add rules defined by functions first
-        for fname, f in linfo.funcsym[state]:
-            line = f.__code__.co_firstlineno
-            file = f.__code__.co_filename
-            regex_list.append('(?P<%s>%s)' % (fname, _get_regex(f)))
-            if debug:
-                debuglog.info("lex: Adding rule %s -> '%s' (state '%s')", fname, _get_regex(f), state)
+        regexs = {}
+        # Build the master regular expressions
+        for state in stateinfo:
+            regex_list = []
 
-        # Now add all of the simple rules
-        for name, r in linfo.strsym[state]:
-            regex_list.append('(?P<%s>%s)' % (name, r))
-            if debug:
-                debuglog.info("lex: Adding rule %s -> '%s' (state '%s')", name, r, state)
+            # Add rules defined by functions first
+            for fname, f in linfo.funcsym[state]:
+                line = f.__code__.co_firstlineno
+                file = f.__code__.co_filename
+                regex_list.append('(?P<%s>%s)' % (fname, _get_regex(f)))
+                if debug:
+                    debuglog.info("lex: Adding rule %s -> '%s' (state '%s')", fname, _get_regex(f), state)
 
-        regexs[state] = regex_list
+            # Now add all of the simple rules
+            for name, r in linfo.strsym[state]:
+                regex_list.append('(?P<%s>%s)' % (name, r))
+                if debug:
+                    debuglog.info("lex: Adding rule %s -> '%s' (state '%s')", name, r, state)
 
-    # Build the master regular expressions
+            regexs[state] = regex_list
 
-    if debug:
-        debuglog.info('lex: ==== MASTER REGEXS FOLLOW ====')
+        # Build the master regular expressions
 
-    for state in regexs:
-        lexre, re_text, re_names = _form_master_re(regexs[state], reflags, ldict, linfo.toknames)
-        lexobj.lexstatere[state] = lexre
-        lexobj.lexstateretext[state] = re_text
-        lexobj.lexstaterenames[state] = re_names
         if debug:
-            for i, text in enumerate(re_text):
-                debuglog.info("lex: state '%s' : regex[%d] = '%s'", state, i, text)
-
-    # For inclusive states, we need to add the regular expressions from the INITIAL state
-    for state, stype in stateinfo.items():
-        if state != 'INITIAL' and stype == 'inclusive':
-            lexobj.lexstatere[state].extend(lexobj.lexstatere['INITIAL'])
-            lexobj.lexstateretext[state].extend(lexobj.lexstateretext['INITIAL'])
-            lexobj.lexstaterenames[state].extend(lexobj.lexstaterenames['INITIAL'])
-
-    lexobj.lexstateinfo = stateinfo
-    lexobj.lexre = lexobj.lexstatere['INITIAL']
-    lexobj.lexretext = lexobj.lexstateretext['INITIAL']
-    lexobj.lexreflags = reflags
-
-    # Set up ignore variables
-    lexobj.lexstateignore = linfo.ignore
-    lexobj.lexignore = lexobj.lexstateignore.get('INITIAL', '')
-
-    # Set up error functions
-    lexobj.lexstateerrorf = linfo.errorf
-    lexobj.lexerrorf = linfo.errorf.get('INITIAL', None)
-    if not lexobj.lexerrorf:
-        errorlog.warning('No t_error rule is defined')
-
-    # Set up eof functions
-    lexobj.lexstateeoff = linfo.eoff
-    lexobj.lexeoff = linfo.eoff.get('INITIAL', None)
-
-    # Check state information for ignore and error rules
-    for s, stype in stateinfo.items():
-        if stype == 'exclusive':
-            if s not in linfo.errorf:
-                errorlog.warning("No error rule is defined for exclusive state '%s'", s)
-            if s not in linfo.ignore and lexobj.lexignore:
-                errorlog.warning("No ignore rule is defined for exclusive state '%s'", s)
-        elif stype == 'inclusive':
-            if s not in linfo.errorf:
-                linfo.errorf[s] = linfo.errorf.get('INITIAL', None)
-            if s not in linfo.ignore:
-                linfo.ignore[s] = linfo.ignore.get('INITIAL', '')
-
-    # Create global versions of the token() and input() functions
-    token = lexobj.token
-    input = lexobj.input
-    lexer = lexobj
-
-    # If in optimize mode, we write the lextab
-    if lextab and optimize:
-        if outputdir is None:
-            # If no output directory is set, the location of the output files
-            # is determined according to the following rules:
-            #     - If lextab specifies a package, files go into that package directory
-            #     - Otherwise, files go in the same directory as the specifying module
-            if isinstance(lextab, types.ModuleType):
-                srcfile = lextab.__file__
-            else:
-                if '.' not in lextab:
-                    srcfile = ldict['__file__']
-                else:
-                    parts = lextab.split('.')
-                    pkgname = '.'.join(parts[:-1])
-                    exec('import %s' % pkgname)
-                    srcfile = getattr(sys.modules[pkgname], '__file__', '')
-            outputdir = os.path.dirname(srcfile)
-        try:
-            lexobj.writetab(lextab, outputdir)
-        except IOError as e:
-            errorlog.warning("Couldn't write lextab module %r. %s" % (lextab, e))
+            debuglog.info('lex: ==== MASTER REGEXS FOLLOW ====')
 
-    return lexobj
+        for state in regexs:
+            lexre, re_text, re_names = _form_master_re(regexs[state], reflags, ldict, linfo.toknames)
+            lexobj.lexstatere[state] = lexre
+            lexobj.lexstateretext[state] = re_text
+            lexobj.lexstaterenames[state] = re_names
+            if debug:
+                for i, text in enumerate(re_text):
+                    debuglog.info("lex: state '%s' : regex[%d] = '%s'", state, i, text)
+
+        # For inclusive states, we need to add the regular expressions from the INITIAL state
+        for state, stype in stateinfo.items():
+            if state != 'INITIAL' and stype == 'inclusive':
+                lexobj.lexstatere[state].extend(lexobj.lexstatere['INITIAL'])
+                lexobj.lexstateretext[state].extend(lexobj.lexstateretext['INITIAL'])
+                lexobj.lexstaterenames[state].extend(lexobj.lexstaterenames['INITIAL'])
+
+        lexobj.lexstateinfo = stateinfo
+        lexobj.lexre = lexobj.lexstatere['INITIAL']
+        lexobj.lexretext = lexobj.lexstateretext['INITIAL']
+        lexobj.lexreflags = reflags
+
+        # Set up ignore variables
+        lexobj.lexstateignore = linfo.ignore
+        lexobj.lexignore = lexobj.lexstateignore.get('INITIAL', '')
+
+        # Set up error functions
+        lexobj.lexstateerrorf = linfo.errorf
+        lexobj.lexerrorf = linfo.errorf.get('INITIAL', None)
+        if not lexobj.lexerrorf:
+            errorlog.warning('No t_error rule is defined')
+
+        # Set up eof functions
+        lexobj.lexstateeoff = linfo.eoff
+        lexobj.lexeoff = linfo.eoff.get('INITIAL', None)
+
+        # Check state information for ignore and error rules
+        for s, stype in stateinfo.items():
+            if stype == 'exclusive':
+                if s not in linfo.errorf:
+                    errorlog.warning("No error rule is defined for exclusive state '%s'", s)
+                if s not in linfo.ignore and lexobj.lexignore:
+                    errorlog.warning("No ignore rule is defined for exclusive state '%s'", s)
+            elif stype == 'inclusive':
+                if s not in linfo.errorf:
+                    linfo.errorf[s] = linfo.errorf.get('INITIAL', None)
+                if s not in linfo.ignore:
+                    linfo.ignore[s] = linfo.ignore.get('INITIAL', '')
+
+        # Create global versions of the token() and input() functions
+        token = lexobj.token
+        input = lexobj.input
+        lexer = lexobj
+
+        # If in optimize mode, we write the lextab
+        if lextab and optimize:
+            if outputdir is None:
+                # If no output directory is set, the location of the output files
+                # is determined according to the following rules:
+                #     - If lextab specifies a package, files go into that package directory
+                #     - Otherwise, files go in the same directory as the specifying module
+                if isinstance(lextab, types.ModuleType):
+                    srcfile = lextab.__file__
+                else:
+                    if '.' not in lextab:
+                        srcfile = ldict['__file__']
+                    else:
+                        parts = lextab.split('.')
+                        pkgname = '.'.join(parts[:-1])
+                        exec('import %s' % pkgname)
+                        srcfile = getattr(sys.modules[pkgname], '__file__', '')
+                outputdir = os.path.dirname(srcfile)
+            try:
+                lexobj.writetab(lextab, outputdir)
+            except (IOError, OSError) as e:
+                errorlog.warning("Couldn't write lextab module %r. %s" % (lextab, e))
+
+        return lexobj
+    finally:
+        if lock:
+            lock.release()
 
 # -----------------------------------------------------------------------------
 # runmain()
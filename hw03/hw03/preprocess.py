@@ -1,18 +1,282 @@
+import hashlib
+import mmap
+import os
 import re
+import stat
 import sys
+from array import array
+from bisect import bisect_right
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from ply import cache
+from ply.lex import LineIndex
+
+def read_source(f):
+    """
+    Return the contents of file f. A non-empty regular file is memory-mapped
+    rather than read, so the lexer can work on it without a copy.
+    """
+    info = os.fstat(f.fileno())
+    if stat.S_ISREG(info.st_mode) and info.st_size > 0:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return f.read()
+
+# Directory of the parsed header cache
+CACHE_DIR = os.environ.get('CPARSE_HEADER_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'cparse-headers'))
+
+_include = re.compile(r'^[ \t]*\#[ \t]*include[ \t]*"([^"\n]+)"[^\n]*', re.MULTILINE)
+_directive = re.compile(r'^[ \t]*\#(?:\\\n|.)*$', re.MULTILINE)
+
+_fingerprints = {}
+
+def grammar_fingerprint(parser):
+    """
+    Hash of the grammar rules of parser and the code of their actions, which
+    determine the AST built for a given source.
+    """
+    if parser not in _fingerprints:
+        h = hashlib.sha1()
+        for p in parser.productions:
+            h.update(p.str)
+            if p.callable:
+                code = p.callable.__code__
+                h.update(code.co_code)
+                h.update(repr(code.co_consts))
+        _fingerprints[parser] = h.hexdigest()
+    return _fingerprints[parser]
+
+def split_includes(source_code, directives=False):
+    """
+    Split source_code at its #include "file" lines. Returns a list of pieces,
+    ('source', text) or ('include', file name), in order. Source pieces are
+    padded with newlines so that line numbers stay those of source_code, and
+    pieces with nothing but comments and directives are left out, unless
+    directives is true, in which case only those with nothing but comments
+    are.
+    """
+    pieces = []
+    pos = 0
+    for m in _include.finditer(source_code):
+        add_source(pieces, source_code, pos, m.start(), directives)
+        pieces.append(('include', m.group(1)))
+        pos = m.end()
+    if pos == 0:
+        return [('source', source_code)]
+    add_source(pieces, source_code, pos, len(source_code), directives)
+    return pieces
+
+def add_source(pieces, source_code, start, end, directives):
+    text = source_code[start:end]
+    if has_code(text) or (directives and remove_comment(text).strip()):
+        pieces.append(('source', '\n' * source_code[:start].count('\n') + text))
+
+def has_code(text):
+    return bool(_directive.sub('', remove_comment(text)).strip())
+
+def parse_source(text, parse, preprocessor):
+    # A piece with nothing but directives is not parsed, but its directives
+    # are applied by the preprocessor
+    if preprocessor is not None and not has_code(text):
+        preprocessor.apply(text)
+        return []
+    return parse(text) or []
+
+def parse_header(path, parser, parse, cache_dir, preprocessor=None):
+    """
+    Parse the header at path, using the cache entry for its content if there
+    is one. Returns its pieces, with source pieces replaced by their ASTs.
+    """
+    with open(path) as f:
+        content = f.read()
+    key = hashlib.sha1(grammar_fingerprint(parser) + content).hexdigest()
+    cache_file = os.path.join(cache_dir, key + '.pickle') if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass                # Unreadable entry, parse the header again
+
+    pieces = []
+    for kind, value in split_includes(content, preprocessor is not None):
+        if kind == 'source':
+            value = parse_source(value, parse, preprocessor)
+        pieces.append((kind, value))
+    if cache_file:
+        try:
+            cache.makedirs(cache_dir)
+            with cache.replacing(cache_file, 'wb') as f:
+                pickle.dump(pieces, f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError):
+            pass                # Unwritable cache, the header is parsed every time
+    return pieces
+
+def parse_includes(source_code, parser, parse=None, directory='.', cache_dir=CACHE_DIR, header_parse=None,
+                   preprocessor=None):
+    """
+    Parse source_code into a list of declarations, with each #include "file"
+    replaced by the declarations of the file, looked up relative to
+    directory. parse (by default parser.parse) is called on the source text
+    between includes, and header_parse (by default parse) on the text of
+    headers. Headers are parsed once per content and grammar and their ASTs
+    kept in cache_dir; a cache_dir of None disables the cache. The cache is
+    shared by all callers, so header_parse should return node objects.
+
+    preprocessor is the macros.Preprocessor that parse and header_parse lex
+    with, if any. It is the same for all pieces, so that macros defined
+    before an #include are expanded in and after it, and the pieces with
+    nothing but directives are passed to it. The ASTs of headers then depend
+    on the macros defined before them, and the directives of a header have
+    to be applied on each use, so the cache is not used.
+    """
+    parse = parse or parser.parse
+    header_parse = header_parse or parse
+    if preprocessor is not None:
+        cache_dir = None
+    pieces = split_includes(source_code, preprocessor is not None)
+    if pieces == [('source', source_code)]:
+        return parse(source_code) or []
+    ast = []
+    for kind, value in pieces:
+        if kind == 'source':
+            ast.extend(parse_source(value, parse, preprocessor))
+        else:
+            ast.extend(include(os.path.join(directory, value), parser, header_parse, cache_dir, (),
+                               preprocessor))
+    return ast
+
+def include(path, parser, parse, cache_dir, active, preprocessor=None):
+    path = os.path.normpath(path)
+    if path in active:
+        raise ValueError('Recursive #include of %s' % path)
+    ast = []
+    for kind, value in parse_header(path, parser, parse, cache_dir, preprocessor):
+        if kind == 'source':
+            ast.extend(value)
+        else:
+            ast.extend(include(os.path.join(os.path.dirname(path), value),
+                               parser, parse, cache_dir, active + (path,), preprocessor))
+    return ast
+
+_comment = re.compile(r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'', re.DOTALL | re.MULTILINE)
 
 def remove_comment(source_code):
     """
     Remove C-sytle comments.
     """
-    pattern = re.compile(r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'', re.DOTALL | re.MULTILINE)
-
-    return re.sub(pattern, '', source_code)
+    return _comment.sub('', source_code)
 
 def remove_blank(source_code):
     lines = source_code.split('\n')
     return '\n'.join(filter(lambda l: l, [l.strip() for l in lines]))
 
+class SourceMap(object):
+    """
+    Maps offsets in the text made by strip_source() back to the source it
+    was made from. The text is a sequence of runs copied from the source,
+    joined by newlines; for each run the table holds its offset in the text,
+    its offset in the source and its length. A newline that joins two runs
+    maps to the end of the run before it.
+
+    lineno(), column() and position() take offsets in the text and return
+    source line and column numbers, like ply.lex.LineIndex, so a SourceMap
+    can stand in for the line index of a lexer on the text.
+    """
+    def __init__(self, source_code):
+        self.source_code = source_code
+        self.starts = array('l')
+        self.origins = array('l')
+        self.lengths = array('l')
+        self.index = None
+
+    def add(self, start, origin, length):
+        if self.starts:
+            end = self.starts[-1] + self.lengths[-1]
+            if start == end and origin == self.origins[-1] + self.lengths[-1]:
+                self.lengths[-1] += length
+                return
+        self.starts.append(start)
+        self.origins.append(origin)
+        self.lengths.append(length)
+
+    def offset(self, pos):
+        i = bisect_right(self.starts, pos) - 1
+        if i < 0:
+            return pos
+        return self.origins[i] + min(pos - self.starts[i], self.lengths[i])
+
+    def lineindex(self):
+        if self.index is None:
+            self.index = LineIndex(self.source_code)
+        return self.index
+
+    def lineno(self, pos):
+        return self.lineindex().lineno(self.offset(pos))
+
+    def column(self, pos):
+        return self.lineindex().column(self.offset(pos))
+
+    def position(self, pos):
+        return self.lineindex().position(self.offset(pos))
+
+def strip_source(source_code):
+    """
+    Remove comments and blank lines like remove_blank(remove_comment()).
+    Returns the text and a SourceMap from it back to source_code.
+    """
+    # The text without comments, with the offsets in source_code of its pieces
+    pieces, starts, origins = [], [], []
+    pos = length = 0
+    for m in _comment.finditer(source_code):
+        pieces.append(source_code[pos:m.start()])
+        starts.append(length)
+        origins.append(pos)
+        length += m.start() - pos
+        pos = m.end()
+    pieces.append(source_code[pos:])
+    starts.append(length)
+    origins.append(pos)
+    text = ''.join(pieces)
+
+    smap = SourceMap(source_code)
+    lines = []
+    out = 0
+    pos = 0
+    for line in text.split('\n'):
+        begin = pos + len(line) - len(line.lstrip())
+        end = pos + len(line.rstrip())
+        pos += len(line) + 1
+        if begin >= end:
+            continue
+        if lines:
+            out += 1
+        lines.append(text[begin:end])
+        # Split the line where comments were removed from it
+        i = bisect_right(starts, begin) - 1
+        while begin < end:
+            stop = min(end, starts[i + 1]) if i + 1 < len(starts) else end
+            if stop > begin:
+                smap.add(out, origins[i] + begin - starts[i], stop - begin)
+                out += stop - begin
+            begin = stop
+            i += 1
+    return '\n'.join(lines), smap
+
+def input_stripped(lexer, source_code):
+    """
+    Give lexer source_code with comments and blank lines removed. Positions
+    looked up through lexer.lineindex() are those of source_code.
+    """
+    text, smap = strip_source(source_code)
+    lexer.input(text)
+    lexer.lexlineindex = smap
+    return text
+
 if __name__ == '__main__':
     s = sys.stdin.read()
     print remove_blank(remove_comment(s))
@@ -0,0 +1,41 @@
+import os
+
+from hw03 import clex
+from hw03 import incremental
+from hw03.cparse import parser
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests')
+
+def tokenize(src):
+    return clex.lexer.clone().tokenize_all(src)
+
+def test_declaration_spans():
+    src = 'int x, y;\nint f(int a) { if (a) { x = 1; } return a; }\nextern int g(int b);\nint z'
+    tokens = tokenize(src)
+    spans = incremental.declaration_spans(tokens)
+    assert [src[tokens.starts[s]:tokens.starts[e - 1] + tokens.lengths[e - 1]] for s, e in spans] == \
+        ['int x, y;', 'int f(int a) { if (a) { x = 1; } return a; }', 'extern int g(int b);', 'int z']
+
+def test_incremental_parse(tmpdir):
+    reparser = incremental.IncrementalParser(str(tmpdir.join('asts.pickle')))
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src = f.read()
+        assert reparser.parse(tokenize(src)) == parser.parse(tokenize(src))
+    reparser.save()
+
+    # Only the edited function is parsed, with the other ASTs from the cache
+    with open(os.path.join(SAMPLE_DIR, 'functions.c')) as f:
+        src = f.read().replace('return', 'return 1 +', 1)
+    reparser = incremental.IncrementalParser(reparser.cache_file)
+    reparser.load()
+    assert reparser.parse(tokenize(src)) == parser.parse(tokenize(src))
+    assert reparser.parsed == 1 and reparser.reused > 1
+
+def test_syntax_errors_not_cached(capsys):
+    reparser = incremental.IncrementalParser()
+    src = 'int f() { int x; x = ; return x; }\nint g() { return 1; }'
+    for i in range(2):
+        reparser.parse(tokenize(src))
+        assert 'Syntax error' in capsys.readouterr()[0]
+    assert reparser.parsed == 3 and reparser.reused == 1
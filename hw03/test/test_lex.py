@@ -0,0 +1,169 @@
+import mmap
+import os
+import pickle
+import pytest
+import random
+
+from hw03 import clex
+from hw03.ply.lex import TokenList
+from hw03.preprocess import remove_blank, remove_comment
+
+TEST_DIR = os.path.dirname(__file__)
+
+SAMPLE_DIR = os.path.join(TEST_DIR, '..', 'tests')
+
+def lex_all(lexer, src):
+    lexer.input(src)
+    return [(t.type, t.value, t.lineno, t.lexpos) for t in lexer]
+
+def test_dfa_matches_regex_lexer():
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src = f.read()
+        assert lex_all(clex.lexer.clone(), src) == lex_all(clex.dfa_lexer(), src)
+
+def test_dfa_non_greedy_rules():
+    src = 'x = "a\\"b" /* c */ + "" /* d */ <<= 1.5e3;'
+    assert [t[:2] for t in lex_all(clex.dfa_lexer(), src)] == \
+           [('ID', 'x'), ('EQUALS', '='), ('SCONST', '"a\\"b"'), ('PLUS', '+'),
+            ('SCONST', '""'), ('LSHIFT', '<<'), ('EQUALS', '='), ('FCONST', '1.5e3'),
+            ('SEMI', ';')]
+
+def test_tokenize_all_matches_token_stream():
+    with open(os.path.join(SAMPLE_DIR, 'string.c')) as f:
+        src = f.read()
+    lexer = clex.lexer.clone()
+    lexer.lineno = 1
+    tokens = lexer.tokenize_all(src)
+    lexer = clex.lexer.clone()
+    lexer.lineno = 1
+    assert [(t.type, t.value, t.lineno, t.lexpos) for t in tokens] == lex_all(lexer, src)
+
+def test_lex_mmap_input(tmpdir):
+    with open(os.path.join(SAMPLE_DIR, 'string.c')) as f:
+        src = f.read()
+    path = tmpdir.join('string.c')
+    path.write(src)
+    with path.open() as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for make_lexer in [clex.lexer.clone, clex.dfa_lexer]:
+            assert lex_all(make_lexer(), buf) == lex_all(make_lexer(), src)
+        lexer = clex.lexer.clone()
+        lexer.lineno = 1
+        tokens = [(t.type, t.value, t.lineno, t.lexpos) for t in lexer.tokenize_all(buf)]
+        lexer = clex.lexer.clone()
+        lexer.lineno = 1
+        assert tokens == lex_all(lexer, src)
+        buf.close()
+
+def test_relex_matches_full_lex():
+    with open(os.path.join(SAMPLE_DIR, 'loops.c')) as f:
+        src = f.read()
+    edits = [(0, 0, 'int x;\n'), (src.index('for'), src.index('for') + 3, 'while'),
+             (src.index('{'), src.index('{') + 1, '{ /* {{ */\n\n'),
+             (src.index(';'), src.index(';'), ' y = 2'), (len(src), len(src), '\nint z;'),
+             (src.index('='), src.index('=') + 1, '==')]
+    for start, end, text in edits:
+        lexer = clex.lexer.clone()
+        lexer.lineno = 1
+        lexer.input(src)
+        tokens = TokenList(lexer)
+        new_src = src[:start] + text + src[end:]
+        lexer.lineno = 1
+        first, last = lexer.relex(tokens, new_src, start, end, start + len(text))
+        # The line of the edit is relexed, up to a few tokens after the edit
+        line = new_src.rfind('\n', 0, start) + 1
+        assert first == 0 or tokens[first - 1].lexpos < line <= tokens[first + 1].lexpos
+        assert last - first <= 10
+        lexer = clex.lexer.clone()
+        lexer.lineno = 1
+        assert [(t.type, t.value, t.lineno, t.lexpos) for t in tokens] == lex_all(lexer, new_src)
+
+def test_relex_random_edits(capsys):
+    # Edits that open or close comments, strings, character literals and
+    # directives before them, applied one after the other to the same tokens
+    with open(os.path.join(SAMPLE_DIR, 'loops.c')) as f:
+        src = 'int a; /* note\nint b;\n' + f.read()
+    pieces = ['/*', '*/', '"', "'", '#', '//', '\n', ' ', 'x', ';', '1', '=', '{', '}', '\\']
+    rnd = random.Random(0)
+    lexer = clex.lexer.clone()
+    lexer.input(src)
+    tokens = TokenList(lexer)
+    for i in range(1500):
+        start = rnd.randint(0, len(src))
+        end = min(start + rnd.choice([0, 0, 1, 3]), len(src))
+        text = ''.join(rnd.choice(pieces) for j in range(rnd.choice([0, 1, 1, 2])))
+        src = src[:start] + text + src[end:]
+        lexer.lineno = 1
+        lexer.relex(tokens, src, start, end, start + len(text))
+        if i % 10 == 0 or i == 1499:
+            assert [(t.type, t.value, t.lexpos) for t in tokens] == \
+                   [t[:2] + t[3:] for t in lex_all(clex.lexer.clone(), src)]
+    capsys.readouterr()
+
+def test_relex_closing_comment():
+    src = 'int a; /* note\nint b;\n'
+    lexer = clex.lexer.clone()
+    lexer.input(src)
+    tokens = TokenList(lexer)
+    assert [t.type for t in tokens][3:6] == ['DIVIDE', 'TIMES', 'ID']
+    pos = src.index('\n')
+    lexer.relex(tokens, src[:pos] + ' */' + src[pos:], pos, pos, pos + 3)
+    assert [t.value for t in tokens] == ['int', 'a', ';', 'int', 'b', ';']
+
+def test_identifiers_interned():
+    lexer = clex.lexer.clone()
+    lexer.input('int foo; foo = bar + foo;')
+    ids = [t.value for t in lexer if t.type == 'ID']
+    assert ids == ['foo', 'foo', 'bar', 'foo']
+    assert ids[0] is ids[1] is ids[3] and ids[0] is not ids[2]
+    assert clex.names[ids[2].id] is ids[2]
+    assert pickle.loads(pickle.dumps(ids[0], 2)) is ids[0]
+    tokens = clex.lexer.clone().tokenize_all('foo = bar;')
+    assert tokens.value(0) is ids[0] and tokens.value(2) is ids[2]
+
+def test_dfa_stream_matches_whole_input():
+    for name in ['loops.c', 'string.c', 'toto.c']:
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src = f.read()
+        lexer = clex.dfa_lexer()
+        lexer.lineno = 1
+        expected = lex_all(lexer, src)
+        for size in [1, 3, 64]:
+            chunks = [src[i:i+size] for i in range(0, len(src), size)]
+            lexer = clex.dfa_lexer()
+            lexer.lineno = 1
+            assert [(t.type, t.value, t.lineno, t.lexpos) for t in lexer.stream(chunks)] == expected
+
+def test_tokenize_file(tmpdir):
+    path = tmpdir.join('a.c')
+    path.write('x <= 1; /* a\nb */ s = "a b";\n')
+    with path.open() as f:
+        assert [t.value for t in clex.tokenize_file(f, blocksize=3)] == \
+               ['x', '<=', '1', ';', 's', '=', '"a b"', ';']
+
+def test_line_index_positions():
+    with open(os.path.join(SAMPLE_DIR, 'toto.c')) as f:
+        src = f.read()
+    lexer = clex.lexer.clone()
+    lexer.input(src)
+    index = lexer.lineindex()
+    for t in lexer:
+        line = src.count('\n', 0, t.lexpos) + 1
+        column = t.lexpos - (src.rfind('\n', 0, t.lexpos) + 1) + 1
+        assert index.position(t.lexpos) == (line, column)
+        assert index.lineno(t.lexpos) == line and index.column(t.lexpos) == column
+
+def test_lexer_skips_what_preprocess_removes():
+    extra = "x = 1; // a /* b \" c\n/* d // e */ y = 'z' + '\\'';\n"
+    for name in sorted(os.listdir(SAMPLE_DIR)) + [None]:
+        if name:
+            with open(os.path.join(SAMPLE_DIR, name)) as f:
+                src = f.read()
+        else:
+            src = extra
+        stripped = remove_blank(remove_comment(src))
+        assert [t[:2] for t in lex_all(clex.lexer.clone(), src)] == \
+               [t[:2] for t in lex_all(clex.lexer.clone(), stripped)]
+        assert [t[:2] for t in lex_all(clex.dfa_lexer(), src)] == \
+               [t[:2] for t in lex_all(clex.lexer.clone(), stripped)]
@@ -0,0 +1,58 @@
+import pytest
+
+from hw03 import clex
+from hw03 import macros
+from hw03.cparse import parser
+from hw03.preprocess import parse_includes
+
+def expand(src):
+    pp = macros.Preprocessor(clex.lexer.clone())
+    pp.input(src)
+    return ' '.join(t.value for t in iter(pp.token, None)), pp
+
+def test_object_and_function_macros():
+    src = ('#define N 10\n#define SQ(x) ((x)*(x))\n#define F(a,b) SQ(a) + b\n'
+           'y = F(N, SQ(y)) + N;\n#undef N\nz = N;\n')
+    assert expand(src)[0] == \
+        'y = ( ( 10 ) * ( 10 ) ) + ( ( y ) * ( y ) ) + 10 ; z = N ;'
+
+def test_recursive_and_uninvoked_macros():
+    src = '#define R R + 1\n#define f(x) f(x + 1)\nx = R + f(2) + f;\n'
+    assert expand(src)[0] == 'x = R + 1 + f ( 2 + 1 ) + f ;'
+
+def test_expansions_are_cached():
+    src = '#define SQ(x) ((x)*(x))\n' + 'y = SQ(SQ(y));\n' * 100
+    out, pp = expand(src)
+    assert out == 'y = ( ( ( ( y ) * ( y ) ) ) * ( ( ( y ) * ( y ) ) ) ) ;' * 1 + \
+        ' y = ( ( ( ( y ) * ( y ) ) ) * ( ( ( y ) * ( y ) ) ) ) ;' * 99
+    assert len(pp.cache) == 2
+
+def test_parse_with_macros():
+    src = ('#define cat(x,y) x+y\nint main() {\n  string s;\n'
+           '  printf(cat(s,"a"));\n  printf(cat(cat(s,s),s));\n}\n')
+    expected = 'int main() {\n  string s;\n  printf(s+"a");\n  printf(s+s+s);\n}\n'
+    ast = parser.parse(src, lexer=macros.Preprocessor(clex.lexer.clone()))
+    assert ast == parser.parse(expected, lexer=clex.lexer.clone())
+
+def test_macros_across_includes(tmpdir):
+    # Definitions carry across #include lines and into headers, and headers
+    # parsed with macros are not cached
+    tmpdir.join('n.h').write('#define M N + 2\nint f() { return M; }\n')
+    src = '#define N 5\n#include "n.h"\nint g() { return M; }\n'
+    pp = macros.Preprocessor(clex.lexer.clone())
+    parse = lambda text: parser.parse(text, lexer=pp)
+    cache = tmpdir.join('cache')
+    ast = parse_includes(src, parser, parse, str(tmpdir), str(cache), preprocessor=pp)
+    expected = parser.parse('int f() { return 5 + 2; }\nint g() { return 5 + 2; }\n', lexer=clex.lexer.clone())
+    assert ast == expected
+    assert not cache.check()
+
+def test_continued_directives():
+    src = '#define SUM(a, b) \\\n    ((a) + \\\n     (b))\nx = SUM(1, 2);\n#define N \\\n5\ny = N;\n'
+    assert expand(src)[0] == 'x = ( ( 1 ) + ( 2 ) ) ; y = 5 ;'
+    # Without the preprocessor, the whole directive is skipped, by both lexers
+    types = [t.type for t in clex.lexer.clone().tokenize_all(src)]
+    assert types[:2] == ['ID', 'EQUALS']
+    lexer = clex.dfa_lexer()
+    lexer.input(src)
+    assert [t.type for t in iter(lexer.token, None)] == types
@@ -0,0 +1,49 @@
+import os
+import pytest
+
+from hw03 import clex
+from hw03 import parallel
+from hw03.cparse import parser
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests')
+
+def lex_all(src):
+    lexer = clex.lexer.clone()
+    lexer.lineno = 1
+    lexer.input(src)
+    return [(t.type, t.value, t.lineno, t.lexpos) for t in lexer]
+
+def test_split_points_skip_comments_and_strings():
+    src = 'int x;\n/* a\nb\nc */\ns = "/* x";\n#define A\nint y;\n'
+    points = parallel.split_points(src, len(src))
+    assert points == [src.index('/*'), src.index('s ='), src.index('#'), src.index('int y')]
+
+def test_parallel_tokenize_matches_lexer():
+    src = ''
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src += f.read() + '/* spans\nlines */ "a /* b"\n\'\n\' // "\n'
+    for processes in [1, 2, 5]:
+        tokens = parallel.tokenize(src, processes=processes, min_piece=256)
+        assert [(t.type, t.value, t.lineno, t.lexpos) for t in tokens] == lex_all(src)
+
+def test_declaration_points_skip_nested_braces_and_strings():
+    src = 'int f() { if (x) { y; } s = "}"; /* } */ }\nint x;\nint g() { }\n'
+    assert parallel.declaration_points(src, 3) == [src.index('\nint x'), src.index('\n', src.index('int g'))]
+
+def test_parallel_parse_matches_parser(capsys):
+    src = ''
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src += f.read()
+    expected = parser.parse(clex.lexer.clone().tokenize_all(src))
+    for processes in [1, 2, 5]:
+        assert parallel.parse(src, processes=processes, min_piece=256) == expected
+
+    # A syntax error in a piece is reported as by a serial parse
+    src = src.replace('return', 'return return', 1)
+    expected = parser.parse(clex.lexer.clone().tokenize_all(src))
+    out = capsys.readouterr()[0]
+    assert 'Syntax error' in out
+    assert parallel.parse(src, processes=5, min_piece=256) == expected
+    assert capsys.readouterr()[0] == out
@@ -0,0 +1,219 @@
+import os
+import json
+import pickle
+import pytest
+import subprocess
+import sys
+
+from hw03 import clex
+from hw03 import nodes
+from hw03.ply import cache
+from hw03.ply import yacc
+from hw03.nodes import to_tuples
+from hw03 import cparse
+from hw03.cparse import parse_flat, parser
+
+TEST_DIR = os.path.dirname(__file__)
+
+SAMPLE_DIR = os.path.join(TEST_DIR, '..', 'tests')
+
+def test_parse_token_arrays():
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src = f.read()
+        tokens = clex.lexer.clone().tokenize_all(src)
+        assert parser.parse(tokens) == parser.parse(src, lexer=clex.lexer.clone())
+
+def test_parse_token_arrays_syntax_error():
+    src = 'int main() { int x; x = ; x = 2; }'
+    tokens = clex.lexer.clone().tokenize_all(src)
+    assert parser.parse(tokens) == parser.parse(src, lexer=clex.lexer.clone())
+
+def test_syntax_error_position(capsys):
+    src = 'int main() {\n  return 1 +;\n}\n'
+    parser.parse(src, lexer=clex.lexer.clone())
+    out = capsys.readouterr()[0]
+    assert 'Syntax error at line 2, column 13' in out
+
+def test_ast_nodes():
+    src = 'int main() {\n  printd(1 + x);\n  return 0;\n}\n'
+    ast = parser.parse(src, lexer=clex.lexer.clone())
+    assert to_tuples(ast) == [
+        ('FUNC_DEF', ('TYPE', 'int'), (('ID', 'main'), None),
+         ('COMP_STATS', [('STAT', ('FUNC_CALL', ('ID', 'printd'), [('ADD', ('ICONST', '1'), ('ID', 'x'))])),
+                         ('STAT', ('RET', ('ICONST', '0')))]))]
+    call = ast[0].body.items[0].instruction
+    assert call.kind == nodes.FUNC_CALL and call.func.name == 'printd'
+    assert pickle.loads(pickle.dumps(ast, 2)) == ast
+    assert call != nodes.FuncCall(call.func, [])
+
+def test_parse_flat():
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src = f.read()
+        tree = parse_flat(src, lexer=clex.lexer.clone())
+        expected = parser.parse(src, lexer=clex.lexer.clone())
+        assert tree.tree() == expected
+        decls = tree.declarations()
+        assert [d.kind for d in decls] == [d.kind for d in expected]
+    main = decls[-1]
+    assert main.declarator.name.name == expected[-1].declarator.name.name == 'main'
+    assert len(main.body.items) == len(expected[-1].body.items)
+
+def test_packed_tables():
+    packed = parser.packed_tables()
+    for state, row in parser.action.items():
+        for sym in packed.terminals + ['UNKNOWN']:
+            assert packed.action(state, sym) == row.get(sym)
+    for state in parser.action:
+        row = parser.goto.get(state, {})
+        for sym in packed.nonterminals:
+            assert packed.goto(state, sym) == row.get(sym)
+
+def test_generated_parser(capsys):
+    assert parser.generated is not None
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        with open(os.path.join(SAMPLE_DIR, name)) as f:
+            src = f.read()
+        assert parser.parse(src, lexer=clex.lexer.clone()) == \
+            parser.parseopt_notrack(src, lexer=clex.lexer.clone())
+
+    # Syntax errors are reported and recovered from by parseopt_notrack()
+    src = 'int main() { int x; x = ; x = 2; }'
+    result = parser.parse(src, lexer=clex.lexer.clone())
+    out = capsys.readouterr()[0]
+    assert result == parser.parseopt_notrack(src, lexer=clex.lexer.clone())
+    assert out == capsys.readouterr()[0]
+
+def test_table_cache(tmpdir):
+    # Processes started together build the tables once and share them
+    env = dict(os.environ, PLY_CACHE_DIR=str(tmpdir))
+    script = 'from hw03 import cparse; print cparse.parser.generated.__name__'
+    def start():
+        return subprocess.Popen([sys.executable, '-c', script], cwd=os.path.join(TEST_DIR, '..'),
+                                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    outputs = [p.communicate() for p in [start() for i in range(4)]]
+    assert sum('Generating LALR tables' in err for out, err in outputs) == 1
+    assert len(set(out for out, err in outputs)) == 1
+    tables = sorted(f for f in tmpdir.listdir() if f.ext in ('.pickle', '.py') and '.tmp' not in f.basename)
+    assert [f.basename.split('_')[0].split('-')[0] for f in tables] == ['lextab', 'parsegen', 'parsetab']
+    assert not [f for f in tmpdir.listdir() if f.ext == '.lock']
+
+    # Later processes read them
+    mtimes = [f.mtime() for f in tables]
+    assert start().communicate() == (outputs[0][0], '')
+    assert [f.mtime() for f in tables] == mtimes
+
+def test_table_cache_lock_released(tmpdir, monkeypatch):
+    # A failed build leaves the tables unlocked for the next process
+    def pickle_table(*args):
+        raise RuntimeError('disk on fire')
+    monkeypatch.setattr(yacc.LRGeneratedTable, 'pickle_table', pickle_table)
+    with pytest.raises(RuntimeError):
+        yacc.yacc(module=cparse, cachedir=str(tmpdir), errorlog=yacc.NullLogger())
+    assert [f.basename.split('-')[0] for f in tmpdir.listdir()] == ['parser']
+    assert cache.key(u'grammar', 'LALR') == cache.key('grammar', u'LALR')
+
+def test_lazy_parser(tmpdir):
+    # Importing the compiler loads no tables; the first use of the parser does
+    script = ('import sys; from hw03 import cparse, gen_asm; print cparse._parser, "inspect" in sys.modules;'
+              'cparse.parser.parse("int x;"); print cparse._parser is cparse.get_parser()')
+    env = dict(os.environ, PLY_CACHE_DIR=str(tmpdir))
+    out = subprocess.check_output([sys.executable, '-c', script], cwd=os.path.join(TEST_DIR, '..'),
+                                  env=env, stderr=open(os.devnull, 'w'))
+    assert out == 'None False\nTrue\n'
+
+def test_error_recovery():
+    # Errors are skipped to the next SEMI or RBRACE and the parse goes on
+    src = 'int f() {\n  int x;\n  x = = 1;\n  return x }\nint (;\nint g() { return 2; }\n'
+    with cparse.collect_errors() as errors:
+        ast = parser.parse(clex.lexer.clone().tokenize_all(src))
+    assert [(e.line, e.column, e.type, e.value) for e in errors] == \
+        [(3, 7, 'EQUALS', '='), (4, 12, 'RBRACE', '}'), (5, 5, 'LPAREN', '(')]
+    assert str(errors[0]) == "Syntax error at line 3, column 7, token EQUALS '='"
+    assert [d.declarator.name.name for d in ast] == ['f', 'g']
+    assert to_tuples(ast[0].body) == ('COMP_STATS', [('VAR_DEC', ('TYPE', 'int'), [('ID', 'x')]),
+                                                     ('STAT', ('COMP_STATS', []))])
+
+def test_error_budget():
+    src = 'int main() {\n' + '  x = = 1;\n' * 10000 + '}\n'
+    with cparse.collect_errors(5) as errors:
+        with pytest.raises(cparse.TooManyErrors) as e:
+            parser.parse(src, lexer=clex.lexer.clone())
+    assert e.value.diagnostics is errors
+    assert [err.line for err in errors] == [2, 3, 4, 5, 6]
+
+    # gen_asm reports them and fails
+    p = subprocess.Popen([sys.executable, '-m', 'hw03.gen_asm', '--max-errors', '3'], cwd=os.path.join(TEST_DIR, '..'),
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate(src)
+    assert p.returncode == 1 and out == ''
+    assert err.splitlines()[-2:] == ["Syntax error at line 4, column 7, token EQUALS '='", '3 syntax errors, giving up']
+
+def test_parse_profile(tmpdir):
+    src = 'int main() {\n  int x;\n  x = 1 + 2 * x;\n  return x;\n}\n'
+    profile = yacc.ParseProfile(parser)
+    tokens = clex.lexer.clone().tokenize_all(src)
+    assert parser.parse(tokens, profile=profile) == parser.parse(tokens)
+    assert parser.parse(src, lexer=clex.lexer.clone(), profile=profile) == parser.parse(tokens)
+    report = profile.report()
+    assert report['parses'] == 2 and report['tokens'] == 2 * len(tokens)
+    counts = dict((p['rule'], p['reductions']) for p in report['productions'])
+    assert counts['primary_expression -> ID'] == 6
+    assert counts['postfix_expression -> primary_expression'] == 10
+    assert counts['function_definition -> type function_declarator compound_instruction'] == 2
+    assert sum(counts.values()) == report['reductions']
+    assert report['states'][0]['actions'] >= report['states'][-1]['actions'] > 0
+
+    with tmpdir.join('profile.json').open('w') as f:
+        profile.dump(f)
+    assert json.loads(tmpdir.join('profile.json').read()) == json.loads(json.dumps(report))
+
+def test_symbol_positions(monkeypatch):
+    # The rules see the positions of their terminals on every path, and none
+    # for nonterminals, also after recovering from a syntax error
+    calls = [p for p in parser.productions if p.str == 'postfix_expression -> postfix_expression LPAREN argument_expression_list RPAREN'][0]
+    seen = []
+    def p_call(t):
+        with pytest.raises(ValueError):
+            t.position(1)
+        seen.append((t.position(2), t.position(4), t.lexpos(2), t.lexpos(1)))
+        t[0] = nodes.FuncCall(t[1], t[3])
+    monkeypatch.setattr(calls, 'callable', p_call)
+
+    call = 'int main() {\n  f(x,\n    y);\n}\n'
+    error = 'int f() {\n  x = = 1;\n}\n'
+    for src, expected in [(call, [((2, 4), (3, 6), 16, 0)]),
+                          (error + call, [((5, 4), (6, 6), 39, 0)])]:
+        for parse in [lambda: parser.parse(src, lexer=clex.lexer.clone()),
+                      lambda: parser.parse(clex.lexer.clone().tokenize_all(src)),
+                      lambda: parser.parse(src, lexer=clex.lexer.clone(), profile=yacc.ParseProfile(parser)),
+                      lambda: parser.parseopt_notrack(src, lexer=clex.lexer.clone())]:
+            del seen[:]
+            with cparse.collect_errors():
+                parse()
+            assert seen == expected
+
+def test_resume_after_syntax_error(monkeypatch):
+    # The fast paths hand their stacks to parseopt_notrack() at the first
+    # error, which recovers as if it had parsed the input from the start
+    src = 'int f() {\n  int x;\n  x = = 1;\n  return x }\nint (;\nint g() { return 2; }\n'
+    def parses():
+        yield lambda: parser.parse(src, lexer=clex.lexer.clone())
+        yield lambda: parser.parse(clex.lexer.clone().tokenize_all(src))
+        yield lambda: parser.parse(src, lexer=clex.lexer.clone(), profile=yacc.ParseProfile(parser))
+    def check():
+        with cparse.collect_errors() as expected_errors:
+            expected = parser.parseopt_notrack(src, lexer=clex.lexer.clone())
+        for parse in parses():
+            with cparse.collect_errors() as errors:
+                assert parse() == expected
+            assert [str(e) for e in errors] == [str(e) for e in expected_errors]
+    check()
+
+    # A grammar rule raising SyntaxError is called again by parseopt_notrack()
+    rule = [p for p in parser.productions if p.str == 'jump_instruction -> RETURN expression SEMI'][0]
+    def p_return(t):
+        raise SyntaxError
+    monkeypatch.setattr(rule, 'callable', p_return)
+    check()
@@ -0,0 +1,73 @@
+import pytest
+
+from hw03 import clex
+from hw03 import nodes
+from hw03.arena import ArenaNode
+from hw03.cparse import parse_flat, parser
+from hw03.preprocess import input_stripped, parse_includes, remove_blank, remove_comment, split_includes, strip_source
+
+HEADER = 'extern int printd( int i );\nextern int printf( string s );\n'
+
+MAIN = '#include "decls.h"\n// main\nint main() {\n  printd(1);\n  return 0;\n}\n'
+
+def counting_parse(calls):
+    def parse(text):
+        calls.append(text)
+        return parser.parse(text, lexer=clex.lexer.clone())
+    return parse
+
+def test_split_includes_keeps_line_numbers():
+    src = 'int x;\n#include "a.h"\n/* c */\n  #include "b.h" // d\nint y;\n'
+    assert split_includes(src) == [('source', 'int x;\n'), ('include', 'a.h'),
+                                   ('include', 'b.h'), ('source', '\n' * 4 + 'int y;\n')]
+
+def test_include_uses_header_cache(tmpdir):
+    tmpdir.join('decls.h').write(HEADER)
+    cache = tmpdir.join('cache')
+    expected = parser.parse(HEADER + MAIN, lexer=clex.lexer.clone())
+    calls = []
+    for i in range(3):
+        ast = parse_includes(MAIN, parser, counting_parse(calls), str(tmpdir), str(cache))
+        assert ast == expected
+    # The header is parsed once, the main file every time
+    assert len(calls) == 4
+    assert len(cache.listdir()) == 1
+
+    # A cache directory that cannot be created is not used
+    tmpdir.join('file').write('')
+    ast = parse_includes(MAIN, parser, counting_parse(calls), str(tmpdir), str(tmpdir.join('file', 'cache')))
+    assert ast == expected and len(calls) == 6
+
+def test_flat_headers_are_cached_as_nodes(tmpdir):
+    tmpdir.join('decls.h').write(HEADER)
+    cache = str(tmpdir.join('cache'))
+    parse = lambda text: parse_flat(text, lexer=clex.lexer.clone()).declarations()
+    header_parse = lambda text: [d.arena.tree(d.index) for d in parse(text)]
+    flat = parse_includes(MAIN, parser, parse, str(tmpdir), cache, header_parse)
+    assert [type(d) for d in flat] == [nodes.Extern, nodes.Extern, ArenaNode]
+    assert parse_includes(MAIN, parser, directory=str(tmpdir), cache_dir=cache) == \
+        parser.parse(HEADER + MAIN, lexer=clex.lexer.clone())
+
+def test_nested_and_recursive_includes(tmpdir):
+    tmpdir.mkdir('sys').join('io.h').write(HEADER)
+    tmpdir.join('decls.h').write('#include "sys/io.h"\nint counter;\n')
+    ast = parse_includes(MAIN, parser, directory=str(tmpdir), cache_dir=None)
+    assert ast == parser.parse(HEADER + 'int counter;\n' + MAIN, lexer=clex.lexer.clone())
+
+    tmpdir.join('decls.h').write('#include "decls.h"\n')
+    with pytest.raises(ValueError):
+        parse_includes(MAIN, parser, directory=str(tmpdir), cache_dir=None)
+
+def test_source_map_gives_original_positions(capsys):
+    src = '/* header\n   comment */\n\nint main() {\n  // none\n  x = 1 /* a */ +;\n}\n'
+    text, smap = strip_source(src)
+    assert text == remove_blank(remove_comment(src))
+    for pos in range(len(text)):
+        if text[pos] != '\n':
+            assert src[smap.offset(pos)] == text[pos]
+    assert smap.position(text.index('main')) == (4, 5)
+
+    lexer = clex.lexer.clone()
+    input_stripped(lexer, src)
+    parser.parse(lexer=lexer)
+    assert 'Syntax error at line 6, column 18' in capsys.readouterr()[0]